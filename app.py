@@ -1,18 +1,27 @@
 import streamlit as st
-from supabase import create_client, ClientOptions
 import pandas as pd
 from datetime import datetime
 import time
 import urllib.parse
-from io import BytesIO
-
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas as pdf_canvas
-from reportlab.lib.units import cm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import arabic_reshaper
-from bidi.algorithm import get_display
+from functools import partial
+
+from src.utils.db import init_supabase
+from src.utils.metrics import get_metrics
+from src.utils.inbox import fetch_inbox
+from src.utils.employee_cache import get_employee_cache
+from src.utils.change_feed import get_change_feed
+from src.utils.pdf_cache import get_pdf_cache
+from src.utils.pdf import register_fonts, generate_pdf, LEAVE_FORM_FIELDS
+from src.modules.approvals import render_bulk_actions
+from src.modules.analytics import render_analytics, ANALYTICS_ROLES
+from src.modules.diagnostics import render_diagnostics, DIAGNOSTICS_ROLES
+from src.modules.search import render_search, SEARCH_ROLES
+from src.modules.leave_calendar import check_leave, render_task_leave_context, render_leave_calendar, CALENDAR_ROLES
+from src.utils.history import HISTORY_PAGE_SIZE, fetch_my_requests_page, fetch_hr_history_page, fetch_request, page_of
+from src.utils.leave_rules import calculate_annual_leave_days, get_leave_balance, calculate_leave_allowance
+from src.utils.leave_ledger import post_leave_entry, fetch_balance, fetch_ledger, InsufficientLeaveBalance, LeaveAlreadyPosted
+from src.utils.audit_archive import request_history
+from src.utils.scoring import score_badge
 
 # ==============================
 # 1) إعدادات الصفحة و CSS
@@ -48,112 +57,53 @@ st.markdown("""
 # ==============================
 # 2) الاتصال بـ Supabase
 # ==============================
-@st.cache_resource
-def init_supabase():
-    try:
-        url = st.secrets["supabase"]["url"]
-        key = st.secrets["supabase"]["key"]
-        return create_client(url, key, options=ClientOptions(postgrest_client_timeout=60))
-    except Exception as e:
-        st.error(f"خطأ في الاتصال بقاعدة البيانات: {e}")
-        return None
-
 supabase = init_supabase()
+employees = get_employee_cache(supabase)
+feed = get_change_feed(supabase)
+TASKS_REFRESH_SECONDS = 5  # شارة المهام وصندوق المهام يقرآن العدادات من الذاكرة فقط
 
 # ==============================
 # 3) إعداد الخط العربي
 # ==============================
-font_path = "arial.ttf"
-try:
-    pdfmetrics.registerFont(TTFont('Arabic', font_path))
-except:
+if not register_fonts():
     st.warning("ملف الخط 'arial.ttf' غير موجود. يرجى رفعه لضمان ظهور العربية في PDF.")
 
-def reshape_text(text: str) -> str:
-    if not text: return ""
-    try:
-        return get_display(arabic_reshaper.reshape(str(text)))
-    except: return str(text)
-
 # ==============================
 # 4) دوال إدارة البيانات (كاملة)
 # ==============================
 def get_user_data(emp_id: str):
     if not supabase: return None
-    res = supabase.table("employees").select("*").eq("emp_id", emp_id).execute()
-    return res.data[0] if res.data else None
+    return employees.get(emp_id)
 
-def calculate_annual_leave_days(hire_date_str):
-    """تحديد هل الاستحقاق 21 أو 30 يوماً حسب سنوات الخدمة."""
-    if not hire_date_str: return 21
+def settle_leave(r: dict, days: float, settlement_date, actor: dict):
+    """خصم أيام الإجازة من الرصيد كقيد في سجل الرصيد (ذري في القاعدة). يعيد الرصيد الجديد أو None."""
+    if not supabase: return None
     try:
-        hire_date = datetime.strptime(str(hire_date_str)[:10], "%Y-%m-%d")
-        years = (datetime.now() - hire_date).days / 365.25
-        return 30 if years >= 5 else 21
-    except: return 21
-
-def get_leave_balance(emp: dict):
-    """قراءة الرصيد الحالي وتاريخ آخر احتساب"""
-    lb = emp.get("leave_balances") or {}
-    
-    annual_balance = lb.get("annual_balance")
-    if annual_balance is None:
-        # إذا لم يكن هناك رصيد مسجل، احسبه افتراضياً
-        annual_balance = calculate_annual_leave_days(emp.get("hire_date"))
-
-    last_settlement = lb.get("last_settlement_date") or emp.get("hire_date") or datetime.today().date().isoformat()
-    
-    return float(annual_balance), last_settlement
-
-def set_leave_balance(emp_id: str, new_balance: float, new_settlement_date):
-    """تحديث الرصيد في قاعدة البيانات"""
-    if not supabase: return
-    payload = {
-        "leave_balances": {
-            "annual_balance": float(new_balance),
-            "last_settlement_date": str(new_settlement_date)
-        }
-    }
-    supabase.table("employees").update(payload).eq("emp_id", emp_id).execute()
-
-def calculate_leave_allowance(salary: float, requested_days: float) -> float:
-    if not salary or salary <= 0: return 0.0
-    # الحساب: (الراتب / 30) * عدد أيام الإجازة
-    return round((float(salary) / 30.0) * float(requested_days), 2)
+        res = post_leave_entry(supabase, r['emp_id'], "settlement", -float(days), settlement_date, r['id'], actor,
+                               f"بدل إجازة طلب رقم {r['id']}")
+        return res.get("annual_balance")
+    except InsufficientLeaveBalance:
+        st.error("⚠️ الرصيد غير كافٍ، لم يتم الخصم")
+    except LeaveAlreadyPosted:
+        st.error("⚠️ تم خصم هذا الطلب من الرصيد مسبقاً")
+    except Exception as e:
+        st.error(f"فشل الخصم: {e}")
+    return None
 
 def submit_request_db(data: dict) -> bool:
     if not supabase: return False
     try:
         data["submission_date"] = datetime.now().isoformat()
-        supabase.table("requests").insert(data).execute()
+        res = supabase.table("requests").insert(data).execute()
+        feed.touch(res.data)
         return True
     except Exception as e:
         st.error(f"فشل الحفظ: {e}")
         return False
 
-def get_requests_for_role(role: str, emp_id: str, dept: str):
-    if not supabase: return [], []
-    tasks, history = [], []
-
-    # مهام البديل
-    sub = supabase.table("requests").select("*").eq("substitute_id", emp_id).eq("status_substitute", "Pending").execute().data
-    for r in sub or []: r["task_type"]="Substitute"; tasks.append(r)
-
-    # مهام المدير
-    if role == "Manager":
-        mgr = supabase.table("requests").select("*").eq("dept", dept).eq("status_manager", "Pending").execute().data
-        for r in mgr or []:
-            if r.get("status_substitute") in ["Approved", "Not Required"]:
-                r["task_type"]="Manager"; tasks.append(r)
-
-    # مهام HR
-    if role == "HR":
-        hr = supabase.table("requests").select("*").eq("status_manager", "Approved").eq("status_hr", "Pending").execute().data
-        for r in hr or []: r["task_type"]="HR"; tasks.append(r)
-        
-        history = supabase.table("requests").select("*").eq("final_status", "Approved").order("hr_action_at", desc=True).limit(50).execute().data
-
-    return tasks, history
+def get_requests_for_role(role: str, emp_id: str, dept: str, history_limit: int = 50):
+    # مهام البديل + المدير + HR وسجل HR في طلب واحد (get_task_inbox)
+    return fetch_inbox(supabase, role, emp_id, dept, history_limit)
 
 def update_status_db(req_id: int, field: str, status: str, note: str, user_name: str):
     if not supabase: return
@@ -167,92 +117,23 @@ def update_status_db(req_id: int, field: str, status: str, note: str, user_name:
     }
     if field == "status_hr" and status == "Approved": data["final_status"] = "Approved"
     elif status == "Rejected": data["final_status"] = "Rejected"
-    supabase.table("requests").update(data).eq("id", req_id).execute()
+    res = supabase.table("requests").update(data).eq("id", req_id).execute()
+    feed.touch(res.data)
+    drop_hr_history()
+
+def drop_hr_history():
+    # سجل HR المحفوظ في الجلسة يُعاد جلبه بعد أي إجراء من هذه الجلسة
+    st.session_state.pop("paged_hr_history", None)
 
 # ==============================
-# 5) دالة إنشاء PDF احترافي
+# 5) ملف PDF (src/utils/pdf.py)
 # ==============================
-def generate_pdf(r: dict, salary=0.0, annual_days=0, last_calc_date="-", allowance=0.0, include_financials=False):
-    buffer = BytesIO()
-    c = pdf_canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    font_name = "Arabic" if "Arabic" in pdfmetrics.getRegisteredFontNames() else "Helvetica"
-
-    def draw_rtl(text, x, y): c.drawRightString(x, y, reshape_text(text))
-    
-    def draw_rtl_pair(label, value, y, x_label, x_value):
-        draw_rtl(label, x_label, y)
-        draw_rtl(str(value), x_value, y)
-
-    def draw_paragraph(text, x_right, y_start):
-        words = reshape_text(text).split()
-        line, y = "", y_start
-        for w in words:
-            if len(line)+len(w)+1 > 70:
-                c.drawRightString(x_right, y, line); y -= 0.5*cm; line = w
-            else: line = (line+" "+w) if line else w
-        if line: c.drawRightString(x_right, y, line); y -= 0.5*cm
-        return y
-
-    # Header
-    c.setFont(font_name, 18); c.drawCentredString(width/2, height-2*cm, reshape_text("نموذج طلب إجازة"))
-    c.line(2*cm, height-2.4*cm, width-2*cm, height-2.4*cm)
-
-    # Employee Info Box
-    box_top = height - 3*cm
-    c.rect(2*cm, box_top-5*cm, width-4*cm, 5*cm)
-    y = box_top - 0.8*cm
-    c.setFont(font_name, 11)
-
-    draw_rtl_pair("اسم الموظف:", r['emp_name'], y, width-2.5*cm, width-8.5*cm)
-    draw_rtl_pair("الرقم الوظيفي:", r['emp_id'], y, width-10.5*cm, width-15*cm)
-    y -= 0.9*cm
-    draw_rtl_pair("القسم:", r['dept'], y, width-2.5*cm, width-8.5*cm)
-    draw_rtl_pair("المسمى:", r.get('job_title','-'), y, width-10.5*cm, width-15*cm)
-    y -= 0.9*cm
-    draw_rtl_pair("نوع الإجازة:", r.get('sub_type','-'), y, width-2.5*cm, width-8.5*cm)
-    draw_rtl_pair("عدد الأيام:", f"{r.get('days',0)} يوم", y, width-10.5*cm, width-15*cm)
-    y -= 0.9*cm
-    draw_rtl_pair("من تاريخ:", r.get('start_date',''), y, width-2.5*cm, width-8.5*cm)
-    draw_rtl_pair("إلى تاريخ:", r.get('end_date',''), y, width-10.5*cm, width-15*cm)
-    y -= 0.9*cm
-    draw_rtl_pair("البديل:", r.get('substitute_name','لا يوجد'), y, width-2.5*cm, width-8.5*cm)
-    draw_rtl_pair("تاريخ التقديم:", r.get('submission_date','')[:10], y, width-10.5*cm, width-15*cm)
-
-    # Declaration
-    y = box_top - 5*cm - 1.3*cm
-    c.line(2*cm, y, width-2*cm, y); y -= 0.8*cm
-    c.setFont(font_name, 12); draw_rtl("الإقــــــرار:", width-2*cm, y); y -= 0.7*cm
-    c.setFont(font_name, 10)
-    decl = "أقر أنا الموقع أدناه بأنني سأتمتع بإجازتي في موعدها المحدد أعلاه، كما أنني لن أتجاوز مدة الإجازة المطلوبة إلا عند إرسال خطاب رسمي لتمديد الإجازة والموافقة عليها من قبل رئيسي المباشر، كما أعتبر نفسي منذراً بالفصل عند تجاوز مدة الغياب حسب المدة المحددة في نظام العمل والعمال، وأنني ألتزم بجميع ما ورد أعلاه وعلى ذلك أوقع."
-    y = draw_paragraph(decl, width-2*cm, y)
+def leave_form_pdf(r: dict, **kwargs) -> bytes:
+    """يولّد النموذج عند طلب التحميل فقط، ويعيد النسخة المخزنة إن لم تتغير بيانات الطلب."""
+    return get_pdf_cache().get_or_render(r, lambda: generate_pdf(r, **kwargs).getvalue(), LEAVE_FORM_FIELDS, **kwargs)
 
-    # Signatures
-    y -= 1.5*cm; c.setFont(font_name, 11)
-    x_emp, x_mgr, x_hr = width-4*cm, width/2, 4*cm
-    draw_rtl("توقيع الموظف", x_emp, y); draw_rtl("المدير المباشر", x_mgr, y); draw_rtl("الموارد البشرية", x_hr, y)
-    y -= 0.8*cm
-    draw_rtl(r['emp_name'], x_emp, y); draw_rtl(r.get('manager_name','-'), x_mgr, y); draw_rtl(r.get('hr_name','-'), x_hr, y)
-    y -= 0.6*cm
-    draw_rtl(r.get('submission_date','')[:10], x_emp, y); draw_rtl(r.get('manager_action_at','')[:10], x_mgr, y); draw_rtl(r.get('hr_action_at','')[:10], x_hr, y)
-
-    # Financials (HR Only)
-    if include_financials:
-        y -= 2*cm; c.line(2*cm, y, width-2*cm, y); y -= 0.8*cm
-        c.setFont(font_name, 12); draw_rtl("تفاصيل حساب مبلغ بدل الإجازة", width-2*cm, y); y -= 1*cm
-        c.setFont(font_name, 11)
-        draw_rtl_pair("الراتب الإجمالي:", f"{salary} ريال", y, width-2.5*cm, width-9*cm); y -= 0.7*cm
-        draw_rtl_pair("الرصيد السنوي:", f"{annual_days} يوم", y, width-2.5*cm, width-9*cm); y -= 0.7*cm
-        draw_rtl_pair("أيام الإجازة المستحقة:", f"{r.get('days',0)} يوم", y, width-2.5*cm, width-9*cm); y -= 0.7*cm
-        draw_rtl_pair("تاريخ آخر احتساب:", str(last_calc_date), y, width-2.5*cm, width-9*cm); y -= 0.7*cm
-        draw_rtl_pair("مبلغ بدل الإجازة:", f"{allowance} ريال", y, width-2.5*cm, width-9*cm); y -= 1.5*cm
-        
-        x_acc, x_fin, x_gm = width-4*cm, width/2, 4*cm
-        draw_rtl("المحاسب", x_acc, y); draw_rtl("المدير المالي", x_fin, y); draw_rtl("المدير العام", x_gm, y)
-        y -= 0.8*cm
-        c.drawString(x_acc-2*cm, y, "_________"); c.drawString(x_fin-2*cm, y, "_________"); c.drawString(x_gm-2*cm, y, "_________")
-
-    c.save(); buffer.seek(0); return buffer
+def leave_form_pdf_by_id(req_id) -> bytes:
+    return leave_form_pdf(fetch_request(supabase, req_id))
 
 # ==============================
 # 6) صفحات التطبيق
@@ -270,10 +151,20 @@ def login_page():
                     st.session_state["user"] = user; st.session_state["page"] = "dashboard"; st.rerun()
                 else: st.error("بيانات خاطئة")
 
+@st.fragment(run_every=TASKS_REFRESH_SECONDS)
+def task_badge(u):
+    # عدادات change feed في الذاكرة: لا استعلام لكل جلسة
+    n, _ = feed.pending(u)
+    if n: st.warning(f"🔔 لديك ({n}) مهام جديدة")
+
+@st.fragment(run_every=TASKS_REFRESH_SECONDS)
+def inbox_watch(u):
+    # يعيد تحميل الصفحة فقط عندما يتغير صندوق المستخدم
+    if feed.pending(u)[1] != st.session_state.get("inbox_version"): st.rerun(scope="app")
+
 def dashboard_page():
     u = st.session_state["user"]; st.title(f"👋 مرحباً {u['name']}")
-    tasks, _ = get_requests_for_role(u["role"], u["emp_id"], u["dept"])
-    if tasks: st.warning(f"🔔 لديك ({len(tasks)}) مهام جديدة")
+    task_badge(u)
     st.write("---")
     c1,c2,c3=st.columns(3)
     with c1:
@@ -300,13 +191,15 @@ def form_page():
         if days>0: st.info(f"المدة: {days} يوم")
         l_type = st.selectbox("النوع", ["سنوية", "مرضية", "بدون راتب"])
         sub_id = st.text_input("بديل (اختياري)")
+        # تداخل إجازات الموظف نفسه يمنع الإرسال؛ البديل وتغطية القسم تحذير
+        free = days <= 0 or check_leave(u['emp_id'], u['dept'], d1, d2, sub_id or None)
         
         html = """<div class="declaration-box"><strong>(( إقرار وتعهــد ))</strong><br>أقر أنا الموقع أدناه بأنني سأتمتع بإجازتي في موعدها المحدد أعلاه، كما أنني لن أتجاوز مدة الإجازة المطلوبة إلا عند إرسال خطاب رسمي لتمديد الإجازة والموافقة عليها من قبل رئيسي المباشر، كما أعتبر نفسي منذراً بالفصل عند تجاوز مدة الغياب حسب المدة المحددة في نظام العمل والعمال، وأنني ألتزم بجميع ما ورد أعلاه وعلى ذلك أوقع.</div>"""
         st.markdown(html, unsafe_allow_html=True)
         agree = st.checkbox("أوافق")
         
         if st.button("إرسال"):
-            if agree and days>0:
+            if agree and days>0 and free:
                 data = {"emp_id":u['emp_id'],"emp_name":u['name'],"dept":u['dept'],"service_type":"إجازة","sub_type":l_type,"start_date":str(d1),"end_date":str(d2),"days":days,"substitute_id":sub_id or None,"status_substitute":"Pending" if sub_id else "Not Required","declaration_agreed":True}
                 submit_request_db(data); st.success("تم!"); time.sleep(1); st.session_state["page"]="dashboard"; st.rerun()
     
@@ -314,13 +207,38 @@ def form_page():
         st.header("💰 طلب سلفة"); amt = st.number_input("المبلغ"); rsn = st.text_area("السبب")
         if st.button("إرسال"): submit_request_db({"emp_id":u['emp_id'],"emp_name":u['name'],"dept":u['dept'],"service_type":"سلفة","amount":amt,"details":rsn}); st.success("تم!"); time.sleep(1); st.session_state["page"]="dashboard"; st.rerun()
 
+def paged_rows(key, fetch_page, first_page=None):
+    """قائمة تُحمَّل صفحةً صفحة (keyset) وتُحفظ في session_state؛ "تحميل المزيد" يجلب الصفحة التالية فقط."""
+    state = st.session_state.get(key)
+    if state is None:
+        rows, cursor = first_page if first_page is not None else fetch_page(None)
+        state = st.session_state[key] = {"rows": rows, "cursor": cursor}
+    return state
+
+def load_more_button(key, fetch_page):
+    state = st.session_state[key]
+    if state["cursor"] and st.button("⬇️ تحميل المزيد", key=f"{key}_more"):
+        rows, cursor = fetch_page(state["cursor"])
+        state["rows"] += rows; state["cursor"] = cursor
+        st.rerun()
+
 def approvals_page():
     u = st.session_state["user"]; st.title("✅ المهام")
-    tasks, history = get_requests_for_role(u["role"], u["emp_id"], u["dept"])
-    
+    # الصفحة الأولى من سجل HR تأتي مع المهام في نفس الاستدعاء؛ الصفحات التالية عبر keyset.
+    # السجل المحفوظ يُسقط عند تغيّر صندوق المهام (إجراء من معتمد آخر) ليظهر الطلب المعتمد فيه
+    version = feed.pending(u)[1]
+    if version != st.session_state.get("inbox_version"): drop_hr_history()
+    st.session_state["inbox_version"] = version
+    need_history = u["role"] == "HR" and "paged_hr_history" not in st.session_state
+    inbox_watch(u)
+    tasks, history = get_requests_for_role(u["role"], u["emp_id"], u["dept"], HISTORY_PAGE_SIZE + 1 if need_history else 0)
+    render_bulk_actions(supabase, u, tasks, on_change=drop_hr_history)
+
     if tasks:
         for r in tasks:
-            with st.expander(f"{r['emp_name']} - {r['service_type']}"):
+            with st.expander(f"{r['emp_name']} - {r['service_type']} {score_badge(r.get('ai_score'))}"):
+                if r.get('ai_summary'): st.caption(r['ai_summary'])
+                if r.get('task_type') != "Substitute": render_task_leave_context(r)
                 c1,c2=st.columns(2); note=st.text_input("ملاحظة", key=f"n{r['id']}")
                 if c1.button("✅", key=f"ok{r['id']}"):
                     f = "status_substitute" if r.get('task_type')=="Substitute" else "status_manager" if r.get('task_type')=="Manager" else "status_hr"
@@ -329,11 +247,13 @@ def approvals_page():
                     f = "status_substitute" if r.get('task_type')=="Substitute" else "status_manager" if r.get('task_type')=="Manager" else "status_hr"
                     update_status_db(r['id'], f, "Rejected", note, u['name']); st.rerun()
 
-    if u["role"] == "HR" and history:
-        st.divider(); st.subheader("📜 السجل (HR)")
-        for h in history:
-            with st.expander(f"✅ {h['emp_name']} ({h.get('hr_action_at','')[:10]})"):
-                phone = h.get("phone", "").replace("0", "966", 1)
+    if u["role"] == "HR":
+        fetch_page = lambda cursor: fetch_hr_history_page(supabase, cursor)
+        state = paged_rows("paged_hr_history", fetch_page, page_of(history, "hr_action_at", HISTORY_PAGE_SIZE) if need_history else None)
+        if state["rows"]: st.divider(); st.subheader("📜 السجل (HR)")
+        for h in state["rows"]:
+            with st.expander(f"✅ {h['emp_name']} ({(h.get('hr_action_at') or '')[:10]})"):
+                phone = (h.get("phone") or "").replace("0", "966", 1)
                 msg = f"تم اعتماد طلب الإجازة رقم: {h['id']}\nنوع: {h.get('sub_type')}\nمن: {h.get('start_date')}\nإلى: {h.get('end_date')}"
                 link = f"https://wa.me/{phone}?text={urllib.parse.quote(msg)}"
                 st.markdown(f"<a href='{link}' target='_blank'>📲 واتساب</a>", unsafe_allow_html=True)
@@ -341,18 +261,29 @@ def approvals_page():
                 if h['service_type']=='إجازة':
                     if st.button("💰 مستحقات الإجازة", key=f"c{h['id']}"):
                         st.session_state["calc_request"]=h; st.session_state["page"]="calc_allowance"; st.rerun()
+                # كل ما حدث للطلب: الأقسام الحية + الأرشيف (Parquet)
+                if st.toggle("🕓 سجل الطلب", key=f"a{h['id']}"):
+                    events = request_history(supabase, h['id'])
+                    if events: st.dataframe(pd.DataFrame(events)[["created_at", "actor_name", "action", "note"]], hide_index=True)
+                    else: st.caption("لا توجد أحداث")
+        load_more_button("paged_hr_history", fetch_page)
 
 def calc_allowance_page():
     u = st.session_state["user"]
     if u["role"] != "HR": st.error("HR Only"); return
     r = st.session_state.get("calc_request")
+    if "submission_date" not in r:
+        # صف السجل يحوي أعمدة القائمة فقط؛ الصف الكامل يُجلب مرة واحدة عند فتح الصفحة
+        r = st.session_state["calc_request"] = fetch_request(supabase, r["id"]) or r
     
     st.title(f"💰 مستحقات: {r['emp_name']}")
     if st.button("🔙"): st.session_state["page"]="approvals"; st.rerun()
     st.write("---")
     
     emp = get_user_data(r['emp_id'])
-    cur_bal, last_set = get_leave_balance(emp)
+    # الرصيد من الـ snapshot (محدث بعد كل قيد)؛ قبل أول قيد يُحسب من leave_balances
+    snap = fetch_balance(supabase, r['emp_id'])
+    cur_bal, last_set = (float(snap['annual_balance']), snap['last_settlement_date']) if snap else get_leave_balance(emp)
     
     st.info(f"الرصيد الحالي: {cur_bal} يوم | آخر تصفية: {last_set}")
     
@@ -375,21 +306,34 @@ def calc_allowance_page():
     st.success(f"💵 المبلغ المستحق: {allowance:,.2f} ريال")
     
     if st.button("📥 اعتماد وخصم الرصيد + تحميل PDF", type="primary"):
-        if new_bal >= 0: set_leave_balance(r['emp_id'], new_bal, to_date)
+        bal = settle_leave(r, req_days, to_date, u)
+        if bal is not None: st.success(f"✅ تم الخصم، الرصيد الآن: {bal}")
         pdf = generate_pdf(r, salary, int(annual), to_date, allowance, True)
         st.download_button("اضغط للتحميل", pdf, f"Allow_{r['id']}.pdf", "application/pdf")
 
+    # السجل يُجلب فقط عند طلبه (محتوى expander يُنفَّذ في كل rerun)
+    if st.toggle("📜 سجل الرصيد", key=f"ledger_{r['id']}"):
+        ledger = fetch_ledger(supabase, r['emp_id'])
+        if ledger: st.dataframe(pd.DataFrame(ledger), hide_index=True)
+        else: st.caption("لا توجد قيود بعد")
+
 def my_requests_page():
     u = st.session_state["user"]; st.title("📂 طلباتي")
     if st.button("🔙"): st.session_state["page"]="dashboard"; st.rerun()
-    reqs = supabase.table("requests").select("*").eq("emp_id", u['emp_id']).order("created_at", desc=True).execute().data
-    for r in reqs:
+    fetch_page = lambda cursor: fetch_my_requests_page(supabase, u['emp_id'], cursor)
+    state = paged_rows("paged_my_requests", fetch_page)
+    for r in state["rows"]:
         with st.container():
-            st.write(f"**{r['service_type']}** | {r.get('final_status','-')}")
+            st.write(f"**{r['service_type']}** | {r.get('sub_type') or ''} | {r.get('final_status','-')} | {(r.get('created_at') or '')[:10]}")
+            if st.toggle("التفاصيل", key=f"d{r['id']}"):
+                full = fetch_request(supabase, r['id']) or r
+                st.write({k: full.get(k) for k in ("start_date", "end_date", "days", "amount", "details", "substitute_name",
+                                                  "status_substitute", "status_manager", "status_hr", "manager_note", "hr_note") if full.get(k) is not None})
             if r.get('final_status')=='Approved' and r['service_type']=='إجازة':
-                pdf = generate_pdf(r, include_financials=False)
-                st.download_button("📥 النموذج", pdf, f"Req_{r['id']}.pdf", key=f"p{r['id']}")
+                st.download_button("📥 النموذج", partial(leave_form_pdf_by_id, r['id']), f"Req_{r['id']}.pdf", "application/pdf",
+                                   key=f"p{r['id']}", on_click="ignore")
             st.divider()
+    load_more_button("paged_my_requests", fetch_page)
 
 # ==============================
 # 7) التوجيه
@@ -402,11 +346,26 @@ if st.session_state["user"]:
         st.header(st.session_state["user"]["name"])
         if st.button("🏠"): st.session_state["page"]="dashboard"; st.rerun()
         if st.button("✅"): st.session_state["page"]="approvals"; st.rerun()
+        if st.session_state["user"]["role"] in ANALYTICS_ROLES and st.button("📊"): st.session_state["page"]="analytics"; st.rerun()
+        if st.session_state["user"]["role"] in SEARCH_ROLES and st.button("🔎"): st.session_state["page"]="search"; st.rerun()
+        if st.session_state["user"]["role"] in CALENDAR_ROLES and st.button("📅"): st.session_state["page"]="calendar"; st.rerun()
+        if st.session_state["user"]["role"] in DIAGNOSTICS_ROLES and st.button("🩺"): st.session_state["page"]="diagnostics"; st.rerun()
         if st.button("🚪"): st.session_state.clear(); st.rerun()
 
-if st.session_state["page"]=="login": login_page()
-elif st.session_state["page"]=="dashboard": dashboard_page()
-elif st.session_state["page"]=="form": form_page()
-elif st.session_state["page"]=="approvals": approvals_page()
-elif st.session_state["page"]=="my_requests": my_requests_page()
-elif st.session_state["page"]=="calc_allowance": calc_allowance_page()
+# القوائم المقسّمة لصفحات تبدأ من جديد عند الانتقال بين الصفحات
+if st.session_state.get("_last_page") != st.session_state["page"]:
+    for k in [k for k in st.session_state if str(k).startswith("paged_")]: del st.session_state[k]
+    st.session_state["_last_page"] = st.session_state["page"]
+
+# عدد الرحلات إلى القاعدة وزمنها لكل رسم صفحة (صفحة التشخيص)
+with get_metrics().render(st.session_state["page"]):
+    if st.session_state["page"]=="login": login_page()
+    elif st.session_state["page"]=="dashboard": dashboard_page()
+    elif st.session_state["page"]=="form": form_page()
+    elif st.session_state["page"]=="approvals": approvals_page()
+    elif st.session_state["page"]=="my_requests": my_requests_page()
+    elif st.session_state["page"]=="calc_allowance": calc_allowance_page()
+    elif st.session_state["page"]=="analytics": render_analytics(supabase, st.session_state["user"])
+    elif st.session_state["page"]=="search": render_search(supabase, st.session_state["user"])
+    elif st.session_state["page"]=="diagnostics": render_diagnostics(st.session_state["user"])
+    elif st.session_state["page"]=="calendar": render_leave_calendar(st.session_state["user"])
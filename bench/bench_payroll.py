@@ -0,0 +1,56 @@
+# bench/bench_payroll.py
+# Payroll run compute time for a synthetic workforce (target: 50k employees well under a minute):
+# one process vs the process pool of src/jobs/payroll_run.py, plus the JSON encoding of the upsert payload.
+#
+#   python -m bench.bench_payroll --employees 50000
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.jobs.payroll_run import compute_period, diff_runs, WRITE_CHUNK_SIZE
+
+PERIOD = ("2025-03-01", "2025-03-31")
+
+def synthetic(n: int, seed=0):
+    rng = np.random.default_rng(seed)
+    emp_ids = [str(100000 + i) for i in range(n)]
+    salary = rng.integers(4000, 30000, n).astype(float)
+    employees = pd.DataFrame({"emp_id": emp_ids, "salary": salary, "housing_allowance": salary * 0.25,
+                              "transport_allowance": np.full(n, 750.0)})
+    n_leaves = n // 2
+    start = pd.Timestamp("2025-02-15") + pd.to_timedelta(rng.integers(0, 45, n_leaves), unit="D")
+    days = rng.integers(1, 15, n_leaves)
+    leaves = pd.DataFrame({"id": np.arange(1, n_leaves + 1), "emp_id": np.array(emp_ids)[rng.integers(0, n, n_leaves)],
+                           "sub_type": np.where(rng.random(n_leaves) < 0.8, "سنوية", "بدون راتب"),
+                           "start_date": start.strftime("%Y-%m-%d"),
+                           "end_date": (start + pd.to_timedelta(days - 1, unit="D")).strftime("%Y-%m-%d"), "days": days})
+    attendance = pd.DataFrame({"emp_id": emp_ids, "days_present": 22, "minutes_worked": 22 * 480,
+                               "late_minutes": rng.integers(0, 300, n), "incomplete_days": 0})
+    return employees, leaves, attendance
+
+def timed(label, fn):
+    start = time.perf_counter(); out = fn(); elapsed = time.perf_counter() - start
+    print(f"{label:<22}{elapsed:7.2f}s")
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Payroll run compute throughput")
+    ap.add_argument("--employees", type=int, default=50000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    args = ap.parse_args()
+    employees, leaves, attendance = synthetic(args.employees)
+
+    single = timed("1 process:", lambda: compute_period(employees, leaves, attendance, *PERIOD, workers=1))
+    pooled = timed(f"{args.workers} processes:", lambda: compute_period(employees, leaves, attendance, *PERIOD, workers=args.workers))
+    assert single == pooled, "pool result differs from single process"
+    diff = timed("diff vs previous:", lambda: diff_runs(pooled, pd.DataFrame(single)))
+    timed("encode payload:", lambda: [json.dumps(pooled[i:i + WRITE_CHUNK_SIZE]) for i in range(0, len(pooled), WRITE_CHUNK_SIZE)])
+    print(f"rows: {len(pooled)}  unchanged on re-run: {len(diff['unchanged'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# bench/bench_pdf.py
+# Documents/second for the leave form: previous renderer (reshape every label, wrap by 70 chars)
+# vs src/utils/pdf.py (cached shaping + static form XObject).
+#
+#   python -m bench.bench_pdf --docs 300
+
+import argparse
+import time
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas as pdf_canvas
+from reportlab.lib.units import cm
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+from src.utils.pdf import register_fonts, form_font, generate_pdf, DECLARATION
+
+def sample_row(i: int) -> dict:
+    return {
+        "id": i, "emp_name": f"موظف المبيعات {i % 40}", "emp_id": str(1000 + i % 40), "dept": "المبيعات",
+        "job_title": "أخصائي مبيعات", "sub_type": "سنوية", "days": 5 + i % 10,
+        "start_date": "2025-03-01", "end_date": "2025-03-10", "substitute_name": f"موظف المبيعات {(i + 1) % 40}",
+        "submission_date": "2025-02-20T09:00:00", "manager_name": "مدير المبيعات", "hr_name": "موظف الموارد البشرية 1",
+        "manager_action_at": "2025-02-21T10:00:00", "hr_action_at": "2025-02-22T11:00:00",
+    }
+
+def legacy_generate_pdf(r: dict, include_financials=False):
+    """نسخة من المولّد السابق (قبل الكاش والتخطيط الثابت) للمقارنة فقط."""
+    def reshape(text):
+        if not text: return ""
+        return get_display(arabic_reshaper.reshape(str(text)))
+    buffer = BytesIO()
+    c = pdf_canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    font_name = form_font()
+    def draw_rtl(text, x, y): c.drawRightString(x, y, reshape(text))
+    def draw_rtl_pair(label, value, y, x_label, x_value):
+        draw_rtl(label, x_label, y); draw_rtl(str(value), x_value, y)
+    def draw_paragraph(text, x_right, y_start):
+        words = reshape(text).split()
+        line, y = "", y_start
+        for w in words:
+            if len(line)+len(w)+1 > 70:
+                c.drawRightString(x_right, y, line); y -= 0.5*cm; line = w
+            else: line = (line+" "+w) if line else w
+        if line: c.drawRightString(x_right, y, line); y -= 0.5*cm
+        return y
+    c.setFont(font_name, 18); c.drawCentredString(width/2, height-2*cm, reshape("نموذج طلب إجازة"))
+    c.line(2*cm, height-2.4*cm, width-2*cm, height-2.4*cm)
+    box_top = height - 3*cm
+    c.rect(2*cm, box_top-5*cm, width-4*cm, 5*cm)
+    y = box_top - 0.8*cm
+    c.setFont(font_name, 11)
+    draw_rtl_pair("اسم الموظف:", r['emp_name'], y, width-2.5*cm, width-8.5*cm)
+    draw_rtl_pair("الرقم الوظيفي:", r['emp_id'], y, width-10.5*cm, width-15*cm); y -= 0.9*cm
+    draw_rtl_pair("القسم:", r['dept'], y, width-2.5*cm, width-8.5*cm)
+    draw_rtl_pair("المسمى:", r.get('job_title','-'), y, width-10.5*cm, width-15*cm); y -= 0.9*cm
+    draw_rtl_pair("نوع الإجازة:", r.get('sub_type','-'), y, width-2.5*cm, width-8.5*cm)
+    draw_rtl_pair("عدد الأيام:", f"{r.get('days',0)} يوم", y, width-10.5*cm, width-15*cm); y -= 0.9*cm
+    draw_rtl_pair("من تاريخ:", r.get('start_date',''), y, width-2.5*cm, width-8.5*cm)
+    draw_rtl_pair("إلى تاريخ:", r.get('end_date',''), y, width-10.5*cm, width-15*cm); y -= 0.9*cm
+    draw_rtl_pair("البديل:", r.get('substitute_name','لا يوجد'), y, width-2.5*cm, width-8.5*cm)
+    draw_rtl_pair("تاريخ التقديم:", r.get('submission_date','')[:10], y, width-10.5*cm, width-15*cm)
+    y = box_top - 5*cm - 1.3*cm
+    c.line(2*cm, y, width-2*cm, y); y -= 0.8*cm
+    c.setFont(font_name, 12); draw_rtl("الإقــــــرار:", width-2*cm, y); y -= 0.7*cm
+    c.setFont(font_name, 10)
+    y = draw_paragraph(DECLARATION, width-2*cm, y)
+    y -= 1.5*cm; c.setFont(font_name, 11)
+    x_emp, x_mgr, x_hr = width-4*cm, width/2, 4*cm
+    draw_rtl("توقيع الموظف", x_emp, y); draw_rtl("المدير المباشر", x_mgr, y); draw_rtl("الموارد البشرية", x_hr, y)
+    y -= 0.8*cm
+    draw_rtl(r['emp_name'], x_emp, y); draw_rtl(r.get('manager_name','-'), x_mgr, y); draw_rtl(r.get('hr_name','-'), x_hr, y)
+    y -= 0.6*cm
+    draw_rtl(r.get('submission_date','')[:10], x_emp, y); draw_rtl(r.get('manager_action_at','')[:10], x_mgr, y); draw_rtl(r.get('hr_action_at','')[:10], x_hr, y)
+    c.save(); buffer.seek(0); return buffer
+
+def docs_per_second(render, docs: int) -> float:
+    render(sample_row(0))  # تسخين (تحميل الخط)
+    start = time.perf_counter()
+    for i in range(docs): render(sample_row(i))
+    return docs / (time.perf_counter() - start)
+
+def main():
+    ap = argparse.ArgumentParser(description="Leave form PDF throughput (before/after)")
+    ap.add_argument("--docs", type=int, default=300)
+    args = ap.parse_args()
+    if not register_fonts(): print("warning: arial.ttf not found, falling back to Helvetica")
+    before = docs_per_second(legacy_generate_pdf, args.docs)
+    after = docs_per_second(generate_pdf, args.docs)
+    print(f"before: {before:8.1f} docs/s")
+    print(f"after:  {after:8.1f} docs/s  (x{after / before:.2f})")
+
+if __name__ == "__main__":
+    main()
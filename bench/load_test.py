@@ -0,0 +1,211 @@
+# bench/load_test.py
+# Headless load test of the hot paths against the local stand-in (bench/standin.py), with a stored regression baseline
+#
+#   python -m bench.load_test                              # كل الأحمال، مقارنة بـ bench/baseline.json (exit 1 عند التراجع)
+#   python -m bench.load_test --workload approvers --approvers 20
+#   python -m bench.load_test --update-baseline
+#
+# لكل حمل: الإنتاجية (عملية/ثانية)، p50/p95/p99 بالمللي ثانية، ومتوسط الرحلات إلى القاعدة لكل عملية
+# (من InstrumentedClient / QueryMetrics نفسها المستخدمة في التطبيق). عدد الرحلات ثابت لنفس البيانات فأي زيادة فيه
+# تراجع؛ الزمن والإنتاجية يُقارنان بهامش --tolerance لأنهما يتأثران بالجهاز.
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from bench.standin import StandIn, seed_from_workbook, scale_up, seed_requests
+from src.utils.db import InstrumentedClient
+from src.utils.metrics import QueryMetrics
+from src.utils.employee_cache import EmployeeCache
+from src.utils.change_feed import ChangeFeed
+from src.utils.inbox import fetch_inbox
+from src.utils.pdf import register_fonts, generate_pdf
+from src.jobs.export_leave_forms import iter_approved_forms
+from src.utils.roles import MANAGER_ROLES
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+WORKLOADS = ("login_storm", "approvers", "submit", "pdf_export")
+
+# ------------------------------
+# التشغيل والقياس
+# ------------------------------
+def run_ops(name, client, ops, concurrency=1) -> dict:
+    """ينفذ ops (دوال بلا وسائط) بالتوازي، كل عملية داخل metrics.render حتى تُعد رحلاتها."""
+    metrics = client.metrics
+    latencies = []
+
+    def timed(op):
+        t0 = time.perf_counter()
+        with metrics.render(name):
+            op()
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    if concurrency <= 1:
+        latencies = [timed(op) for op in ops]
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(timed, ops))
+    elapsed = time.perf_counter() - t0
+    page = metrics.snapshot()["pages"].get(name, {"round_trips": 0, "renders": 0})
+    ms = np.array(latencies) * 1000
+    return {
+        "ops": len(latencies),
+        "concurrency": concurrency,
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2) if len(ms) else None,
+        "p95_ms": round(float(np.percentile(ms, 95)), 2) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 2) if len(ms) else None,
+        "round_trips_per_op": round(page["round_trips"] / page["renders"], 3) if page["renders"] else 0.0,
+    }
+
+# ------------------------------
+# الأحمال
+# ------------------------------
+def login_storm(client, args):
+    """صباح العمل: كل موظف يسجّل الدخول مرة (login_page -> get_user_data) ثم يرى شارة المهام في الرئيسية."""
+    cache, feed = EmployeeCache(client), ChangeFeed(client)
+    emp_ids = [r["emp_id"] for r in client.table("employees").select("emp_id").execute().data]
+    random.Random(1).shuffle(emp_ids)
+
+    def login(emp_id):
+        user = cache.get(emp_id)
+        if user is None: raise RuntimeError(f"login failed {emp_id}")
+        feed.pending(user)
+    return [lambda e=e: login(e) for e in emp_ids[:args.users]], args.concurrency
+
+def approvers(client, args):
+    """N معتمدين في نفس الوقت: صندوق المهام (get_requests_for_role) ثم اعتماد أول مهمة (update_status_db)."""
+    emps = client.table("employees").select("emp_id,name,role,dept").execute().data
+    managers = list({e["dept"]: e for e in emps if e["role"] in MANAGER_ROLES}.values())
+    hr = [e for e in emps if e["role"] == "HR"]
+    people = (managers + hr)[:args.approvers]
+    fields = {"Substitute": "status_substitute", "Manager": "status_manager", "HR": "status_hr"}
+
+    def approve(u):
+        tasks, _ = fetch_inbox(client, u["role"], u["emp_id"], u["dept"], 0)
+        if not tasks: return
+        r = tasks[0]; field = fields[r["task_type"]]
+        # نفس حقول update_status_db في app.py
+        data = {field: "Approved", field.replace("status_", "") + "_note": "", field.replace("status_", "") + "_name": u["name"],
+                f"{field.replace('status_', '')}_action_at": datetime.now().isoformat()}
+        if field == "status_hr": data["final_status"] = "Approved"
+        client.table("requests").update(data).eq("id", r["id"]).execute()
+    ops = [lambda u=u: approve(u) for _ in range(args.rounds) for u in people]
+    return ops, len(people)
+
+def submit(client, args):
+    """تقديم طلبات إجازة متزامنة (submit_request_db)."""
+    emps = client.table("employees").select("emp_id,name,dept").execute().data
+    rng = random.Random(2)
+
+    def one(e):
+        client.table("requests").insert({"emp_id": e["emp_id"], "emp_name": e["name"], "dept": e["dept"], "service_type": "إجازة",
+                                         "sub_type": "سنوية", "start_date": "2026-01-10", "end_date": "2026-01-14", "days": 5,
+                                         "substitute_id": None, "status_substitute": "Not Required", "declaration_agreed": True,
+                                         "submission_date": datetime.now().isoformat()}).execute()
+    return [lambda e=rng.choice(emps): one(e) for _ in range(args.submissions)], args.concurrency
+
+def pdf_export(client, args):
+    """تصدير نهاية السنة: النماذج المعتمدة صفحة بعد صفحة (iter_approved_forms) ورسم كل نموذج (generate_pdf)."""
+    register_fonts()
+    it = iter_approved_forms(client, page_size=args.page_size)
+
+    def one():
+        row = next(it, None)
+        if row is not None: generate_pdf(row)
+    return [one for _ in range(args.forms)], 1
+
+RUNNERS = {"login_storm": login_storm, "approvers": approvers, "submit": submit, "pdf_export": pdf_export}
+
+# ------------------------------
+# البيانات والمقارنة
+# ------------------------------
+def build_standin(args) -> StandIn:
+    db = StandIn(rtt_ms=args.rtt_ms)
+    seed_from_workbook(db, args.workbook)
+    scale_up(db, args.scale)
+    seed_requests(db, args.requests, seed=0)
+    return db
+
+def config_of(args) -> dict:
+    return {k: getattr(args, k) for k in ("scale", "requests", "rtt_ms", "users", "concurrency", "approvers", "rounds",
+                                          "submissions", "forms", "page_size")}
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """يعيد قائمة التراجعات (نص لكل واحد)."""
+    failures = []
+    for name, cur in results.items():
+        base = baseline.get("workloads", {}).get(name)
+        if not base: continue
+        if cur["round_trips_per_op"] > base["round_trips_per_op"] + 1e-6:
+            failures.append(f"{name}: round trips/op {base['round_trips_per_op']} -> {cur['round_trips_per_op']}")
+        for key in ("p95_ms", "p99_ms"):
+            if base.get(key) and cur.get(key) and cur[key] > base[key] * (1 + tolerance):
+                failures.append(f"{name}: {key} {base[key]} -> {cur[key]} (> +{tolerance:.0%})")
+        if base.get("throughput") and cur["throughput"] < base["throughput"] * (1 - tolerance):
+            failures.append(f"{name}: throughput {base['throughput']} -> {cur['throughput']} (< -{tolerance:.0%})")
+    return failures
+
+def print_table(results: dict, baseline: dict):
+    print(f"{'workload':<13}{'ops':>6}{'conc':>6}{'ops/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'rt/op':>8}{'base rt/op':>12}")
+    for name, r in results.items():
+        base = baseline.get("workloads", {}).get(name, {})
+        print(f"{name:<13}{r['ops']:>6}{r['concurrency']:>6}{r['throughput']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+              f"{r['round_trips_per_op']:>8}{base.get('round_trips_per_op', '-'):>12}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load test the hot paths against a local SQLite stand-in")
+    ap.add_argument("--workload", choices=WORKLOADS, action="append", help="repeatable (default: all)")
+    ap.add_argument("--workbook", default="HR_AI_Platform_Data.xlsx")
+    ap.add_argument("--scale", type=int, default=10, help="copies of the sample workforce")
+    ap.add_argument("--requests", type=int, default=20000)
+    ap.add_argument("--rtt-ms", type=float, default=2.0, help="simulated network latency per round trip")
+    ap.add_argument("--users", type=int, default=300)
+    ap.add_argument("--concurrency", type=int, default=20)
+    ap.add_argument("--approvers", type=int, default=10)
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--submissions", type=int, default=500)
+    ap.add_argument("--forms", type=int, default=200)
+    ap.add_argument("--page-size", type=int, default=100)
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.5, help="allowed relative slowdown for latency/throughput")
+    ap.add_argument("--json", help="also write the results to this file")
+    args = ap.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)
+    if baseline and baseline.get("config") != config_of(args) and not args.update_baseline:
+        print("baseline was recorded with a different configuration; comparing round trips only")
+        baseline = {"workloads": {k: {"round_trips_per_op": v["round_trips_per_op"]} for k, v in baseline.get("workloads", {}).items()}}
+
+    results = {}
+    for name in args.workload or WORKLOADS:
+        db = build_standin(args)  # كل حمل على بيانات جديدة حتى لا يؤثر أحدها في الآخر
+        client = InstrumentedClient(db, QueryMetrics())
+        ops, concurrency = RUNNERS[name](client, args)
+        results[name] = run_ops(name, client, ops, concurrency)
+
+    print_table(results, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"config": config_of(args), "workloads": results}, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+    failures = compare(results, baseline, args.tolerance)
+    for line in failures: print("REGRESSION", line)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,471 @@
+# bench/standin.py
+# Local in-process stand-in for the Supabase/PostgREST table API, backed by SQLite and built from db/init_supabase.sql
+#
+# يكفي لتشغيل مسارات التطبيق والمهام بدون مشروع Supabase: table().select/insert/update/upsert/delete مع
+# eq/neq/gt/gte/lt/lte/in_/is_/like/ilike/or_/order/limit/range و count="exact"/head، وأعمدة JSON
+# (col->key / col->>key مع alias:)، ودوال RPC مكتوبة بـ Python لما تحتاجه أحمال bench/load_test.py واختبارات tests/.
+# rtt_ms يضيف زمن شبكة مصطنعاً لكل رحلة (خارج قفل القاعدة) حتى يظهر أثر عدد الرحلات.
+
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from postgrest.exceptions import APIError
+
+SCHEMA_PATH = "db/init_supabase.sql"
+
+# ------------------------------
+# المخطط: Postgres -> SQLite
+# ------------------------------
+_TYPE_JSON = re.compile(r"\bJSONB?\b", re.I)
+
+def _split_top(s: str, sep=",") -> list:
+    """تقسيم على sep خارج الأقواس وعلامات الاقتباس."""
+    out, depth, cur, quote = [], 0, [], False
+    for ch in s:
+        if ch == "'": quote = not quote
+        elif not quote and ch == "(": depth += 1
+        elif not quote and ch == ")": depth -= 1
+        if ch == sep and depth == 0 and not quote: out.append("".join(cur)); cur = []
+        else: cur.append(ch)
+    if "".join(cur).strip(): out.append("".join(cur))
+    return out
+
+def _column_sql(col: str) -> str:
+    col = re.sub(r"\bBIGSERIAL PRIMARY KEY\b", "INTEGER PRIMARY KEY AUTOINCREMENT", col, flags=re.I)
+    col = re.sub(r"\bREFERENCES\s+\w+\s*\(\w+\)(\s+ON\s+DELETE\s+(SET\s+NULL|CASCADE|RESTRICT))?", "", col, flags=re.I)
+    col = re.sub(r"::\w+(\[\])?", "", col)
+    col = re.sub(r"DEFAULT\s+now\(\)", "DEFAULT CURRENT_TIMESTAMP", col, flags=re.I)
+    col = re.sub(r"DEFAULT\s+'\{\}'", "DEFAULT '{}'", col)
+    return col
+
+def translate_schema(sql: str):
+    """يعيد (جمل SQLite، {table: {أعمدة JSON}}). ما لا يُترجم (دوال، triggers، أعمدة مولّدة) يُتجاهل."""
+    sql = re.sub(r"--[^\n]*", "", sql)
+    statements, json_cols = [], {}
+    for name, body in re.findall(r"CREATE TABLE IF NOT EXISTS (\w+)\s*\((.*?)\)\s*(?:PARTITION BY [^;]*)?;", sql, re.S | re.I):
+        cols = []
+        for col in _split_top(body):
+            col = " ".join(col.split())
+            if not col or re.search(r"GENERATED ALWAYS", col, re.I): continue
+            # جدول مقسّم: المفتاح (id, مفتاح التقسيم) في Postgres؛ في SQLite يكفي id تلقائي
+            if re.match(r"PRIMARY KEY \(id,", col, re.I): continue
+            col = re.sub(r"^id BIGSERIAL$", "id BIGSERIAL PRIMARY KEY", col, flags=re.I)
+            if _TYPE_JSON.search(col.split(" ")[1] if " " in col else ""): json_cols.setdefault(name, set()).add(col.split(" ")[0])
+            cols.append(_column_sql(col))
+        statements.append(f"CREATE TABLE IF NOT EXISTS {name} ({', '.join(cols)})")
+    for table, col, rest in re.findall(r"ALTER TABLE (\w+) ADD COLUMN IF NOT EXISTS (\w+) ([^;]*);", sql, re.I):
+        if re.search(r"GENERATED ALWAYS", rest, re.I): continue
+        if _TYPE_JSON.search(rest.split(" ")[0]): json_cols.setdefault(table, set()).add(col)
+        statements.append(("add_column", table, col, _column_sql(f"{col} {rest}")))
+    for m in re.finditer(r"CREATE (UNIQUE )?INDEX IF NOT EXISTS (\w+) ON (\w+)\s*\(([\w\s,]+)\)\s*(WHERE [^;]*)?;", sql, re.I):
+        cols = ", ".join(c.split()[0] for c in m.group(4).split(","))
+        where = f" {m.group(5)}" if m.group(5) else ""  # فهرس جزئي (SQLite يدعم نفس الصيغة للشروط البسيطة)
+        statements.append(f"CREATE {m.group(1) or ''}INDEX IF NOT EXISTS {m.group(2)} ON {m.group(3)} ({cols}){where}")
+    return statements, json_cols
+
+# ------------------------------
+# الاستجابة والأخطاء
+# ------------------------------
+class Response:
+    def __init__(self, data, count=None):
+        self.data, self.count = data, count
+
+def _api_error(e: sqlite3.Error):
+    code = "23505" if "UNIQUE" in str(e) else "23514" if "CHECK" in str(e) else "23502" if "NOT NULL" in str(e) else "PGRST000"
+    return APIError({"message": str(e), "code": code, "hint": None, "details": None})
+
+# ------------------------------
+# بناء الاستعلام
+# ------------------------------
+_OPS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+class Query:
+    def __init__(self, db, table):
+        self.db, self.table = db, table
+        self.action, self.columns, self.payload = "select", "*", None
+        self.where, self.params = [], []
+        self.order_by, self.limit_n, self.offset_n = [], None, None
+        self.count, self.head = None, False
+        self.on_conflict, self.ignore_duplicates, self.returning = None, False, "representation"
+
+    # ---- الأفعال ----
+    def select(self, *columns, count=None, head=None):
+        self.columns = ",".join(columns) or "*"; self.count = count; self.head = bool(head)
+        return self
+
+    def insert(self, rows, count=None, returning="representation", upsert=False, default_to_null=True):
+        self.action, self.payload, self.returning = "insert", rows, str(getattr(returning, "value", returning))
+        return self
+
+    def upsert(self, rows, on_conflict="", ignore_duplicates=False, returning="representation", count=None, default_to_null=True):
+        self.action, self.payload = "upsert", rows
+        self.on_conflict, self.ignore_duplicates = on_conflict or None, ignore_duplicates
+        self.returning = str(getattr(returning, "value", returning))
+        return self
+
+    def update(self, values, count=None, returning="representation"):
+        self.action, self.payload, self.returning = "update", values, str(getattr(returning, "value", returning))
+        return self
+
+    def delete(self, count=None, returning="representation"):
+        self.action, self.returning = "delete", str(getattr(returning, "value", returning))
+        return self
+
+    # ---- الشروط ----
+    def _cond(self, col, op, value):
+        if op == "is":
+            self.where.append(f"{self.db.col_sql(self.table, col)} IS {'NULL' if value in (None, 'null') else 'NOT NULL'}")
+        elif op == "in":
+            values = list(value)
+            self.where.append(f"{self.db.col_sql(self.table, col)} IN ({','.join('?' * len(values)) or 'NULL'})")
+            self.params += [self.db.to_sql(v) for v in values]
+        elif op in ("like", "ilike"):
+            self.where.append(f"{self.db.col_sql(self.table, col)} LIKE ?"); self.params.append(str(value).replace("*", "%"))
+        else:
+            self.where.append(f"{self.db.col_sql(self.table, col)} {_OPS[op]} ?"); self.params.append(self.db.to_sql(value))
+        return self
+
+    def eq(self, c, v): return self._cond(c, "eq", v)
+    def neq(self, c, v): return self._cond(c, "neq", v)
+    def gt(self, c, v): return self._cond(c, "gt", v)
+    def gte(self, c, v): return self._cond(c, "gte", v)
+    def lt(self, c, v): return self._cond(c, "lt", v)
+    def lte(self, c, v): return self._cond(c, "lte", v)
+    def in_(self, c, v): return self._cond(c, "in", v)
+    def is_(self, c, v): return self._cond(c, "is", v)
+    def like(self, c, v): return self._cond(c, "like", v)
+    def ilike(self, c, v): return self._cond(c, "ilike", v)
+
+    def or_(self, filters: str):
+        """صيغة PostgREST: "a.eq.1,b.is.null"."""
+        sub = Query(self.db, self.table)
+        for part in _split_top(filters):
+            col, op, value = part.split(".", 2)
+            sub._cond(col, op, None if value == "null" else value.strip("()").split(",") if op == "in" else value)
+        self.where.append("(" + " OR ".join(sub.where) + ")"); self.params += sub.params
+        return self
+
+    def order(self, column, desc=False, nullsfirst=None):
+        self.order_by.append(f"{self.db.col_sql(self.table, column)} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def limit(self, n): self.limit_n = n; return self
+
+    def range(self, start, end): self.offset_n, self.limit_n = start, end - start + 1; return self
+
+    def execute(self):
+        return self.db.run(self)
+
+# ------------------------------
+# القاعدة
+# ------------------------------
+class StandIn:
+    """عميل بديل لـ Supabase: table()/from_()/rpc() على SQLite في الذاكرة (أو ملف)."""
+
+    def __init__(self, path=":memory:", schema_path=SCHEMA_PATH, rtt_ms=0.0):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        self.rtt = rtt_ms / 1000
+        self.round_trips = 0
+        self.rpcs = dict(RPCS)
+        statements, self.json_cols = translate_schema(open(schema_path, encoding="utf-8").read())
+        for st in statements:
+            if isinstance(st, tuple):
+                _, table, col, col_sql = st
+                cols = self.columns(table)  # جداول تُنشأ داخل كتل DO (ترحيل) غير موجودة هنا
+                if cols and col not in cols: self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {col_sql}")
+            else:
+                self.conn.execute(st)
+        self.conn.commit()
+
+    def columns(self, table):
+        return [r[1] for r in self.conn.execute(f"PRAGMA table_info({table})")]
+
+    # ---- تحويل القيم ----
+    def col_sql(self, table, col: str) -> str:
+        m = re.match(r"^(\w+)(->>?)(\w+)$", col)
+        if m: return f"json_extract({m.group(1)}, '$.{m.group(3)}')"
+        return col
+
+    @staticmethod
+    def to_sql(v):
+        if isinstance(v, (dict, list)): return json.dumps(v, ensure_ascii=False)
+        if isinstance(v, bool): return int(v)
+        return v
+
+    def _row(self, table, row: sqlite3.Row, aliases=None) -> dict:
+        out = dict(row)
+        for k in self.json_cols.get(table, ()):
+            if isinstance(out.get(k), str):
+                try: out[k] = json.loads(out[k])
+                except ValueError: pass
+        for k in aliases or ():
+            if isinstance(out.get(k), str) and out[k][:1] in "{[":
+                try: out[k] = json.loads(out[k])
+                except ValueError: pass
+        return out
+
+    def _select_list(self, columns: str):
+        """"a,b:c->>d" -> (SQL، أعمدة JSON بالأسماء المستعارة)."""
+        if columns.strip() == "*": return "*", []
+        parts, json_aliases = [], []
+        for c in _split_top(columns):
+            c = c.strip()
+            alias, expr = (c.split(":", 1) if ":" in c else (None, c))
+            m = re.match(r"^(\w+)(->>?)(\w+)$", expr)
+            if m:
+                name = alias or m.group(3)
+                parts.append(f"json_extract({m.group(1)}, '$.{m.group(3)}') AS {name}")
+                if m.group(2) == "->": json_aliases.append(name)
+            else:
+                parts.append(f"{expr} AS {alias}" if alias else expr)
+        return ", ".join(parts), json_aliases
+
+    # ---- التنفيذ ----
+    def table(self, name):
+        return Query(self, name)
+
+    from_ = table
+
+    def rpc(self, fn, params=None, **kwargs):
+        db = self
+        class _Call:
+            def execute(self_inner):
+                return db._call(fn, params or {})
+        return _Call()
+
+    def _call(self, fn, params):
+        if self.rtt: time.sleep(self.rtt)
+        if fn not in self.rpcs: raise APIError({"message": f"function {fn} not available in stand-in", "code": "PGRST202"})
+        with self.lock:
+            self.round_trips += 1
+            try:
+                res = Response(self.rpcs[fn](self, **params))
+                self.conn.commit()
+                return res
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                raise _api_error(e)
+            except APIError:
+                self.conn.rollback()
+                raise
+
+    def run(self, q: Query):
+        if self.rtt: time.sleep(self.rtt)
+        with self.lock:
+            self.round_trips += 1
+            try:
+                res = getattr(self, f"_{q.action}")(q)
+                self.conn.commit()
+                return res
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                raise _api_error(e)
+
+    def _where(self, q):
+        return (" WHERE " + " AND ".join(q.where)) if q.where else ""
+
+    def _select(self, q):
+        cols, json_aliases = self._select_list(q.columns)
+        where = self._where(q)
+        count = None
+        if q.count:
+            count = self.conn.execute(f"SELECT count(*) FROM {q.table}{where}", q.params).fetchone()[0]
+        if q.head: return Response([], count)
+        sql = f"SELECT {cols} FROM {q.table}{where}"
+        if q.order_by: sql += " ORDER BY " + ", ".join(q.order_by)
+        if q.limit_n is not None: sql += f" LIMIT {int(q.limit_n)}"
+        if q.offset_n: sql += f" OFFSET {int(q.offset_n)}"
+        rows = [self._row(q.table, r, json_aliases) for r in self.conn.execute(sql, q.params)]
+        return Response(rows, count)
+
+    def _write_rows(self, q, conflict_sql=""):
+        rows = q.payload if isinstance(q.payload, list) else [q.payload]
+        out = []
+        for row in rows:
+            cols = list(row)
+            sql = (f"INSERT INTO {q.table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+                   + conflict_sql.format(updates=", ".join(f"{c} = excluded.{c}" for c in cols if c != q.on_conflict) or f"{cols[0]} = {cols[0]}")
+                   + " RETURNING *")
+            r = self.conn.execute(sql, [self.to_sql(row[c]) for c in cols]).fetchone()
+            if r is not None: out.append(self._row(q.table, r))
+        return Response(out if q.returning != "minimal" else [])
+
+    def _insert(self, q):
+        return self._write_rows(q)
+
+    def _upsert(self, q):
+        if not q.on_conflict:
+            q.on_conflict = next(r[1] for r in self.conn.execute(f"PRAGMA table_info({q.table})") if r[5])
+        conflict = f" ON CONFLICT ({q.on_conflict}) DO " + ("NOTHING" if q.ignore_duplicates else "UPDATE SET {updates}")
+        return self._write_rows(q, conflict)
+
+    def _update(self, q):
+        cols = list(q.payload)
+        sql = f"UPDATE {q.table} SET {', '.join(f'{c} = ?' for c in cols)}{self._where(q)} RETURNING *"
+        rows = self.conn.execute(sql, [self.to_sql(q.payload[c]) for c in cols] + q.params).fetchall()
+        return Response([self._row(q.table, r) for r in rows] if q.returning != "minimal" else [])
+
+    def _delete(self, q):
+        rows = self.conn.execute(f"DELETE FROM {q.table}{self._where(q)} RETURNING *", q.params).fetchall()
+        return Response([self._row(q.table, r) for r in rows] if q.returning != "minimal" else [])
+
+# ------------------------------
+# RPC (نفس منطق دوال db/init_supabase.sql)
+# ------------------------------
+_TASK_COLUMNS = ("id, emp_id, emp_name, dept, service_type, sub_type, details, start_date, end_date, days, amount, "
+                 "substitute_name, created_at, updated_at")
+
+def rpc_get_task_inbox(db, p_emp_id, p_role, p_dept, p_history_limit=50):
+    tasks = db.conn.execute(f"""
+        SELECT * FROM (
+          SELECT 'Substitute' AS task_type, {_TASK_COLUMNS} FROM requests
+          WHERE substitute_id = ? AND status_substitute = 'Pending'
+          UNION ALL
+          SELECT 'Manager', {_TASK_COLUMNS} FROM requests
+          WHERE ? IN ('Manager', 'Supervisor') AND dept = ? AND status_manager = 'Pending'
+            AND status_substitute IN ('Approved', 'Not Required')
+          UNION ALL
+          SELECT 'HR', {_TASK_COLUMNS} FROM requests
+          WHERE ? = 'HR' AND status_manager = 'Approved' AND status_hr = 'Pending'
+        ) ORDER BY created_at, id""", (p_emp_id, p_role, p_dept, p_role)).fetchall()
+    history = []
+    if p_role == "HR":
+        history = db.conn.execute("""
+            SELECT id, emp_id, emp_name, service_type, sub_type, start_date, end_date, phone, hr_action_at FROM requests
+            WHERE final_status = 'Approved' AND hr_action_at IS NOT NULL
+            ORDER BY hr_action_at DESC, id DESC LIMIT ?""", (p_history_limit,)).fetchall()
+    return {"tasks": [dict(r) for r in tasks], "history": [dict(r) for r in history]}
+
+def rpc_post_leave_entry(db, p_emp_id, p_entry_type, p_days, p_settlement_date=None, p_request_id=None,
+                         p_actor_emp_id=None, p_note=None):
+    """نفس post_leave_entry: snapshot يُفتح من leave_balances أول مرة، CHECK الرصيد (23514) وفهرس الخصم الواحد (23505)."""
+    from datetime import date
+    c = db.conn
+    if c.execute("SELECT 1 FROM leave_balance_snapshots WHERE emp_id = ?", (p_emp_id,)).fetchone() is None:
+        e = c.execute("SELECT hire_date, leave_balances FROM employees WHERE emp_id = ?", (p_emp_id,)).fetchone()
+        if e is None: raise APIError({"message": f"unknown employee: {p_emp_id}", "code": "23503"})
+        lb = json.loads(e["leave_balances"] or "{}")
+        hire = e["hire_date"] and date.fromisoformat(str(e["hire_date"])[:10])
+        default = 30 if hire and hire <= date.today().replace(year=date.today().year - 5) else 21
+        balance = max(float(lb["annual_balance"]) if lb.get("annual_balance") is not None else default, 0)
+        last = (lb.get("last_settlement_date") or "")[:10] or e["hire_date"]
+        c.execute("INSERT INTO leave_balance_snapshots (emp_id, annual_balance, last_settlement_date) VALUES (?, ?, ?)", (p_emp_id, balance, last))
+        c.execute("""INSERT INTO leave_ledger (emp_id, entry_type, days, balance_after, settlement_date, note)
+                     VALUES (?, 'opening', ?, ?, ?, 'employees.leave_balances')""", (p_emp_id, balance, balance, last))
+    snap = c.execute("""UPDATE leave_balance_snapshots SET annual_balance = annual_balance + ?,
+                          last_settlement_date = CASE WHEN ? = 'settlement' THEN last_settlement_date
+                                                      ELSE COALESCE(?, last_settlement_date) END,
+                          updated_at = CURRENT_TIMESTAMP
+                        WHERE emp_id = ? RETURNING annual_balance, last_settlement_date""",
+                     (p_days, p_entry_type, p_settlement_date, p_emp_id)).fetchone()
+    entry_id = c.execute("""INSERT INTO leave_ledger (emp_id, entry_type, days, balance_after, settlement_date, request_id, actor_emp_id, note)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?) RETURNING id""",
+                         (p_emp_id, p_entry_type, p_days, snap[0], p_settlement_date, p_request_id, p_actor_emp_id, p_note)).fetchone()[0]
+    c.execute("UPDATE leave_balance_snapshots SET last_entry_id = ? WHERE emp_id = ?", (entry_id, p_emp_id))
+    c.execute("""UPDATE employees SET leave_balances = json_set(COALESCE(leave_balances, '{}'), '$.annual_balance', ?,
+                   '$.last_settlement_date', ?) WHERE emp_id = ?""", (snap[0], snap[1], p_emp_id))
+    return {"entry_id": entry_id, "emp_id": p_emp_id, "annual_balance": snap[0], "last_settlement_date": snap[1]}
+
+def rpc_post_leave_entries(db, p_entries, p_actor_emp_id=None):
+    """نفس post_leave_entries: قيود الموظف معاً أو لا شيء، والقيد المخصوم مسبقاً يُسقط (already_deducted)."""
+    groups = {}
+    for entry in p_entries: groups.setdefault(entry["emp_id"], []).append(entry)
+    posted, skipped = 0, []
+    for emp_id, entries in groups.items():
+        if "prev_settlement" in entries[0]:
+            row = db.conn.execute("SELECT json_extract(leave_balances, '$.last_settlement_date') FROM employees WHERE emp_id = ?", (emp_id,)).fetchone()
+            if ((row and row[0]) or "") != (entries[0]["prev_settlement"] or ""):
+                skipped.append({"emp_id": emp_id, "reason": "settled_meanwhile"}); continue
+        db.conn.execute("SAVEPOINT emp")
+        written, dropped = 0, []
+        try:
+            for e in entries:
+                db.conn.execute("SAVEPOINT entry")
+                try:
+                    rpc_post_leave_entry(db, emp_id, e["entry_type"], e["days"], e.get("settlement_date"), e.get("request_id"),
+                                         p_actor_emp_id, e.get("note"))
+                    written += 1
+                except sqlite3.IntegrityError as err:
+                    db.conn.execute("ROLLBACK TO entry")
+                    if "UNIQUE" not in str(err): raise
+                    dropped.append({"emp_id": emp_id, "reason": "already_deducted", "request_id": e.get("request_id")})
+                db.conn.execute("RELEASE entry")
+        except sqlite3.IntegrityError as err:
+            db.conn.execute("ROLLBACK TO emp"); db.conn.execute("RELEASE emp")
+            if "CHECK" not in str(err): raise
+            skipped.append({"emp_id": emp_id, "reason": "insufficient_balance"}); continue
+        db.conn.execute("RELEASE emp")
+        if written: posted += 1
+        skipped += dropped
+    return {"posted": posted, "skipped": skipped}
+
+RPCS = {"get_task_inbox": rpc_get_task_inbox, "post_leave_entry": rpc_post_leave_entry, "post_leave_entries": rpc_post_leave_entries}
+
+# ------------------------------
+# البيانات
+# ------------------------------
+def seed_from_workbook(db: StandIn, path="HR_AI_Platform_Data.xlsx"):
+    """نفس مسار الاستيراد الحقيقي (src/jobs/import_workbook.py) على الـ stand-in."""
+    import io
+    from src.jobs.import_workbook import import_workbook
+    rtt, db.rtt = db.rtt, 0
+    try:
+        return import_workbook(db, path, out=io.StringIO())
+    finally:
+        db.rtt = rtt
+
+def scale_up(db: StandIn, factor: int):
+    """نسخ الموظفين factor مرة (emp_id + "-k" وقسم مستقل لكل نسخة) لأحمال أكبر من ملف العينة."""
+    cols = db.columns("employees")
+    with db.lock:
+        for k in range(1, factor):
+            sel = ", ".join(f"emp_id || '-{k}'" if c == "emp_id" else f"dept || ' {k}'" if c == "dept" else c for c in cols)
+            db.conn.execute(f"INSERT INTO employees ({', '.join(cols)}) SELECT {sel} FROM employees WHERE emp_id NOT LIKE '%-%'")
+        db.conn.commit()
+
+# توزيع مراحل الطلبات: (الوزن، status_substitute, status_manager, status_hr, final_status)
+REQUEST_STAGES = [
+    (0.10, "Pending", "Pending", "Pending", "Pending"),
+    (0.20, "Not Required", "Pending", "Pending", "Pending"),
+    (0.10, "Approved", "Pending", "Pending", "Pending"),
+    (0.15, "Not Required", "Approved", "Pending", "Pending"),
+    (0.40, "Not Required", "Approved", "Approved", "Approved"),
+    (0.05, "Not Required", "Rejected", "Pending", "Rejected"),
+]
+
+def seed_requests(db: StandIn, n: int, seed=0):
+    """طلبات اصطناعية (ورقة الطلبات في ملف العينة فارغة) موزعة على الموظفين والمراحل أعلاه، بتاريخ السنة الماضية."""
+    import random
+    from datetime import date, datetime, timedelta
+    rng = random.Random(seed)
+    emps = [dict(r) for r in db.conn.execute("SELECT emp_id, name, dept, phone FROM employees")]
+    weights = [s[0] for s in REQUEST_STAGES]
+    year = date.today().year - 1
+    rows = []
+    for i in range(n):
+        e, sub = rng.choice(emps), rng.choice(emps)
+        _, st_sub, st_mgr, st_hr, final = rng.choices(REQUEST_STAGES, weights)[0]
+        start = date(year, 1, 1) + timedelta(days=rng.randrange(360))
+        days = rng.randint(1, 14)
+        created = datetime.combine(start - timedelta(days=rng.randint(3, 30)), datetime.min.time()) + timedelta(minutes=i % 1440)
+        leave = rng.random() < 0.8
+        rows.append((e["emp_id"], e["name"], e["dept"], "إجازة" if leave else "سلفة",
+                     rng.choice(["سنوية", "مرضية", "بدون راتب"]) if leave else None,
+                     str(start) if leave else None, str(start + timedelta(days=days - 1)) if leave else None, days if leave else None,
+                     None if leave else rng.randrange(1000, 10000, 500),
+                     sub["emp_id"] if st_sub != "Not Required" else None, sub["name"] if st_sub != "Not Required" else None,
+                     st_sub, st_mgr, st_hr, final, e["phone"], created.isoformat(), created.isoformat(), created.isoformat(),
+                     (created + timedelta(days=2)).isoformat() if st_hr == "Approved" else None,
+                     "مدير القسم" if st_mgr != "Pending" else None, "موظف الموارد البشرية" if st_hr == "Approved" else None))
+    with db.lock:
+        db.conn.executemany("""INSERT INTO requests (emp_id, emp_name, dept, service_type, sub_type, start_date, end_date, days, amount,
+                               substitute_id, substitute_name, status_substitute, status_manager, status_hr, final_status, phone,
+                               created_at, updated_at, submission_date, hr_action_at, manager_name, hr_name)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+        db.conn.commit()
+    return n
@@ -47,16 +47,30 @@ CREATE TABLE IF NOT EXISTS requests (
   updated_at TIMESTAMPTZ DEFAULT now()
 );
 
--- Table: audit_logs
+-- Table: audit_logs (monthly range partitions on created_at; see "Audit log partitions" below)
+-- An older unpartitioned audit_logs is renamed here and its rows are moved into partitions further down.
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_class WHERE relname = 'audit_logs' AND relkind = 'r'
+             AND relnamespace = 'public'::regnamespace) THEN
+    ALTER TABLE audit_logs RENAME TO audit_logs_unpartitioned;
+    ALTER TABLE audit_logs_unpartitioned RENAME CONSTRAINT audit_logs_pkey TO audit_logs_unpartitioned_pkey;
+    ALTER INDEX IF EXISTS idx_audit_logs_event_id RENAME TO idx_audit_logs_unpartitioned_event_id;
+    ALTER TABLE audit_logs_unpartitioned ADD COLUMN IF NOT EXISTS event_id TEXT;
+  END IF;
+END $$;
+
 CREATE TABLE IF NOT EXISTS audit_logs (
-  id BIGSERIAL PRIMARY KEY,
+  id BIGSERIAL,
   actor_emp_id TEXT,
   actor_name TEXT,
   action TEXT,
   target_request_id BIGINT,
   note TEXT,
-  created_at TIMESTAMPTZ DEFAULT now()
-);
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT;
 
 -- Table: ai_analyses
 CREATE TABLE IF NOT EXISTS ai_analyses (
@@ -158,4 +172,1095 @@ CREATE TABLE IF NOT EXISTS permissions (
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_requests_emp_id ON requests(emp_id);
 CREATE INDEX IF NOT EXISTS idx_requests_dept ON requests(dept);
-CREATE INDEX IF NOT EXISTS idx_ai_request_id ON ai_analyses(request_id);
\ No newline at end of file
+
+-- Columns written by app.py that predate this schema file
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS submission_date TIMESTAMPTZ;
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS amount NUMERIC;
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS declaration_agreed BOOLEAN DEFAULT false;
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS manager_name TEXT;
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS hr_name TEXT;
+
+-- Employee fields imported from the HR workbook (src/jobs/import_workbook.py)
+ALTER TABLE employees ADD COLUMN IF NOT EXISTS job_title TEXT;
+ALTER TABLE employees ADD COLUMN IF NOT EXISTS national_id TEXT;
+ALTER TABLE employees ADD COLUMN IF NOT EXISTS salary NUMERIC;
+ALTER TABLE employees ADD COLUMN IF NOT EXISTS housing_allowance NUMERIC;
+ALTER TABLE employees ADD COLUMN IF NOT EXISTS transport_allowance NUMERIC;
+ALTER TABLE employees ADD COLUMN IF NOT EXISTS birth_date DATE;
+ALTER TABLE employees ADD COLUMN IF NOT EXISTS employment_status TEXT;
+ALTER TABLE employees ADD COLUMN IF NOT EXISTS payroll_items JSONB DEFAULT '{}'::jsonb;
+
+-- Natural key of requests imported from a workbook (رقم_الطلب); makes re-imports idempotent
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS external_ref TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_requests_external_ref ON requests(external_ref);
+
+-- Table: settings (key/value, imported from the الإعدادات sheet)
+CREATE TABLE IF NOT EXISTS settings (
+  key TEXT PRIMARY KEY,
+  value TEXT,
+  description TEXT,
+  updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- Audit events carry a client-generated event_id (and created_at) so batched/spooled inserts are idempotent.
+-- Unique indexes on a partitioned table must include the partition key.
+ALTER TABLE audit_logs ADD COLUMN IF NOT EXISTS event_id TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_audit_logs_event ON audit_logs(event_id, created_at);
+
+-- Indexes for the task inbox (one per branch of get_task_inbox)
+CREATE INDEX IF NOT EXISTS idx_requests_substitute_status ON requests(substitute_id, status_substitute);
+CREATE INDEX IF NOT EXISTS idx_requests_dept_manager_queue ON requests(dept, status_manager, status_substitute);
+CREATE INDEX IF NOT EXISTS idx_requests_manager_hr_status ON requests(status_manager, status_hr);
+-- Keyset pagination: (created_at, id) per employee and (hr_action_at, id) for the HR history
+DROP INDEX IF EXISTS idx_requests_final_hr_action;
+CREATE INDEX IF NOT EXISTS idx_requests_final_hr_keyset ON requests(final_status, hr_action_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_requests_emp_created_keyset ON requests(emp_id, created_at DESC, id DESC);
+
+-- Function: get_task_inbox
+-- Substitute, manager and HR tasks plus the HR history in a single round trip.
+-- Only the columns rendered by the approvals/dashboard pages are projected; the history is the
+-- first keyset page of src/utils/history.fetch_hr_history_page (same columns and order).
+-- Each task carries its precomputed score/summary from ai_analyses (src/jobs/score_requests.py).
+CREATE OR REPLACE FUNCTION get_task_inbox(
+  p_emp_id TEXT,
+  p_role TEXT,
+  p_dept TEXT,
+  p_history_limit INTEGER DEFAULT 50
+) RETURNS JSONB
+LANGUAGE sql STABLE AS $$
+  SELECT jsonb_build_object(
+    'tasks', COALESCE((
+      SELECT jsonb_agg(to_jsonb(t) ORDER BY t.created_at, t.id)
+      FROM (
+        SELECT 'Substitute' AS task_type, r.id, r.emp_id, r.emp_name, r.dept, r.service_type, r.sub_type,
+               r.details, r.start_date, r.end_date, r.days, r.amount, r.substitute_name, r.created_at, r.updated_at,
+               a.score AS ai_score, a.summary AS ai_summary
+        FROM requests r
+        LEFT JOIN ai_analyses a ON a.request_id = r.id
+        WHERE r.substitute_id = p_emp_id AND r.status_substitute = 'Pending'
+        UNION ALL
+        SELECT 'Manager', r.id, r.emp_id, r.emp_name, r.dept, r.service_type, r.sub_type,
+               r.details, r.start_date, r.end_date, r.days, r.amount, r.substitute_name, r.created_at, r.updated_at,
+               a.score AS ai_score, a.summary AS ai_summary
+        FROM requests r
+        LEFT JOIN ai_analyses a ON a.request_id = r.id
+        WHERE p_role IN ('Manager', 'Supervisor') AND r.dept = p_dept
+          AND r.status_manager = 'Pending' AND r.status_substitute IN ('Approved', 'Not Required')
+        UNION ALL
+        SELECT 'HR', r.id, r.emp_id, r.emp_name, r.dept, r.service_type, r.sub_type,
+               r.details, r.start_date, r.end_date, r.days, r.amount, r.substitute_name, r.created_at, r.updated_at,
+               a.score AS ai_score, a.summary AS ai_summary
+        FROM requests r
+        LEFT JOIN ai_analyses a ON a.request_id = r.id
+        WHERE p_role = 'HR' AND r.status_manager = 'Approved' AND r.status_hr = 'Pending'
+      ) t
+    ), '[]'::jsonb),
+    'history', CASE WHEN p_role = 'HR' THEN COALESCE((
+      SELECT jsonb_agg(to_jsonb(h) ORDER BY h.hr_action_at DESC, h.id DESC)
+      FROM (
+        SELECT r.id, r.emp_id, r.emp_name, r.service_type, r.sub_type, r.start_date, r.end_date,
+               r.phone, r.hr_action_at
+        FROM requests r
+        WHERE r.final_status = 'Approved' AND r.hr_action_at IS NOT NULL
+        ORDER BY r.hr_action_at DESC, r.id DESC
+        LIMIT p_history_limit
+      ) h
+    ), '[]'::jsonb) ELSE '[]'::jsonb END
+  );
+$$;
+
+-- Keep requests.updated_at current on every update (used for optimistic concurrency)
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.updated_at := now();
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_requests_updated_at ON requests;
+CREATE TRIGGER trg_requests_updated_at BEFORE UPDATE ON requests
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- Function: bulk_transition_requests
+-- Approve/reject many requests in one transaction and write the matching audit rows.
+-- p_items: [{"id": 1, "field": "status_manager", "updated_at": "..."}]
+-- A request is only moved if its updated_at still matches and its stage is still Pending (and the
+-- previous stage is done); otherwise it is reported back in "skipped" (another approver moved it first).
+CREATE OR REPLACE FUNCTION bulk_transition_requests(
+  p_items JSONB,
+  p_status TEXT,
+  p_note TEXT,
+  p_actor_emp_id TEXT,
+  p_actor_name TEXT
+) RETURNS JSONB
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_updated BIGINT[];
+BEGIN
+  IF p_status NOT IN ('Approved', 'Rejected') THEN
+    RAISE EXCEPTION 'invalid status: %', p_status;
+  END IF;
+
+  WITH items AS (
+    SELECT i.id, i.field, i.updated_at
+    FROM jsonb_to_recordset(p_items) AS i(id BIGINT, field TEXT, updated_at TIMESTAMPTZ)
+    WHERE i.field IN ('status_substitute', 'status_manager', 'status_hr')
+  ), moved AS (
+    UPDATE requests r SET
+      status_substitute    = CASE WHEN i.field = 'status_substitute' THEN p_status ELSE r.status_substitute END,
+      substitute_note      = CASE WHEN i.field = 'status_substitute' THEN p_note ELSE r.substitute_note END,
+      substitute_name      = CASE WHEN i.field = 'status_substitute' THEN p_actor_name ELSE r.substitute_name END,
+      substitute_action_at = CASE WHEN i.field = 'status_substitute' THEN now() ELSE r.substitute_action_at END,
+      status_manager       = CASE WHEN i.field = 'status_manager' THEN p_status ELSE r.status_manager END,
+      manager_note         = CASE WHEN i.field = 'status_manager' THEN p_note ELSE r.manager_note END,
+      manager_name         = CASE WHEN i.field = 'status_manager' THEN p_actor_name ELSE r.manager_name END,
+      manager_action_at    = CASE WHEN i.field = 'status_manager' THEN now() ELSE r.manager_action_at END,
+      status_hr            = CASE WHEN i.field = 'status_hr' THEN p_status ELSE r.status_hr END,
+      hr_note              = CASE WHEN i.field = 'status_hr' THEN p_note ELSE r.hr_note END,
+      hr_name              = CASE WHEN i.field = 'status_hr' THEN p_actor_name ELSE r.hr_name END,
+      hr_action_at         = CASE WHEN i.field = 'status_hr' THEN now() ELSE r.hr_action_at END,
+      final_status         = CASE WHEN p_status = 'Rejected' THEN 'Rejected'
+                                  WHEN i.field = 'status_hr' THEN 'Approved'
+                                  ELSE r.final_status END
+    FROM items i
+    WHERE r.id = i.id
+      AND r.updated_at = i.updated_at
+      AND CASE i.field WHEN 'status_substitute' THEN r.status_substitute
+                       WHEN 'status_manager' THEN r.status_manager
+                       ELSE r.status_hr END = 'Pending'
+      AND (i.field <> 'status_manager' OR r.status_substitute IN ('Approved', 'Not Required'))
+      AND (i.field <> 'status_hr' OR r.status_manager = 'Approved')
+    RETURNING r.id, i.field
+  ), logged AS (
+    INSERT INTO audit_logs (event_id, actor_emp_id, actor_name, action, target_request_id, note)
+    SELECT gen_random_uuid()::text, p_actor_emp_id, p_actor_name,
+           CASE WHEN p_status = 'Approved' THEN 'approve:' ELSE 'reject:' END || m.field, m.id, p_note
+    FROM moved m
+    RETURNING target_request_id
+  )
+  SELECT array_agg(target_request_id) INTO v_updated FROM logged;
+
+  RETURN jsonb_build_object(
+    'updated', COALESCE(to_jsonb(v_updated), '[]'::jsonb),
+    'skipped', COALESCE((
+      SELECT jsonb_agg(i.id)
+      FROM jsonb_to_recordset(p_items) AS i(id BIGINT)
+      WHERE NOT (i.id = ANY(COALESCE(v_updated, '{}')))
+    ), '[]'::jsonb)
+  );
+END;
+$$;
+
+-- Leave balance ledger (append-only) + snapshot of the current balance per employee.
+-- Every change to the annual balance is one ledger row (accrual, consumption, settlement, adjustment);
+-- the snapshot row is updated in the same statement, so reading the current balance is a PK lookup and the
+-- non-negative rule is a CHECK constraint. employees.leave_balances is kept as a mirror for existing readers.
+CREATE TABLE IF NOT EXISTS leave_balance_snapshots (
+  emp_id TEXT PRIMARY KEY REFERENCES employees(emp_id),
+  annual_balance NUMERIC NOT NULL CHECK (annual_balance >= 0),
+  last_settlement_date DATE,
+  last_entry_id BIGINT,
+  updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS leave_ledger (
+  id BIGSERIAL PRIMARY KEY,
+  emp_id TEXT NOT NULL REFERENCES employees(emp_id),
+  entry_type TEXT NOT NULL CHECK (entry_type IN ('opening', 'accrual', 'consumption', 'settlement', 'adjustment')),
+  days NUMERIC NOT NULL,            -- موجب للإضافة وسالب للخصم
+  balance_after NUMERIC NOT NULL,
+  settlement_date DATE,
+  request_id BIGINT REFERENCES requests(id),
+  actor_emp_id TEXT,
+  note TEXT,
+  created_at TIMESTAMPTZ DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_leave_ledger_emp ON leave_ledger(emp_id, id DESC);
+-- A request is deducted at most once, whichever comes first: HR settlement or accrual-run consumption
+DROP INDEX IF EXISTS idx_leave_ledger_request;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leave_ledger_request_deduction ON leave_ledger(request_id) WHERE request_id IS NOT NULL AND days < 0;
+
+CREATE OR REPLACE FUNCTION leave_ledger_append_only() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  RAISE EXCEPTION 'leave_ledger is append-only';
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_leave_ledger_append_only ON leave_ledger;
+CREATE TRIGGER trg_leave_ledger_append_only BEFORE UPDATE OR DELETE ON leave_ledger
+  FOR EACH ROW EXECUTE FUNCTION leave_ledger_append_only();
+
+-- Function: post_leave_entry
+-- Applies one signed entry atomically: the snapshot row is locked by the UPDATE, so concurrent settlements
+-- of the same employee serialize instead of overwriting each other. A deduction below zero fails with
+-- check_violation (23514). The first entry of an employee opens the snapshot from employees.leave_balances.
+-- last_settlement_date is the accrual anchor: a 'settlement' entry (HR paying out one request) leaves it alone,
+-- otherwise the days accrued since the last run up to that date would be lost.
+CREATE OR REPLACE FUNCTION post_leave_entry(
+  p_emp_id TEXT,
+  p_entry_type TEXT,
+  p_days NUMERIC,
+  p_settlement_date DATE DEFAULT NULL,
+  p_request_id BIGINT DEFAULT NULL,
+  p_actor_emp_id TEXT DEFAULT NULL,
+  p_note TEXT DEFAULT NULL
+) RETURNS JSONB
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_snap leave_balance_snapshots;
+  v_entry leave_ledger;
+BEGIN
+  INSERT INTO leave_balance_snapshots (emp_id, annual_balance, last_settlement_date)
+  SELECT e.emp_id,
+         GREATEST(COALESCE((e.leave_balances->>'annual_balance')::NUMERIC,
+                           CASE WHEN e.hire_date <= current_date - INTERVAL '5 years' THEN 30 ELSE 21 END), 0),
+         COALESCE(LEFT(e.leave_balances->>'last_settlement_date', 10)::DATE, e.hire_date)
+  FROM employees e
+  WHERE e.emp_id = p_emp_id
+  ON CONFLICT (emp_id) DO NOTHING
+  RETURNING * INTO v_snap;
+  IF FOUND THEN
+    INSERT INTO leave_ledger (emp_id, entry_type, days, balance_after, settlement_date, note)
+    VALUES (p_emp_id, 'opening', v_snap.annual_balance, v_snap.annual_balance, v_snap.last_settlement_date, 'employees.leave_balances');
+  END IF;
+
+  UPDATE leave_balance_snapshots s SET
+    annual_balance = s.annual_balance + p_days,
+    last_settlement_date = CASE WHEN p_entry_type = 'settlement' THEN s.last_settlement_date
+                                ELSE COALESCE(p_settlement_date, s.last_settlement_date) END,
+    updated_at = now()
+  WHERE s.emp_id = p_emp_id
+  RETURNING * INTO v_snap;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'unknown employee: %', p_emp_id USING ERRCODE = 'foreign_key_violation';
+  END IF;
+
+  INSERT INTO leave_ledger (emp_id, entry_type, days, balance_after, settlement_date, request_id, actor_emp_id, note)
+  VALUES (p_emp_id, p_entry_type, p_days, v_snap.annual_balance, p_settlement_date, p_request_id, p_actor_emp_id, p_note)
+  RETURNING * INTO v_entry;
+
+  UPDATE leave_balance_snapshots SET last_entry_id = v_entry.id WHERE emp_id = p_emp_id;
+  UPDATE employees e SET
+    leave_balances = COALESCE(e.leave_balances, '{}'::jsonb) || jsonb_build_object(
+      'annual_balance', v_snap.annual_balance,
+      'last_settlement_date', v_snap.last_settlement_date::TEXT),
+    updated_at = now()
+  WHERE e.emp_id = p_emp_id;
+
+  RETURN jsonb_build_object('entry_id', v_entry.id, 'emp_id', p_emp_id, 'annual_balance', v_snap.annual_balance,
+                            'last_settlement_date', v_snap.last_settlement_date);
+END;
+$$;
+
+-- Function: post_leave_entries
+-- Bulk version for the accrual run (src/jobs/leave_accrual.py), one call per chunk.
+-- p_entries: [{"emp_id", "entry_type", "days", "settlement_date", "request_id", "note", "prev_settlement"}]
+-- Entries of one employee are applied together or not at all. If prev_settlement is given and the employee's
+-- last_settlement_date is no longer that value (HR settled meanwhile), the employee is skipped.
+-- An entry for a request that already has a deduction in the ledger (HR settled it between the run's read and
+-- this call) is dropped and reported as skipped with reason 'already_deducted'; an employee counts as posted only
+-- if at least one of its entries was written.
+CREATE OR REPLACE FUNCTION post_leave_entries(p_entries JSONB, p_actor_emp_id TEXT DEFAULT NULL) RETURNS JSONB
+LANGUAGE plpgsql AS $$
+DECLARE
+  g RECORD;
+  e RECORD;
+  v_current TEXT;
+  v_posted INTEGER := 0;
+  v_written INTEGER;
+  v_dropped JSONB;
+  v_skipped JSONB := '[]'::jsonb;
+BEGIN
+  FOR g IN
+    SELECT x.entry->>'emp_id' AS emp_id, jsonb_agg(x.entry ORDER BY x.n) AS entries
+    FROM jsonb_array_elements(p_entries) WITH ORDINALITY AS x(entry, n)
+    GROUP BY 1 ORDER BY min(x.n)
+  LOOP
+    v_written := 0; v_dropped := '[]'::jsonb;
+    BEGIN
+      IF g.entries->0 ? 'prev_settlement' THEN
+        SELECT COALESCE(leave_balances->>'last_settlement_date', '') INTO v_current
+        FROM employees WHERE emp_id = g.emp_id FOR UPDATE;
+        IF v_current IS DISTINCT FROM COALESCE(g.entries->0->>'prev_settlement', '') THEN
+          v_skipped := v_skipped || jsonb_build_object('emp_id', g.emp_id, 'reason', 'settled_meanwhile');
+          CONTINUE;
+        END IF;
+      END IF;
+      FOR e IN
+        SELECT * FROM jsonb_to_recordset(g.entries)
+          AS i(entry_type TEXT, days NUMERIC, settlement_date DATE, request_id BIGINT, note TEXT)
+      LOOP
+        BEGIN
+          PERFORM post_leave_entry(g.emp_id, e.entry_type, e.days, e.settlement_date, e.request_id, p_actor_emp_id, e.note);
+          v_written := v_written + 1;
+        EXCEPTION WHEN unique_violation THEN
+          v_dropped := v_dropped || jsonb_build_object('emp_id', g.emp_id, 'reason', 'already_deducted', 'request_id', e.request_id);
+        END;
+      END LOOP;
+      IF v_written > 0 THEN v_posted := v_posted + 1; END IF;
+      v_skipped := v_skipped || v_dropped;
+    EXCEPTION WHEN check_violation THEN
+      v_skipped := v_skipped || jsonb_build_object('emp_id', g.emp_id, 'reason', 'insufficient_balance');
+    END;
+  END LOOP;
+
+  RETURN jsonb_build_object('posted', v_posted, 'skipped', v_skipped);
+END;
+$$;
+
+-- Superseded by post_leave_entries
+DROP FUNCTION IF EXISTS apply_leave_settlements(JSONB);
+
+-- KPI aggregates (docs/HR_CRM_Policies_and_Procedures.md §13), maintained incrementally by a trigger on
+-- requests and rebuilt from scratch by rebuild_kpis(). The analytics page reads only these tables.
+-- Periods are calendar months; every row is additive so the trigger applies -OLD +NEW deltas.
+--   kpi_stage_latency: decisions per dept/stage/month/latency bucket (histogram) with latency sum
+--   kpi_dept_outcomes: final approved/rejected per dept/service/month (rejection rate)
+--   kpi_leave_duration: approved leaves and days per dept/employee/month (average leave duration)
+CREATE TABLE IF NOT EXISTS kpi_stage_latency (
+  dept TEXT NOT NULL,
+  stage TEXT NOT NULL,              -- substitute | manager | hr
+  period DATE NOT NULL,             -- أول يوم في الشهر
+  bucket SMALLINT NOT NULL,         -- انظر kpi_latency_bucket
+  decisions INTEGER NOT NULL DEFAULT 0,
+  approved INTEGER NOT NULL DEFAULT 0,
+  rejected INTEGER NOT NULL DEFAULT 0,
+  latency_seconds NUMERIC NOT NULL DEFAULT 0,
+  PRIMARY KEY (dept, stage, period, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS kpi_dept_outcomes (
+  dept TEXT NOT NULL,
+  service_type TEXT NOT NULL,
+  period DATE NOT NULL,
+  approved INTEGER NOT NULL DEFAULT 0,
+  rejected INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (dept, service_type, period)
+);
+
+CREATE TABLE IF NOT EXISTS kpi_leave_duration (
+  dept TEXT NOT NULL,
+  emp_id TEXT NOT NULL,
+  period DATE NOT NULL,
+  leaves INTEGER NOT NULL DEFAULT 0,
+  days INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (dept, emp_id, period)
+);
+CREATE INDEX IF NOT EXISTS idx_kpi_stage_latency_period ON kpi_stage_latency(period);
+CREATE INDEX IF NOT EXISTS idx_kpi_dept_outcomes_period ON kpi_dept_outcomes(period);
+CREATE INDEX IF NOT EXISTS idx_kpi_leave_duration_period ON kpi_leave_duration(period);
+
+-- Latency histogram buckets: 0 <1h, 1 <4h, 2 <1d, 3 <3d, 4 <7d, 5 >=7d
+CREATE OR REPLACE FUNCTION kpi_latency_bucket(p_seconds NUMERIC) RETURNS SMALLINT
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT CASE WHEN p_seconds < 3600 THEN 0 WHEN p_seconds < 14400 THEN 1 WHEN p_seconds < 86400 THEN 2
+              WHEN p_seconds < 259200 THEN 3 WHEN p_seconds < 604800 THEN 4 ELSE 5 END::SMALLINT;
+$$;
+
+-- Decided stages of one request. A stage's latency runs from the previous stage's decision (or creation).
+CREATE OR REPLACE FUNCTION kpi_stage_facts(r requests)
+RETURNS TABLE (dept TEXT, stage TEXT, period DATE, bucket SMALLINT, approved INTEGER, rejected INTEGER, latency_seconds NUMERIC)
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT COALESCE(r.dept, '-'), s.stage, date_trunc('month', s.decided_at)::DATE,
+         kpi_latency_bucket(GREATEST(EXTRACT(EPOCH FROM s.decided_at - s.started_at), 0)),
+         (s.status = 'Approved')::INTEGER, (s.status = 'Rejected')::INTEGER,
+         GREATEST(EXTRACT(EPOCH FROM s.decided_at - s.started_at), 0)
+  FROM (VALUES
+    ('substitute', r.status_substitute, r.substitute_action_at, r.created_at),
+    ('manager', r.status_manager, r.manager_action_at, COALESCE(r.substitute_action_at, r.created_at)),
+    ('hr', r.status_hr, r.hr_action_at, r.manager_action_at)
+  ) AS s(stage, status, decided_at, started_at)
+  WHERE s.status IN ('Approved', 'Rejected') AND s.decided_at IS NOT NULL AND s.started_at IS NOT NULL;
+$$;
+
+-- Final outcome of one request (period = month of the deciding action)
+CREATE OR REPLACE FUNCTION kpi_outcome_facts(r requests)
+RETURNS TABLE (dept TEXT, service_type TEXT, period DATE, approved INTEGER, rejected INTEGER, emp_id TEXT, days INTEGER)
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT COALESCE(r.dept, '-'), r.service_type,
+         date_trunc('month', COALESCE(GREATEST(r.hr_action_at, r.manager_action_at, r.substitute_action_at), r.created_at))::DATE,
+         (r.final_status = 'Approved')::INTEGER, (r.final_status = 'Rejected')::INTEGER, r.emp_id, COALESCE(r.days, 0)
+  WHERE r.final_status IN ('Approved', 'Rejected');
+$$;
+
+CREATE OR REPLACE FUNCTION kpi_apply(r requests, p_sign INTEGER) RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO kpi_stage_latency AS k (dept, stage, period, bucket, decisions, approved, rejected, latency_seconds)
+  SELECT f.dept, f.stage, f.period, f.bucket, p_sign, p_sign * f.approved, p_sign * f.rejected, p_sign * f.latency_seconds
+  FROM kpi_stage_facts(r) f
+  ON CONFLICT (dept, stage, period, bucket) DO UPDATE SET
+    decisions = k.decisions + EXCLUDED.decisions,
+    approved = k.approved + EXCLUDED.approved,
+    rejected = k.rejected + EXCLUDED.rejected,
+    latency_seconds = k.latency_seconds + EXCLUDED.latency_seconds;
+
+  INSERT INTO kpi_dept_outcomes AS k (dept, service_type, period, approved, rejected)
+  SELECT f.dept, f.service_type, f.period, p_sign * f.approved, p_sign * f.rejected
+  FROM kpi_outcome_facts(r) f
+  ON CONFLICT (dept, service_type, period) DO UPDATE SET
+    approved = k.approved + EXCLUDED.approved,
+    rejected = k.rejected + EXCLUDED.rejected;
+
+  INSERT INTO kpi_leave_duration AS k (dept, emp_id, period, leaves, days)
+  SELECT f.dept, f.emp_id, f.period, p_sign, p_sign * f.days
+  FROM kpi_outcome_facts(r) f
+  WHERE f.service_type = 'إجازة' AND f.approved = 1
+  ON CONFLICT (dept, emp_id, period) DO UPDATE SET
+    leaves = k.leaves + EXCLUDED.leaves,
+    days = k.days + EXCLUDED.days;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION kpi_requests_trigger() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN PERFORM kpi_apply(OLD, -1); END IF;
+  IF TG_OP IN ('UPDATE', 'INSERT') THEN PERFORM kpi_apply(NEW, 1); END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_requests_kpi_insert_delete ON requests;
+CREATE TRIGGER trg_requests_kpi_insert_delete AFTER INSERT OR DELETE ON requests
+  FOR EACH ROW EXECUTE FUNCTION kpi_requests_trigger();
+DROP TRIGGER IF EXISTS trg_requests_kpi_update ON requests;
+CREATE TRIGGER trg_requests_kpi_update AFTER UPDATE ON requests
+  FOR EACH ROW
+  WHEN ((OLD.status_substitute, OLD.status_manager, OLD.status_hr, OLD.final_status,
+         OLD.substitute_action_at, OLD.manager_action_at, OLD.hr_action_at, OLD.dept, OLD.service_type, OLD.emp_id, OLD.days, OLD.created_at)
+        IS DISTINCT FROM
+        (NEW.status_substitute, NEW.status_manager, NEW.status_hr, NEW.final_status,
+         NEW.substitute_action_at, NEW.manager_action_at, NEW.hr_action_at, NEW.dept, NEW.service_type, NEW.emp_id, NEW.days, NEW.created_at))
+  EXECUTE FUNCTION kpi_requests_trigger();
+
+-- Function: rebuild_kpis
+-- Recomputes the aggregates from requests (backfill / repair). With p_from only periods >= p_from are rebuilt.
+-- The aggregate tables are locked for the duration so trigger deltas from concurrent updates are applied
+-- after the rebuild, on top of the state it saw.
+CREATE OR REPLACE FUNCTION rebuild_kpis(p_from DATE DEFAULT NULL) RETURNS JSONB
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_from DATE := COALESCE(date_trunc('month', p_from)::DATE, '-infinity'::DATE);
+  v_stage BIGINT; v_outcomes BIGINT; v_leaves BIGINT;
+BEGIN
+  LOCK TABLE kpi_stage_latency, kpi_dept_outcomes, kpi_leave_duration IN EXCLUSIVE MODE;
+  DELETE FROM kpi_stage_latency WHERE period >= v_from;
+  DELETE FROM kpi_dept_outcomes WHERE period >= v_from;
+  DELETE FROM kpi_leave_duration WHERE period >= v_from;
+
+  INSERT INTO kpi_stage_latency (dept, stage, period, bucket, decisions, approved, rejected, latency_seconds)
+  SELECT f.dept, f.stage, f.period, f.bucket, count(*), sum(f.approved), sum(f.rejected), sum(f.latency_seconds)
+  FROM requests r, LATERAL kpi_stage_facts(r) f
+  WHERE f.period >= v_from
+  GROUP BY 1, 2, 3, 4;
+  GET DIAGNOSTICS v_stage = ROW_COUNT;
+
+  INSERT INTO kpi_dept_outcomes (dept, service_type, period, approved, rejected)
+  SELECT f.dept, f.service_type, f.period, sum(f.approved), sum(f.rejected)
+  FROM requests r, LATERAL kpi_outcome_facts(r) f
+  WHERE f.period >= v_from
+  GROUP BY 1, 2, 3;
+  GET DIAGNOSTICS v_outcomes = ROW_COUNT;
+
+  INSERT INTO kpi_leave_duration (dept, emp_id, period, leaves, days)
+  SELECT f.dept, f.emp_id, f.period, count(*), sum(f.days)
+  FROM requests r, LATERAL kpi_outcome_facts(r) f
+  WHERE f.period >= v_from AND f.service_type = 'إجازة' AND f.approved = 1
+  GROUP BY 1, 2, 3;
+  GET DIAGNOSTICS v_leaves = ROW_COUNT;
+
+  RETURN jsonb_build_object('kpi_stage_latency', v_stage, 'kpi_dept_outcomes', v_outcomes, 'kpi_leave_duration', v_leaves);
+END;
+$$;
+
+-- Attendance ingestion (src/jobs/attendance_ingest.py): raw gate punches, deduplicated by (emp_id, event_ts, source)
+CREATE TABLE IF NOT EXISTS attendance_events (
+  id BIGSERIAL PRIMARY KEY,
+  emp_id TEXT NOT NULL,
+  event_ts TIMESTAMPTZ NOT NULL,
+  event_type TEXT NOT NULL CHECK (event_type IN ('in', 'out')),
+  source TEXT NOT NULL DEFAULT '',
+  received_at TIMESTAMPTZ DEFAULT now()
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_events_dedup ON attendance_events(emp_id, event_ts, source);
+CREATE INDEX IF NOT EXISTS idx_attendance_events_ts ON attendance_events(event_ts);
+
+-- attendance holds the check-in/check-out pairs built by compact_attendance (one work day per row set)
+ALTER TABLE attendance ADD COLUMN IF NOT EXISTS work_date DATE;
+CREATE INDEX IF NOT EXISTS idx_attendance_work_date ON attendance(work_date, emp_id);
+
+-- Daily summary per employee: what leave/payroll logic reads instead of raw punches
+CREATE TABLE IF NOT EXISTS attendance_daily (
+  emp_id TEXT NOT NULL,
+  work_date DATE NOT NULL,
+  first_in TIMESTAMPTZ,
+  last_out TIMESTAMPTZ,
+  minutes_worked INTEGER NOT NULL DEFAULT 0,
+  late_minutes INTEGER NOT NULL DEFAULT 0,
+  punches INTEGER NOT NULL DEFAULT 0,
+  incomplete BOOLEAN NOT NULL DEFAULT false,   -- دخول بلا خروج أو خروج بلا دخول
+  updated_at TIMESTAMPTZ DEFAULT now(),
+  PRIMARY KEY (emp_id, work_date)
+);
+CREATE INDEX IF NOT EXISTS idx_attendance_daily_date ON attendance_daily(work_date);
+
+-- Function: compact_attendance
+-- Rebuilds the pairs in attendance and the rows of attendance_daily for work days p_from..p_to (local time p_tz)
+-- from attendance_events. Idempotent: re-running a range replaces it. Repeated punches of the same type within
+-- two minutes (double taps, several gates) count once. Work start and grace come from settings
+-- (WORK_START, LATE_GRACE_MINUTES). Pairing runs per employee across midnight: an 'in' pairs with the next 'out'
+-- if it comes within MAX_SHIFT_HOURS (default 16), and the pair belongs to the local day of the check-in, so a
+-- 22:00 -> 06:00 night shift is one complete pair on the first day. Events up to one shift length either side of
+-- the range are read so shifts crossing its edges pair correctly; only pairs of p_from..p_to are written.
+-- There is no shift schedule yet: late_minutes is always measured against WORK_START.
+CREATE OR REPLACE FUNCTION compact_attendance(p_from DATE, p_to DATE, p_tz TEXT DEFAULT 'Asia/Riyadh') RETURNS JSONB
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_start TIME := COALESCE((SELECT value FROM settings WHERE key = 'WORK_START'), '08:00')::TIME;
+  v_grace INTEGER := COALESCE((SELECT value FROM settings WHERE key = 'LATE_GRACE_MINUTES'), '0')::INTEGER;
+  v_shift INTERVAL := make_interval(hours => COALESCE((SELECT value FROM settings WHERE key = 'MAX_SHIFT_HOURS'), '16')::INTEGER);
+  v_pairs BIGINT; v_days BIGINT;
+BEGIN
+  CREATE TEMP TABLE IF NOT EXISTS _attendance_pairs (
+    emp_id TEXT, work_date DATE, check_in TIMESTAMPTZ, check_out TIMESTAMPTZ, source TEXT
+  ) ON COMMIT DROP;
+  TRUNCATE _attendance_pairs;
+
+  WITH ev AS (
+    SELECT e.emp_id, e.event_ts, e.event_type, e.source,
+           LAG(e.event_type) OVER w AS prev_type, LAG(e.event_ts) OVER w AS prev_ts
+    FROM attendance_events e
+    WHERE e.event_ts >= (p_from::TIMESTAMP AT TIME ZONE p_tz) - v_shift
+      AND e.event_ts < ((p_to + 1)::TIMESTAMP AT TIME ZONE p_tz) + v_shift
+    WINDOW w AS (PARTITION BY e.emp_id ORDER BY e.event_ts)
+  ), clean AS (
+    SELECT emp_id, event_ts, event_type, source, (event_ts AT TIME ZONE p_tz)::DATE AS work_date,
+           LAG(event_type) OVER w AS prev_type, LAG(event_ts) OVER w AS prev_ts,
+           LEAD(event_type) OVER w AS next_type, LEAD(event_ts) OVER w AS next_ts
+    FROM ev
+    WHERE prev_type IS DISTINCT FROM event_type OR event_ts - prev_ts >= INTERVAL '2 minutes'
+    WINDOW w AS (PARTITION BY emp_id ORDER BY event_ts)
+  )
+  INSERT INTO _attendance_pairs
+  SELECT emp_id, work_date, event_ts, CASE WHEN next_type = 'out' AND next_ts - event_ts <= v_shift THEN next_ts END, source
+  FROM clean WHERE event_type = 'in' AND work_date BETWEEN p_from AND p_to
+  UNION ALL
+  SELECT emp_id, work_date, NULL, event_ts, source
+  FROM clean WHERE event_type = 'out' AND work_date BETWEEN p_from AND p_to
+    AND (prev_type IS DISTINCT FROM 'in' OR event_ts - prev_ts > v_shift);
+
+  -- punches of unknown badges stay in attendance_events only
+  DELETE FROM _attendance_pairs p WHERE NOT EXISTS (SELECT 1 FROM employees e WHERE e.emp_id = p.emp_id);
+
+  DELETE FROM attendance WHERE work_date BETWEEN p_from AND p_to;
+  INSERT INTO attendance (emp_id, work_date, check_in, check_out, source)
+  SELECT emp_id, work_date, check_in, check_out, source FROM _attendance_pairs;
+  GET DIAGNOSTICS v_pairs = ROW_COUNT;
+
+  DELETE FROM attendance_daily WHERE work_date BETWEEN p_from AND p_to;
+  INSERT INTO attendance_daily (emp_id, work_date, first_in, last_out, minutes_worked, late_minutes, punches, incomplete)
+  SELECT p.emp_id, p.work_date, min(p.check_in), max(p.check_out),
+         COALESCE(sum(EXTRACT(EPOCH FROM p.check_out - p.check_in)) FILTER (WHERE p.check_in IS NOT NULL AND p.check_out IS NOT NULL), 0)::INTEGER / 60,
+         GREATEST(0, FLOOR(EXTRACT(EPOCH FROM (min(p.check_in) AT TIME ZONE p_tz)::TIME - v_start) / 60) - v_grace)::INTEGER,
+         count(p.check_in) + count(p.check_out),
+         bool_or(p.check_in IS NULL OR p.check_out IS NULL)
+  FROM _attendance_pairs p
+  GROUP BY p.emp_id, p.work_date;
+  GET DIAGNOSTICS v_days = ROW_COUNT;
+
+  RETURN jsonb_build_object('pairs', v_pairs, 'days', v_days);
+END;
+$$;
+
+-- Payroll runs (src/jobs/payroll_run.py): one row per employee and period, re-runs upsert the Draft rows
+ALTER TABLE payroll ADD COLUMN IF NOT EXISTS run_id TEXT;
+ALTER TABLE payroll ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT now();
+CREATE UNIQUE INDEX IF NOT EXISTS idx_payroll_emp_period ON payroll(emp_id, period_start, period_end);
+
+-- Function: attendance_period_summary
+-- Per-employee totals of attendance_daily for a payroll period, so the run never reads daily or raw rows.
+-- Set-returning: callers page it with PostgREST filters (emp_id=gt.…, order, limit).
+CREATE OR REPLACE FUNCTION attendance_period_summary(p_from DATE, p_to DATE)
+RETURNS TABLE (emp_id TEXT, days_present INTEGER, minutes_worked INTEGER, late_minutes INTEGER, incomplete_days INTEGER)
+LANGUAGE sql STABLE AS $$
+  SELECT d.emp_id, count(*)::INTEGER, sum(d.minutes_worked)::INTEGER, sum(d.late_minutes)::INTEGER,
+         count(*) FILTER (WHERE d.incomplete)::INTEGER
+  FROM attendance_daily d
+  WHERE d.work_date BETWEEN p_from AND p_to
+  GROUP BY d.emp_id;
+$$;
+
+-- Change feed (src/utils/change_feed.py): NOTIFY on every change that can move a request in or out of a task inbox
+-- or change the leave calendar (src/utils/leave_index.py).
+-- Payload: {"op", "id", "old": {...}|null, "new": {...}|null} with only the fields those two consumers need.
+CREATE OR REPLACE FUNCTION request_feed_fields(r requests) RETURNS JSONB
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT jsonb_build_object(
+    'id', r.id, 'emp_id', r.emp_id, 'emp_name', r.emp_name, 'dept', r.dept, 'service_type', r.service_type,
+    'sub_type', r.sub_type, 'start_date', r.start_date, 'end_date', r.end_date, 'substitute_id', r.substitute_id,
+    'status_substitute', r.status_substitute, 'status_manager', r.status_manager, 'status_hr', r.status_hr,
+    'final_status', r.final_status);
+$$;
+
+CREATE OR REPLACE FUNCTION notify_request_change() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM pg_notify('requests_changes', jsonb_build_object(
+    'op', TG_OP,
+    'id', COALESCE(NEW.id, OLD.id),
+    'old', CASE WHEN TG_OP <> 'INSERT' THEN request_feed_fields(OLD) END,
+    'new', CASE WHEN TG_OP <> 'DELETE' THEN request_feed_fields(NEW) END
+  )::TEXT);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_requests_notify_insert_delete ON requests;
+CREATE TRIGGER trg_requests_notify_insert_delete AFTER INSERT OR DELETE ON requests
+  FOR EACH ROW EXECUTE FUNCTION notify_request_change();
+DROP TRIGGER IF EXISTS trg_requests_notify_update ON requests;
+CREATE TRIGGER trg_requests_notify_update AFTER UPDATE ON requests
+  FOR EACH ROW
+  WHEN ((OLD.substitute_id, OLD.dept, OLD.status_substitute, OLD.status_manager, OLD.status_hr,
+         OLD.final_status, OLD.emp_id, OLD.emp_name, OLD.service_type, OLD.sub_type, OLD.start_date, OLD.end_date)
+        IS DISTINCT FROM (NEW.substitute_id, NEW.dept, NEW.status_substitute, NEW.status_manager, NEW.status_hr,
+         NEW.final_status, NEW.emp_id, NEW.emp_name, NEW.service_type, NEW.sub_type, NEW.start_date, NEW.end_date))
+  EXECUTE FUNCTION notify_request_change();
+
+-- Notification outbox (src/jobs/notification_worker.py): approval transitions queue messages in the same
+-- transaction as the status change; workers claim them with SKIP LOCKED and report back delivered / retry / dead.
+CREATE TABLE IF NOT EXISTS notification_outbox (
+  id BIGSERIAL PRIMARY KEY,
+  event TEXT NOT NULL,               -- substitute_decided / manager_decided / hr_decided / final
+  request_id BIGINT REFERENCES requests(id) ON DELETE CASCADE,
+  recipient_emp_id TEXT,
+  channel TEXT NOT NULL,             -- whatsapp / email
+  address TEXT NOT NULL,
+  payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+  status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sending', 'sent', 'dead')),
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  locked_until TIMESTAMPTZ,
+  last_error TEXT,
+  dedupe_key TEXT UNIQUE,
+  created_at TIMESTAMPTZ DEFAULT now(),
+  sent_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_due ON notification_outbox (channel, next_attempt_at)
+  WHERE status IN ('pending', 'sending');
+
+CREATE OR REPLACE FUNCTION enqueue_request_notifications() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_emp employees%ROWTYPE;
+  v_events TEXT[] := '{}';
+  v_event TEXT;
+BEGIN
+  IF NEW.status_substitute IS DISTINCT FROM OLD.status_substitute AND NEW.status_substitute IN ('Approved', 'Rejected') THEN
+    v_events := v_events || 'substitute_decided'::TEXT;
+  END IF;
+  IF NEW.status_manager IS DISTINCT FROM OLD.status_manager AND NEW.status_manager IN ('Approved', 'Rejected') THEN
+    v_events := v_events || 'manager_decided'::TEXT;
+  END IF;
+  IF NEW.status_hr IS DISTINCT FROM OLD.status_hr AND NEW.status_hr IN ('Approved', 'Rejected') THEN
+    v_events := v_events || 'hr_decided'::TEXT;
+  END IF;
+  -- القرار النهائي يغني عن إشعار المرحلة التي أنتجته (رسالة واحدة للموظف)
+  IF NEW.final_status IS DISTINCT FROM OLD.final_status AND NEW.final_status IN ('Approved', 'Rejected') THEN
+    v_events := ARRAY['final'];
+  END IF;
+  IF cardinality(v_events) = 0 THEN RETURN NULL; END IF;
+
+  SELECT * INTO v_emp FROM employees WHERE emp_id = NEW.emp_id;
+  FOREACH v_event IN ARRAY v_events LOOP
+    INSERT INTO notification_outbox (event, request_id, recipient_emp_id, channel, address, payload, dedupe_key)
+    SELECT v_event, NEW.id, NEW.emp_id, c.channel, c.address,
+           jsonb_build_object('emp_name', NEW.emp_name, 'service_type', NEW.service_type, 'sub_type', NEW.sub_type,
+                              'start_date', NEW.start_date, 'end_date', NEW.end_date, 'days', NEW.days, 'amount', NEW.amount,
+                              'status', CASE v_event WHEN 'substitute_decided' THEN NEW.status_substitute
+                                                     WHEN 'manager_decided' THEN NEW.status_manager
+                                                     WHEN 'hr_decided' THEN NEW.status_hr ELSE NEW.final_status END,
+                              'note', CASE v_event WHEN 'substitute_decided' THEN NEW.substitute_note
+                                                   WHEN 'manager_decided' THEN NEW.manager_note ELSE NEW.hr_note END),
+           NEW.id || ':' || v_event || ':' || c.channel
+    FROM (VALUES ('whatsapp', COALESCE(NULLIF(NEW.phone, ''), NULLIF(v_emp.phone, ''))),
+                 ('email', NULLIF(v_emp.email, ''))) AS c(channel, address)
+    WHERE c.address IS NOT NULL
+    ON CONFLICT (dedupe_key) DO NOTHING;
+  END LOOP;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_requests_enqueue_notifications ON requests;
+CREATE TRIGGER trg_requests_enqueue_notifications AFTER UPDATE ON requests
+  FOR EACH ROW
+  WHEN ((OLD.status_substitute, OLD.status_manager, OLD.status_hr, OLD.final_status)
+        IS DISTINCT FROM (NEW.status_substitute, NEW.status_manager, NEW.status_hr, NEW.final_status))
+  EXECUTE FUNCTION enqueue_request_notifications();
+
+-- Function: claim_notifications
+-- Lease up to p_limit due messages of one channel. Rows already leased by another worker are skipped (SKIP LOCKED);
+-- a worker that dies mid-send loses its lease after p_lease_seconds and the rows become claimable again.
+CREATE OR REPLACE FUNCTION claim_notifications(
+  p_channel TEXT,
+  p_limit INTEGER DEFAULT 50,
+  p_lease_seconds INTEGER DEFAULT 120
+) RETURNS JSONB
+LANGUAGE sql AS $$
+  WITH due AS (
+    SELECT o.id FROM notification_outbox o
+    WHERE o.channel = p_channel AND o.status IN ('pending', 'sending') AND o.next_attempt_at <= now()
+      AND (o.locked_until IS NULL OR o.locked_until < now())
+    ORDER BY o.next_attempt_at, o.id
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  ), claimed AS (
+    UPDATE notification_outbox o
+    SET status = 'sending', attempts = o.attempts + 1, locked_until = now() + make_interval(secs => p_lease_seconds)
+    FROM due WHERE o.id = due.id
+    RETURNING o.id, o.event, o.request_id, o.recipient_emp_id, o.channel, o.address, o.payload, o.attempts
+  )
+  SELECT COALESCE(jsonb_agg(to_jsonb(c) ORDER BY c.id), '[]'::jsonb) FROM claimed c;
+$$;
+
+-- Function: complete_notifications
+-- p_results: [{id, ok, error, retry_in (seconds) | null = dead}]. Only rows still in 'sending' are touched.
+CREATE OR REPLACE FUNCTION complete_notifications(p_results JSONB) RETURNS JSONB
+LANGUAGE sql AS $$
+  WITH res AS (
+    SELECT (x->>'id')::BIGINT AS id, COALESCE((x->>'ok')::BOOLEAN, false) AS ok, x->>'error' AS error,
+           (x->>'retry_in')::NUMERIC AS retry_in
+    FROM jsonb_array_elements(p_results) x
+  ), done AS (
+    UPDATE notification_outbox o
+    SET status = CASE WHEN res.ok THEN 'sent' WHEN res.retry_in IS NULL THEN 'dead' ELSE 'pending' END,
+        sent_at = CASE WHEN res.ok THEN now() END,
+        next_attempt_at = CASE WHEN NOT res.ok AND res.retry_in IS NOT NULL
+                               THEN now() + make_interval(secs => res.retry_in) ELSE o.next_attempt_at END,
+        last_error = CASE WHEN res.ok THEN o.last_error ELSE res.error END,
+        locked_until = NULL
+    FROM res WHERE o.id = res.id AND o.status = 'sending'
+    RETURNING o.status
+  )
+  SELECT jsonb_build_object(
+    'sent', count(*) FILTER (WHERE status = 'sent'),
+    'retry', count(*) FILTER (WHERE status = 'pending'),
+    'dead', count(*) FILTER (WHERE status = 'dead'))
+  FROM done;
+$$;
+
+-- ==============================
+-- Audit log partitions
+-- ==============================
+-- One partition per month (audit_logs_YYYY_MM); audit_logs_default only catches rows outside the created months.
+-- Lookups by request and by actor use the per-partition indexes below. Months older than the hot window are
+-- exported to Parquet and detached by src/jobs/archive_audit_logs.py; src/utils/audit_archive.py merges both.
+CREATE INDEX IF NOT EXISTS idx_audit_logs_target ON audit_logs(target_request_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_actor ON audit_logs(actor_emp_id, created_at);
+
+-- Function: ensure_audit_partition
+-- Creates the partition for p_month. Rows of that month already in the default partition are moved into it
+-- before it is attached (ATTACH fails while the default partition holds rows of the new range).
+CREATE OR REPLACE FUNCTION ensure_audit_partition(p_month DATE) RETURNS TEXT
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_from DATE := date_trunc('month', p_month)::DATE;
+  v_to DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::DATE;
+  v_name TEXT := 'audit_logs_' || to_char(p_month, 'YYYY_MM');
+BEGIN
+  IF to_regclass(v_name) IS NOT NULL THEN RETURN v_name; END IF;
+  EXECUTE format('CREATE TABLE %I (LIKE audit_logs INCLUDING DEFAULTS)', v_name);
+  EXECUTE format('WITH moved AS (DELETE FROM audit_logs_default WHERE created_at >= %L AND created_at < %L RETURNING *)
+                  INSERT INTO %I SELECT * FROM moved', v_from, v_to, v_name);
+  EXECUTE format('ALTER TABLE audit_logs ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', v_name, v_from, v_to);
+  RETURN v_name;
+END;
+$$;
+
+-- Function: ensure_audit_partitions
+-- This month plus p_months_ahead future months (run from the archive job / cron so inserts never hit the default),
+-- plus a partition for every month that already has rows in the default partition.
+CREATE OR REPLACE FUNCTION ensure_audit_partitions(p_months_ahead INT DEFAULT 3) RETURNS JSONB
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_months DATE[];
+  v_names TEXT[] := '{}';
+  m DATE;
+BEGIN
+  SELECT array_agg(x ORDER BY x) INTO v_months FROM (
+    SELECT (date_trunc('month', now()) + make_interval(months => g))::DATE AS x FROM generate_series(0, p_months_ahead) g
+    UNION
+    SELECT DISTINCT date_trunc('month', created_at)::DATE FROM audit_logs_default
+  ) t;
+  FOREACH m IN ARRAY v_months LOOP
+    v_names := v_names || ensure_audit_partition(m);
+  END LOOP;
+  RETURN to_jsonb(v_names);
+END;
+$$;
+
+-- Function: audit_partitions
+-- Attached monthly partitions, oldest first: [{name, month, from, to}].
+CREATE OR REPLACE FUNCTION audit_partitions() RETURNS JSONB
+LANGUAGE sql STABLE AS $$
+  SELECT COALESCE(jsonb_agg(jsonb_build_object(
+           'name', c.relname, 'month', to_char(p.month, 'YYYY-MM'),
+           'from', p.month, 'to', (p.month + INTERVAL '1 month')::DATE) ORDER BY p.month), '[]'::jsonb)
+  FROM pg_inherits i
+  JOIN pg_class c ON c.oid = i.inhrelid
+  CROSS JOIN LATERAL (SELECT to_date(substr(c.relname, 12), 'YYYY_MM') AS month) p
+  WHERE i.inhparent = 'audit_logs'::regclass AND c.relname ~ '^audit_logs_\d{4}_\d{2}$';
+$$;
+
+-- Function: detach_audit_partition
+-- Called after the month was written to the archive: the row count must match what was archived,
+-- then the partition is detached and dropped.
+CREATE OR REPLACE FUNCTION detach_audit_partition(p_name TEXT, p_rows BIGINT) RETURNS JSONB
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_rows BIGINT;
+BEGIN
+  IF p_name !~ '^audit_logs_\d{4}_\d{2}$' OR NOT EXISTS (
+       SELECT 1 FROM pg_inherits WHERE inhparent = 'audit_logs'::regclass AND inhrelid = to_regclass(p_name)) THEN
+    RAISE EXCEPTION 'not an audit_logs partition: %', p_name;
+  END IF;
+  EXECUTE format('SELECT count(*) FROM %I', p_name) INTO v_rows;
+  IF v_rows <> p_rows THEN
+    RAISE EXCEPTION 'partition % has % rows, archive has %', p_name, v_rows, p_rows;
+  END IF;
+  EXECUTE format('ALTER TABLE audit_logs DETACH PARTITION %I', p_name);
+  EXECUTE format('DROP TABLE %I', p_name);
+  RETURN jsonb_build_object('name', p_name, 'rows', v_rows);
+END;
+$$;
+
+-- Rows of an older unpartitioned audit_logs (renamed at the top of this file) move into their monthly partitions.
+DO $$
+DECLARE
+  m DATE;
+BEGIN
+  IF to_regclass('audit_logs_unpartitioned') IS NULL THEN RETURN; END IF;
+  FOR m IN SELECT DISTINCT date_trunc('month', COALESCE(created_at, now()))::DATE FROM audit_logs_unpartitioned LOOP
+    PERFORM ensure_audit_partition(m);
+  END LOOP;
+  INSERT INTO audit_logs (id, actor_emp_id, actor_name, action, target_request_id, note, created_at, event_id)
+  SELECT id, actor_emp_id, actor_name, action, target_request_id, note, COALESCE(created_at, now()), event_id
+  FROM audit_logs_unpartitioned;
+  PERFORM setval(pg_get_serial_sequence('audit_logs', 'id'), GREATEST((SELECT max(id) FROM audit_logs), 1));
+  DROP TABLE audit_logs_unpartitioned;
+END $$;
+
+SELECT ensure_audit_partitions(3);
+
+-- ==============================
+-- Request search (Arabic-normalized full text)
+-- ==============================
+-- request_search holds one normalized document per request (name, emp_id, service/sub type, details, the three notes),
+-- kept in sync by a trigger. Words match by prefix through the tsvector; with pg_trgm installed, misspellings
+-- also match through word similarity. src/utils/search.py mirrors ar_search_text for highlighting.
+
+-- Function: ar_normalize
+-- Strips diacritics (harakat, superscript alef) and tatweel, unifies alef/hamza forms, taa marbuta -> haa,
+-- alef maqsura -> yaa, Arabic-Indic digits -> ASCII, lowercases Latin.
+CREATE OR REPLACE FUNCTION ar_normalize(p_text TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT lower(translate(regexp_replace(COALESCE(p_text, ''), '[\u064B-\u065F\u0670\u0640]', '', 'g'),
+                         'أإآٱىةؤئ٠١٢٣٤٥٦٧٨٩', 'اااايهوي0123456789'));
+$$;
+
+-- Function: ar_search_text
+-- ar_normalize plus light stemming of the definite article and attached prefixes (ال، وال، بال، كال، فال، لل),
+-- applied to both the indexed document and the query so "المستشفى" and "مستشفى" meet.
+CREATE OR REPLACE FUNCTION ar_search_text(p_text TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT regexp_replace(ar_normalize(p_text), '(^|\s)(وال|بال|كال|فال|لل|ال)(\S{2,})', '\1\3', 'g');
+$$;
+
+-- dept / final_status / created_at are copied so filtering and ranking never touch requests; only the page is joined.
+CREATE TABLE IF NOT EXISTS request_search (
+  request_id BIGINT PRIMARY KEY REFERENCES requests(id) ON DELETE CASCADE,
+  dept TEXT,
+  final_status TEXT,
+  created_at TIMESTAMPTZ,
+  doc TEXT NOT NULL,
+  tsv TSVECTOR NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_request_search_tsv ON request_search USING GIN (tsv);
+
+DO $$
+BEGIN
+  CREATE EXTENSION IF NOT EXISTS pg_trgm;
+  CREATE INDEX IF NOT EXISTS idx_request_search_trgm ON request_search USING GIN (doc gin_trgm_ops);
+EXCEPTION WHEN OTHERS THEN
+  RAISE NOTICE 'pg_trgm not available, request search runs without fuzzy matching: %', SQLERRM;
+END $$;
+
+-- Function: request_search_upsert
+-- Name and employee number weigh most (A), then service type and sub type (B), then free text and notes (C).
+CREATE OR REPLACE FUNCTION request_search_upsert(r requests) RETURNS VOID
+LANGUAGE sql AS $$
+  INSERT INTO request_search (request_id, dept, final_status, created_at, doc, tsv)
+  SELECT r.id, r.dept, r.final_status, r.created_at, ar_search_text(concat_ws(' ', r.emp_name, r.emp_id, r.service_type, r.sub_type, r.details,
+                                        r.substitute_note, r.manager_note, r.hr_note)),
+         setweight(to_tsvector('simple', ar_search_text(concat_ws(' ', r.emp_name, r.emp_id))), 'A') ||
+         setweight(to_tsvector('simple', ar_search_text(concat_ws(' ', r.service_type, r.sub_type))), 'B') ||
+         setweight(to_tsvector('simple', ar_search_text(concat_ws(' ', r.details, r.substitute_note, r.manager_note, r.hr_note))), 'C')
+  ON CONFLICT (request_id) DO UPDATE SET dept = EXCLUDED.dept, final_status = EXCLUDED.final_status,
+                                         created_at = EXCLUDED.created_at, doc = EXCLUDED.doc, tsv = EXCLUDED.tsv;
+$$;
+
+CREATE OR REPLACE FUNCTION request_search_trigger() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM request_search_upsert(NEW);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_requests_search_insert ON requests;
+CREATE TRIGGER trg_requests_search_insert
+AFTER INSERT ON requests
+FOR EACH ROW EXECUTE FUNCTION request_search_trigger();
+
+DROP TRIGGER IF EXISTS trg_requests_search_update ON requests;
+CREATE TRIGGER trg_requests_search_update
+AFTER UPDATE ON requests
+FOR EACH ROW
+WHEN (OLD.emp_name IS DISTINCT FROM NEW.emp_name OR OLD.emp_id IS DISTINCT FROM NEW.emp_id
+      OR OLD.dept IS DISTINCT FROM NEW.dept OR OLD.final_status IS DISTINCT FROM NEW.final_status
+      OR OLD.created_at IS DISTINCT FROM NEW.created_at OR OLD.service_type IS DISTINCT FROM NEW.service_type OR OLD.sub_type IS DISTINCT FROM NEW.sub_type
+      OR OLD.details IS DISTINCT FROM NEW.details
+      OR OLD.substitute_note IS DISTINCT FROM NEW.substitute_note OR OLD.manager_note IS DISTINCT FROM NEW.manager_note
+      OR OLD.hr_note IS DISTINCT FROM NEW.hr_note)
+EXECUTE FUNCTION request_search_trigger();
+
+-- Backfill requests that predate the index (no-op once populated).
+SELECT count(request_search_upsert(r)) FROM requests r
+WHERE NOT EXISTS (SELECT 1 FROM request_search s WHERE s.request_id = r.id);
+
+-- Function: search_requests
+-- Every query word matches as a prefix (AND); ranked by ts_rank_cd (+ word similarity with pg_trgm), then newest.
+-- Filters: dept, final status, created_at date range. Returns {total, rows: [...]} for one page.
+CREATE OR REPLACE FUNCTION search_requests(p_query TEXT, p_dept TEXT DEFAULT NULL, p_status TEXT DEFAULT NULL,
+                                           p_from DATE DEFAULT NULL, p_to DATE DEFAULT NULL,
+                                           p_limit INT DEFAULT 20, p_offset INT DEFAULT 0) RETURNS JSONB
+LANGUAGE plpgsql STABLE AS $$
+DECLARE
+  v_norm TEXT := ar_search_text(p_query);
+  v_query TSQUERY;
+  v_fuzzy BOOLEAN := EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm');
+  v_result JSONB;
+BEGIN
+  -- same tokenizer as the index: "اجازه مرض" -> 'اجازه':* & 'مرض':*
+  SELECT string_agg(quote_literal(t.lexeme) || ':*', ' & ')::TSQUERY INTO v_query
+  FROM unnest(to_tsvector('simple', v_norm)) t;
+  IF v_query IS NULL THEN RETURN jsonb_build_object('total', 0, 'rows', '[]'::jsonb); END IF;
+
+  EXECUTE format($q$
+    WITH hits AS (
+      SELECT s.request_id, ts_rank_cd(s.tsv, $1) %s AS rank
+      FROM request_search s
+      WHERE (s.tsv @@ $1 %s)
+        AND ($2::TEXT IS NULL OR s.dept = $2) AND ($3::TEXT IS NULL OR s.final_status = $3)
+        AND ($4::DATE IS NULL OR s.created_at >= $4) AND ($5::DATE IS NULL OR s.created_at < $5 + 1)
+    ), page AS (
+      SELECT request_id, rank FROM hits ORDER BY rank DESC, request_id DESC LIMIT $6 OFFSET $7
+    )
+    SELECT jsonb_build_object(
+      'total', (SELECT count(*) FROM hits),
+      'rows', COALESCE((
+        SELECT jsonb_agg(to_jsonb(x) ORDER BY x.rank DESC, x.id DESC)
+        FROM (
+          SELECT r.id, r.emp_id, r.emp_name, r.dept, r.service_type, r.sub_type, r.final_status, r.start_date, r.end_date,
+                 r.created_at, left(r.details, 200) AS details, r.manager_note, r.hr_note, round(p.rank::NUMERIC, 4) AS rank
+          FROM page p JOIN requests r ON r.id = p.request_id
+        ) x), '[]'::jsonb))$q$,
+    CASE WHEN v_fuzzy THEN '+ word_similarity($8, s.doc)' ELSE '' END,
+    CASE WHEN v_fuzzy THEN 'OR $8 <% s.doc' ELSE '' END)
+  INTO v_result
+  USING v_query, p_dept, p_status, p_from, p_to, p_limit, p_offset, v_norm;
+  RETURN v_result;
+END;
+$$;
+
+-- ==============================
+-- Request scoring (ai_analyses)
+-- ==============================
+-- src/jobs/score_requests.py scores pending requests from the features returned by score_candidates and
+-- stores one row per request. input_hash is a hash of the features and the model version: when it matches,
+-- the request is only marked as checked and not scored again.
+ALTER TABLE ai_analyses ADD COLUMN IF NOT EXISTS input_hash TEXT;
+ALTER TABLE ai_analyses ADD COLUMN IF NOT EXISTS model TEXT;
+ALTER TABLE ai_analyses ADD COLUMN IF NOT EXISTS checked_at TIMESTAMPTZ DEFAULT now();
+DELETE FROM ai_analyses a USING ai_analyses b WHERE a.request_id = b.request_id AND a.id < b.id;
+DROP INDEX IF EXISTS idx_ai_request_id;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ai_analyses_request ON ai_analyses(request_id);
+
+-- Function: score_candidates
+-- Pending requests never analysed, changed since their last check, or last checked more than p_recheck_seconds
+-- ago (balance, overlaps and attendance move without the request changing), with their features.
+-- p_after_id is the pass cursor: a worker pass walks ids upwards so each request is visited once per pass.
+CREATE OR REPLACE FUNCTION score_candidates(p_limit INT DEFAULT 200, p_recheck_seconds INT DEFAULT 21600,
+                                            p_after_id BIGINT DEFAULT 0) RETURNS JSONB
+LANGUAGE sql STABLE AS $$
+  SELECT COALESCE(jsonb_agg(to_jsonb(c) ORDER BY c.id), '[]'::jsonb)
+  FROM (
+    SELECT r.id, r.emp_id, r.dept, r.service_type, r.sub_type, r.days, r.amount, r.start_date, r.end_date,
+           r.created_at::DATE AS submitted_on, a.input_hash,
+           b.annual_balance AS balance, e.salary, e.hire_date,
+           (SELECT count(*) FROM requests o
+            WHERE o.emp_id = r.emp_id AND o.id <> r.id AND o.service_type = 'إجازة'
+              AND o.final_status IN ('Pending', 'Approved') AND o.start_date <= r.end_date AND o.end_date >= r.start_date) AS own_overlaps,
+           (SELECT count(DISTINCT o.emp_id) FROM requests o
+            WHERE o.dept = r.dept AND o.emp_id <> r.emp_id AND o.service_type = 'إجازة'
+              AND o.final_status IN ('Pending', 'Approved') AND o.start_date <= r.end_date AND o.end_date >= r.start_date) AS dept_on_leave,
+           (SELECT count(*) FROM employees d WHERE d.dept = r.dept) AS dept_headcount,
+           (SELECT count(*) FROM requests o
+            WHERE o.emp_id = r.emp_id AND o.id <> r.id AND o.final_status = 'Rejected'
+              AND o.created_at >= r.created_at - INTERVAL '365 days') AS rejected_365,
+           att.worked_days_90, att.late_days_90, att.incomplete_days_90
+    FROM requests r
+    LEFT JOIN ai_analyses a ON a.request_id = r.id
+    LEFT JOIN leave_balance_snapshots b ON b.emp_id = r.emp_id
+    LEFT JOIN employees e ON e.emp_id = r.emp_id
+    CROSS JOIN LATERAL (
+      SELECT count(*) AS worked_days_90, count(*) FILTER (WHERE ad.late_minutes > 0) AS late_days_90,
+             count(*) FILTER (WHERE ad.incomplete) AS incomplete_days_90
+      FROM attendance_daily ad
+      WHERE ad.emp_id = r.emp_id AND ad.work_date >= r.created_at::DATE - 90 AND ad.work_date <= r.created_at::DATE
+    ) att
+    WHERE r.final_status = 'Pending' AND r.id > p_after_id
+      AND (a.id IS NULL OR a.checked_at < r.updated_at OR a.checked_at < now() - make_interval(secs => p_recheck_seconds))
+    ORDER BY r.id
+    LIMIT p_limit
+  ) c;
+$$;
+
+-- Function: save_request_scores
+-- p_results: [{request_id, input_hash, model, score, summary, details}]; entries without score mean
+-- "features unchanged" and only refresh checked_at.
+CREATE OR REPLACE FUNCTION save_request_scores(p_results JSONB) RETURNS JSONB
+LANGUAGE sql AS $$
+  WITH res AS (
+    SELECT * FROM jsonb_to_recordset(p_results)
+      AS x(request_id BIGINT, input_hash TEXT, model TEXT, score NUMERIC, summary TEXT, details JSONB)
+  ), scored AS (
+    INSERT INTO ai_analyses (request_id, input_hash, model, score, summary, details, created_at, checked_at)
+    SELECT res.request_id, res.input_hash, res.model, res.score, res.summary, res.details, now(), now()
+    FROM res JOIN requests r ON r.id = res.request_id
+    WHERE res.score IS NOT NULL
+    ON CONFLICT (request_id) DO UPDATE SET
+      input_hash = EXCLUDED.input_hash, model = EXCLUDED.model, score = EXCLUDED.score, summary = EXCLUDED.summary,
+      details = EXCLUDED.details, created_at = now(), checked_at = now()
+    RETURNING 1
+  ), unchanged AS (
+    UPDATE ai_analyses a SET checked_at = now()
+    FROM res WHERE res.score IS NULL AND a.request_id = res.request_id AND a.input_hash = res.input_hash
+    RETURNING 1
+  )
+  SELECT jsonb_build_object('scored', (SELECT count(*) FROM scored), 'unchanged', (SELECT count(*) FROM unchanged));
+$$;
@@ -0,0 +1,52 @@
+# src/jobs/archive_audit_logs.py
+# Moves audit_logs months older than the hot window to compressed Parquet files and detaches their partitions
+#
+#   python -m src.jobs.archive_audit_logs                          # الأشهر الأقدم من HR_AUDIT_HOT_MONTHS (24)
+#   python -m src.jobs.archive_audit_logs --hot-months 12 --dry-run
+#
+# يُشغَّل شهرياً (cron). ينشئ أيضاً أقسام الأشهر القادمة. لكل شهر قديم: قراءة كاملة -> ملف Parquet (مع تحقق)
+# -> detach_audit_partition الذي يرفض الفصل إن اختلف عدد الصفوف عما كُتب. الملفات تُحفظ طوال مدة الاحتفاظ (5 سنوات).
+
+import argparse
+import os
+from datetime import date
+
+from src.utils.audit_archive import ARCHIVE_DIR, fetch_month, write_month
+
+HOT_MONTHS = int(os.environ.get("HR_AUDIT_HOT_MONTHS", "24"))
+MONTHS_AHEAD = 3
+
+def cutoff_month(today: date, hot_months: int) -> date:
+    """أول يوم في أقدم شهر يبقى حياً."""
+    n = today.year * 12 + today.month - 1 - hot_months
+    return date(n // 12, n % 12 + 1, 1)
+
+def archive_audit_logs(supabase, hot_months=HOT_MONTHS, directory=ARCHIVE_DIR, dry_run=False, today=None) -> list:
+    """يعيد [{name, month, rows, path}] للأشهر المؤرشفة."""
+    supabase.rpc("ensure_audit_partitions", {"p_months_ahead": MONTHS_AHEAD}).execute()
+    cutoff = str(cutoff_month(today or date.today(), hot_months))
+    done = []
+    for p in supabase.rpc("audit_partitions").execute().data or []:
+        if p["to"] > cutoff: continue
+        rows = fetch_month(supabase, p["from"], p["to"])
+        path = None
+        if not dry_run:
+            path = write_month(rows, p["month"], directory)
+            supabase.rpc("detach_audit_partition", {"p_name": p["name"], "p_rows": len(rows)}).execute()
+        done.append({"name": p["name"], "month": p["month"], "rows": len(rows), "path": path})
+    return done
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Archive old audit_logs partitions to Parquet and detach them")
+    ap.add_argument("--hot-months", type=int, default=HOT_MONTHS, help="months kept in the database")
+    ap.add_argument("--dir", default=ARCHIVE_DIR, help="archive directory")
+    ap.add_argument("--dry-run", action="store_true", help="only report what would be archived")
+    args = ap.parse_args(argv)
+
+    from src.utils.db import connect
+    done = archive_audit_logs(connect(), args.hot_months, args.dir, args.dry_run)
+    for d in done: print(f"{d['month']}: {d['rows']} rows" + (f" -> {d['path']}" if d["path"] else " (dry run)"))
+    print(f"archived months: {len(done)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+# src/jobs/attendance_ingest.py
+# Attendance ingestion service: gate punches from a file drop or a local HTTP endpoint -> attendance_events
+#
+#   python -m src.jobs.attendance_ingest serve --port 8765 --drop-dir attendance_inbox
+#   python -m src.jobs.attendance_ingest file punches_2025-03-02.csv
+#
+#   POST /events  [{"emp_id": "1001", "ts": "2025-03-02T08:01:12+03:00", "type": "in", "source": "gate-1"}, ...]
+#                 (أو {"source": "gate-1", "events": [...]} أو JSON lines)
+#
+# كل دفعة تُكتب فوراً بـ upsert يتجاهل المكرر على (emp_id, event_ts, source) ثم يُرد على الجهاز، لذلك إعادة
+# الإرسال من الجهاز آمنة. الأيام التي وصلتها بصمات تُضغط دورياً (compact_attendance) إلى attendance و attendance_daily.
+
+import argparse
+import csv
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from zoneinfo import ZoneInfo
+
+from postgrest.types import ReturnMethod
+
+from src.jobs.compact_attendance import compact_attendance, ATTENDANCE_TZ
+
+INGEST_CHUNK_SIZE = 5000
+COMPACT_INTERVAL = 60   # ثوانٍ
+DROP_POLL_INTERVAL = 5  # ثوانٍ
+DROP_SETTLE_SECONDS = 2  # لا يُقرأ ملف ما زال يُكتب
+MAX_BODY_BYTES = 20 * 1024 * 1024
+INGEST_TOKEN = os.environ.get("HR_ATTENDANCE_TOKEN")
+
+EVENT_TYPES = {
+    "in": "in", "i": "in", "check_in": "in", "checkin": "in", "دخول": "in", "0": "in",
+    "out": "out", "o": "out", "check_out": "out", "checkout": "out", "خروج": "out", "1": "out",
+}
+
+class EventError(ValueError):
+    pass
+
+def _first(rec, *keys):
+    for k in keys:
+        if rec.get(k) not in (None, ""): return rec[k]
+    return None
+
+def normalize_event(rec: dict, tz, default_source="") -> dict:
+    """يحوّل بصمة الجهاز إلى صف attendance_events. الوقت بلا منطقة زمنية يُعتبر بتوقيت الشركة."""
+    emp_id = str(_first(rec, "emp_id", "badge", "user_id") or "").strip()
+    if emp_id.endswith(".0"): emp_id = emp_id[:-2]
+    if not emp_id: raise EventError("emp_id مفقود")
+    raw_ts = _first(rec, "ts", "timestamp", "event_ts", "time")
+    try:
+        if isinstance(raw_ts, (int, float)) or str(raw_ts).isdigit():
+            ts = datetime.fromtimestamp(float(raw_ts), timezone.utc)
+        else:
+            ts = datetime.fromisoformat(str(raw_ts).strip())
+    except (TypeError, ValueError):
+        raise EventError(f"وقت غير صالح: {raw_ts}")
+    if ts.tzinfo is None: ts = ts.replace(tzinfo=tz)
+    kind = EVENT_TYPES.get(str(_first(rec, "type", "event_type", "direction") or "").strip().lower())
+    if not kind: raise EventError(f"نوع غير معروف: {_first(rec, 'type', 'event_type', 'direction')}")
+    source = str(_first(rec, "source", "device", "device_id") or default_source)
+    return {"emp_id": emp_id, "event_ts": ts.isoformat(), "event_type": kind, "source": source}
+
+class AttendanceIngestor:
+    def __init__(self, supabase, tz=ATTENDANCE_TZ, chunk_size=INGEST_CHUNK_SIZE, compact_interval=COMPACT_INTERVAL):
+        self.supabase = supabase
+        self.tz_name = tz
+        self.tz = ZoneInfo(tz)
+        self.chunk_size = chunk_size
+        self.compact_interval = compact_interval
+        self._dirty = set()  # أيام العمل (بتوقيت الشركة) التي وصلتها بصمات ولم تُضغط بعد
+        self._dirty_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.received = self.written = self.duplicates = self.rejected = 0
+
+    def ingest(self, records, default_source="") -> dict:
+        """يكتب دفعة بصمات. يعيد {accepted, duplicates, rejected: [(index, msg)]}؛
+        duplicates هنا المكرر داخل الدفعة فقط (المكرر مع القاعدة يتجاهله الـ upsert)."""
+        rows, keys, rejected, days = [], set(), [], set()
+        for i, rec in enumerate(records):
+            try:
+                row = normalize_event(rec, self.tz, default_source)
+            except EventError as e:
+                rejected.append((i, str(e))); continue
+            key = (row["emp_id"], row["event_ts"], row["source"])
+            if key in keys: continue
+            keys.add(key); rows.append(row)
+            day = datetime.fromisoformat(row["event_ts"]).astimezone(self.tz).date()
+            days.add(day)
+            # خروج بعد منتصف الليل قد يُكمل وردية بدأت في اليوم السابق (الزوج ينتمي ليوم الدخول)
+            if row["event_type"] == "out": days.add(day - timedelta(days=1))
+        for i in range(0, len(rows), self.chunk_size):
+            self.supabase.table("attendance_events").upsert(
+                rows[i:i + self.chunk_size], on_conflict="emp_id,event_ts,source", ignore_duplicates=True,
+                returning=ReturnMethod.minimal).execute()
+        with self._dirty_lock:
+            self._dirty |= days
+            self.received += len(records); self.written += len(rows)
+            self.duplicates += len(records) - len(rows) - len(rejected); self.rejected += len(rejected)
+        return {"accepted": len(rows), "duplicates": len(records) - len(rows) - len(rejected), "rejected": rejected}
+
+    # ------------------------------
+    # الضغط الدوري
+    # ------------------------------
+    def compact_dirty(self) -> dict:
+        """يضغط الأيام المتأثرة (كل مجموعة أيام متتالية باستدعاء واحد)."""
+        with self._compact_lock:
+            with self._dirty_lock:
+                days, self._dirty = sorted(self._dirty), set()
+            total = {"pairs": 0, "days": 0}
+            try:
+                while days:
+                    start = end = days.pop(0)
+                    while days and days[0] == end + timedelta(days=1): end = days.pop(0)
+                    res = compact_attendance(self.supabase, start, end, self.tz_name)
+                    for k in total: total[k] += res.get(k, 0)
+            except Exception:
+                with self._dirty_lock: self._dirty |= set(days) | {d for d in _range(start, end)}
+                raise
+            return total
+
+    def _compactor(self):
+        while not self._stop.wait(self.compact_interval):
+            try: self.compact_dirty()
+            except Exception as e: print("attendance compaction error:", e)
+
+    def start(self):
+        threading.Thread(target=self._compactor, name="attendance-compactor", daemon=True).start()
+
+    def close(self):
+        self._stop.set()
+        self.compact_dirty()
+
+    def stats(self):
+        with self._dirty_lock:
+            return {"received": self.received, "written": self.written, "duplicates": self.duplicates,
+                    "rejected": self.rejected, "dirty_days": [str(d) for d in sorted(self._dirty)]}
+
+def _range(start: date, end: date):
+    while start <= end:
+        yield start; start += timedelta(days=1)
+
+# ------------------------------
+# الملفات (CSV / JSON / JSON lines)
+# ------------------------------
+def read_records(f, name: str):
+    if name.endswith(".csv"):
+        yield from csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig"))
+    elif name.endswith(".json"):
+        data = json.load(f)
+        yield from (data.get("events", []) if isinstance(data, dict) else data)
+    else:
+        for line in io.TextIOWrapper(f, encoding="utf-8"):
+            if line.strip(): yield json.loads(line)
+
+def ingest_file(ingestor: AttendanceIngestor, path: str) -> dict:
+    """يقرأ الملف على دفعات بحجم chunk_size (لا يُحمَّل كاملاً في الذاكرة)."""
+    total = {"accepted": 0, "duplicates": 0, "rejected": []}
+    source = os.path.splitext(os.path.basename(path))[0]
+    def add(batch, offset):
+        res = ingestor.ingest(batch, default_source=source)
+        total["accepted"] += res["accepted"]; total["duplicates"] += res["duplicates"]
+        total["rejected"] += [(offset + i, msg) for i, msg in res["rejected"]]
+    with open(path, "rb") as f:
+        batch, offset = [], 0
+        for rec in read_records(f, path):
+            batch.append(rec)
+            if len(batch) >= ingestor.chunk_size:
+                add(batch, offset); offset += len(batch); batch = []
+        if batch: add(batch, offset)
+    return total
+
+def watch_drop_dir(ingestor: AttendanceIngestor, drop_dir: str, stop: threading.Event, poll=DROP_POLL_INTERVAL):
+    """ينقل كل ملف بعد استيراده إلى processed/ (أو failed/ عند الخطأ) مع ملف .rejected.jsonl للأسطر المرفوضة."""
+    done_dir, failed_dir = os.path.join(drop_dir, "processed"), os.path.join(drop_dir, "failed")
+    os.makedirs(done_dir, exist_ok=True); os.makedirs(failed_dir, exist_ok=True)
+    while not stop.is_set():
+        for name in sorted(os.listdir(drop_dir)):
+            path = os.path.join(drop_dir, name)
+            if not name.endswith((".csv", ".json", ".jsonl")) or not os.path.isfile(path): continue
+            if time.time() - os.path.getmtime(path) < DROP_SETTLE_SECONDS: continue
+            try:
+                res = ingest_file(ingestor, path)
+            except Exception as e:
+                print(f"attendance drop {name}: {e}")
+                shutil.move(path, os.path.join(failed_dir, name)); continue
+            if res["rejected"]:
+                with open(os.path.join(done_dir, name + ".rejected.jsonl"), "w", encoding="utf-8") as out:
+                    for i, msg in res["rejected"]: out.write(json.dumps({"row": i, "error": msg}, ensure_ascii=False) + "\n")
+            shutil.move(path, os.path.join(done_dir, name))
+            print(f"attendance drop {name}: +{res['accepted']} dup={res['duplicates']} rejected={len(res['rejected'])}")
+        stop.wait(poll)
+
+# ------------------------------
+# HTTP المحلي
+# ------------------------------
+def make_handler(ingestor: AttendanceIngestor):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers(); self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health": self._reply(200, ingestor.stats())
+            else: self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/events": return self._reply(404, {"error": "not found"})
+            if INGEST_TOKEN and self.headers.get("X-Token") != INGEST_TOKEN: return self._reply(401, {"error": "unauthorized"})
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES: return self._reply(413, {"error": "batch too large"})
+            body = self.rfile.read(length)
+            try:
+                text = body.decode("utf-8")
+                try: payload = json.loads(text)
+                except ValueError: payload = [json.loads(l) for l in text.splitlines() if l.strip()]
+            except ValueError as e:
+                return self._reply(400, {"error": f"invalid body: {e}"})
+            if isinstance(payload, dict) and "events" in payload: records, source = payload["events"], payload.get("source", "")
+            else: records, source = (payload if isinstance(payload, list) else [payload]), ""
+            try:
+                res = ingestor.ingest(records, default_source=source)
+            except Exception as e:
+                # لم يُحفظ شيء مؤكد: الجهاز يعيد الإرسال والمكرر يُتجاهل
+                return self._reply(503, {"error": str(e)})
+            self._reply(200, {"accepted": res["accepted"], "duplicates": res["duplicates"],
+                              "rejected": [{"index": i, "error": msg} for i, msg in res["rejected"]]})
+
+        def log_message(self, fmt, *args):
+            pass
+    return Handler
+
+def serve(ingestor: AttendanceIngestor, host="127.0.0.1", port=8765, drop_dir=None):
+    stop = threading.Event()
+    ingestor.start()
+    if drop_dir:
+        os.makedirs(drop_dir, exist_ok=True)
+        threading.Thread(target=watch_drop_dir, args=(ingestor, drop_dir, stop), name="attendance-drop", daemon=True).start()
+    server = ThreadingHTTPServer((host, port), make_handler(ingestor))
+    print(f"attendance ingest on http://{host}:{port}/events" + (f", watching {drop_dir}" if drop_dir else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set(); server.server_close(); ingestor.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Ingest attendance punches (HTTP endpoint, drop directory or files)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("serve")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8765)
+    s.add_argument("--drop-dir")
+    f = sub.add_parser("file")
+    f.add_argument("paths", nargs="+")
+    args = ap.parse_args(argv)
+
+    from src.utils.db import connect
+    ingestor = AttendanceIngestor(connect())
+    if args.cmd == "serve":
+        serve(ingestor, args.host, args.port, args.drop_dir)
+        return
+    for path in args.paths:
+        res = ingest_file(ingestor, path)
+        print(f"{path}: +{res['accepted']} dup={res['duplicates']} rejected={len(res['rejected'])}")
+        for i, msg in res["rejected"][:20]: print(f"  row {i}: {msg}")
+    print(ingestor.compact_dirty())
+
+if __name__ == "__main__":
+    main()
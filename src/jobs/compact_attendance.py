@@ -0,0 +1,29 @@
+# src/jobs/compact_attendance.py
+# Rolls raw gate punches (attendance_events) into check-in/check-out pairs and per-employee daily summaries
+#
+#   python -m src.jobs.compact_attendance --from 2025-03-01 --to 2025-03-31
+#
+# يعمل تلقائياً من خدمة الاستقبال للأيام التي وصلتها بصمات جديدة؛ هذا الأمر للتشغيل اليدوي أو الدوري.
+
+import argparse
+import os
+from datetime import date, timedelta
+
+ATTENDANCE_TZ = os.environ.get("HR_TIMEZONE", "Asia/Riyadh")
+
+def compact_attendance(supabase, date_from, date_to, tz=ATTENDANCE_TZ) -> dict:
+    """يعيد {pairs, days}. إعادة التشغيل على نفس الفترة تستبدلها (idempotent)."""
+    return supabase.rpc("compact_attendance", {"p_from": str(date_from), "p_to": str(date_to), "p_tz": tz}).execute().data or {}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compact attendance events into pairs and daily summaries")
+    ap.add_argument("--from", dest="date_from", help="YYYY-MM-DD (default: yesterday)")
+    ap.add_argument("--to", dest="date_to", help="YYYY-MM-DD (default: today)")
+    args = ap.parse_args(argv)
+
+    from src.utils.db import connect
+    res = compact_attendance(connect(), args.date_from or date.today() - timedelta(days=1), args.date_to or date.today())
+    print(f"pairs: {res.get('pairs', 0)}  days: {res.get('days', 0)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# src/jobs/export_leave_forms.py
+# Bulk export of approved leave forms (year-end archive): process pool + resumable parts on disk
+#
+#   python -m src.jobs.export_leave_forms --from 2025-01-01 --to 2025-12-31 --out leave_forms_2025.zip
+#   python -m src.jobs.export_leave_forms --from 2025-01-01 --to 2025-12-31 --dept المبيعات --financials --format pdf --out sales.pdf
+#
+# كل دفعة (chunk) تُرسم في عملية مستقلة وتُكتب كملف جزئي في <out>.parts/ ويُسجَّل في manifest.json مع أرقام
+# طلباته، لذلك يمكن استكمال التصدير بعد الانقطاع (يُتخطى ما صُدّر فقط)، وتبقى الذاكرة ثابتة مهما زاد عدد النماذج.
+# استثناء: دمج --format pdf في ملف واحد يحمل كل الصفحات في الذاكرة (~17KB لكل نموذج)، لذلك يُرفض فوق MAX_PDF_FORMS.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas as pdf_canvas
+
+from src.utils.db import connect
+from src.utils.employee_cache import EmployeeCache
+from src.utils.leave_rules import calculate_annual_leave_days, get_leave_balance, calculate_leave_allowance
+from src.utils.pdf import register_fonts, generate_pdf, draw_leave_form, LEAVE_FORM_FIELDS
+
+# job_title عمود في employees وليس في requests؛ يُضاف من كاش الموظفين لكل دفعة
+EMPLOYEE_FORM_FIELDS = ("job_title",)
+EXPORT_COLUMNS = ",".join(f for f in LEAVE_FORM_FIELDS if f not in EMPLOYEE_FORM_FIELDS)
+PAGE_SIZE = 1000
+CHUNK_SIZE = 200
+MAX_PDF_FORMS = 10000  # حد الـ pdf المدمج؛ الأكبر يُصدّر zip
+
+def iter_approved_forms(supabase, date_from=None, date_to=None, dept=None, service_type="إجازة", page_size=PAGE_SIZE):
+    """صفوف الطلبات المعتمدة بترتيب id، صفحة بعد صفحة (keyset على id)."""
+    last_id = 0
+    while True:
+        q = supabase.table("requests").select(EXPORT_COLUMNS).eq("final_status", "Approved").gt("id", last_id)
+        if service_type: q = q.eq("service_type", service_type)
+        if dept: q = q.eq("dept", dept)
+        if date_from: q = q.gte("start_date", str(date_from))
+        if date_to: q = q.lte("start_date", str(date_to))
+        rows = q.order("id").limit(page_size).execute().data or []
+        yield from rows
+        if len(rows) < page_size: return
+        last_id = rows[-1]["id"]
+
+def count_approved_forms(supabase, date_from=None, date_to=None, dept=None, service_type="إجازة"):
+    q = supabase.table("requests").select("id", count="exact", head=True).eq("final_status", "Approved")
+    if service_type: q = q.eq("service_type", service_type)
+    if dept: q = q.eq("dept", dept)
+    if date_from: q = q.gte("start_date", str(date_from))
+    if date_to: q = q.lte("start_date", str(date_to))
+    return q.execute().count or 0
+
+def financials_for(row: dict, emp: dict) -> dict:
+    """نفس حساب صفحة مستحقات الإجازة (calc_allowance_page) بدون تعديل الرصيد."""
+    emp = emp or {}
+    salary = float(emp.get("salary") or 0)
+    _, last_settlement = get_leave_balance(emp) if emp else (0, "-")
+    return {
+        "salary": salary,
+        "annual_days": calculate_annual_leave_days(emp.get("hire_date")),
+        "last_calc_date": last_settlement,
+        "allowance": calculate_leave_allowance(salary, row.get("days") or 0),
+        "include_financials": True,
+    }
+
+# ------------------------------
+# العمل داخل عمليات الـ pool
+# ------------------------------
+def _render_part(path: str, fmt: str, items: list) -> int:
+    """items: [(row, pdf_kwargs)]. يكتب الملف الجزئي بشكل ذري (tmp ثم rename)."""
+    tmp = path + ".tmp"
+    if fmt == "zip":
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+            for row, kwargs in items:
+                zf.writestr(f"Req_{row['id']}.pdf", generate_pdf(row, **kwargs).getvalue())
+    else:
+        # صفحة لكل نموذج على canvas واحد: الجزء الثابت يُعرَّف مرة واحدة ويُعاد استخدامه
+        c = pdf_canvas.Canvas(tmp, pagesize=A4)
+        for row, kwargs in items:
+            draw_leave_form(c, row, **kwargs); c.showPage()
+        c.save()
+    os.replace(tmp, path)
+    return len(items)
+
+# ------------------------------
+# التصدير
+# ------------------------------
+def _load_manifest(parts_dir: str, filters: dict) -> dict:
+    path = os.path.join(parts_dir, "manifest.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f: manifest = json.load(f)
+        if manifest.get("filters") == filters: return manifest
+        raise SystemExit(f"{parts_dir} belongs to an export with different filters; remove it or choose another --out")
+    return {"filters": filters, "parts": []}
+
+def _save_manifest(parts_dir: str, manifest: dict):
+    path = os.path.join(parts_dir, "manifest.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f: json.dump(manifest, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+def _assemble(out: str, fmt: str, part_paths: list):
+    tmp = out + ".tmp"
+    if fmt == "zip":
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zout:
+            for part in part_paths:
+                with zipfile.ZipFile(part) as zin:
+                    for info in zin.infolist():
+                        with zin.open(info) as src, zout.open(info.filename, "w") as dst:
+                            shutil.copyfileobj(src, dst)
+    else:
+        from pypdf import PdfWriter
+        writer = PdfWriter()
+        for part in part_paths: writer.append(part)
+        with open(tmp, "wb") as f: writer.write(f)
+    os.replace(tmp, out)
+
+def export_leave_forms(supabase, out: str, date_from=None, date_to=None, dept=None, service_type="إجازة",
+                       include_financials=False, fmt="zip", workers=None, chunk_size=CHUNK_SIZE, on_progress=None):
+    """يصدّر النماذج إلى out (zip أو pdf مدمج). يعيد عدد النماذج المصدّرة."""
+    filters = {"from": str(date_from or ""), "to": str(date_to or ""), "dept": dept or "", "service_type": service_type or "",
+               "financials": bool(include_financials), "format": fmt}
+    total = count_approved_forms(supabase, date_from, date_to, dept, service_type)
+    if fmt == "pdf" and total > MAX_PDF_FORMS:
+        raise SystemExit(f"{total} forms is too many for one merged PDF (limit {MAX_PDF_FORMS}); use --format zip "
+                         "or narrow the export with --from/--to/--dept")
+    parts_dir = out + ".parts"
+    os.makedirs(parts_dir, exist_ok=True)
+    manifest = _load_manifest(parts_dir, filters)
+    # أرقام الطلبات المصدّرة فعلاً (لا نطاق first..last: طلب اعتُمد بعد التشغيل الأول قد يقع داخل نطاق جزء منتهٍ)
+    done_ids = {i for p in manifest["parts"] for i in p["ids"]}
+    done = sum(p["count"] for p in manifest["parts"])
+    employees = EmployeeCache(supabase, max_size=chunk_size * 4)
+    if on_progress: on_progress(done, total)
+
+    def pending_chunks():
+        chunk = []
+        for row in iter_approved_forms(supabase, date_from, date_to, dept, service_type):
+            if row["id"] in done_ids: continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size: yield chunk; chunk = []
+        if chunk: yield chunk
+
+    max_workers = workers or os.cpu_count() or 2
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=register_fonts) as pool:
+        in_flight = {}
+        def collect(block):
+            nonlocal done
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED if block else ALL_COMPLETED)
+            for fut in finished:
+                part = in_flight.pop(fut)
+                part["count"] = fut.result()
+                manifest["parts"].append(part); _save_manifest(parts_dir, manifest)
+                done += part["count"]
+                if on_progress: on_progress(done, total)
+
+        for chunk in pending_chunks():
+            emps = employees.get_many(r["emp_id"] for r in chunk)
+            for r in chunk: r["job_title"] = (emps.get(str(r["emp_id"])) or {}).get("job_title")
+            if include_financials:
+                items = [(r, financials_for(r, emps.get(str(r["emp_id"])))) for r in chunk]
+            else:
+                items = [(r, {}) for r in chunk]
+            first, last = chunk[0]["id"], chunk[-1]["id"]
+            path = os.path.join(parts_dir, f"part_{first:012d}_{last:012d}.{fmt}")
+            in_flight[pool.submit(_render_part, path, fmt, items)] = {"first": first, "last": last, "path": path,
+                                                                     "ids": [r["id"] for r in chunk]}
+            if len(in_flight) >= max_workers * 2: collect(block=True)
+        if in_flight: collect(block=False)
+
+    part_paths = [p["path"] for p in sorted(manifest["parts"], key=lambda p: p["first"])]
+    _assemble(out, fmt, part_paths)
+    shutil.rmtree(parts_dir)
+    return done
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Export approved leave forms to a zip or a merged PDF")
+    ap.add_argument("--from", dest="date_from", help="start_date >= YYYY-MM-DD")
+    ap.add_argument("--to", dest="date_to", help="start_date <= YYYY-MM-DD")
+    ap.add_argument("--dept")
+    ap.add_argument("--service-type", default="إجازة")
+    ap.add_argument("--financials", action="store_true", help="include the HR allowance section")
+    ap.add_argument("--format", choices=("zip", "pdf"), default="zip",
+                    help=f"zip: one PDF per form (any size); pdf: one merged file, up to {MAX_PDF_FORMS} forms")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--workers", type=int)
+    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = ap.parse_args(argv)
+
+    def progress(done, total):
+        sys.stderr.write(f"\r{done}/{total} forms"); sys.stderr.flush()
+
+    n = export_leave_forms(connect(), args.out, args.date_from, args.date_to, args.dept, args.service_type,
+                           args.financials, args.format, args.workers, args.chunk_size, progress)
+    sys.stderr.write(f"\nexported {n} forms -> {args.out}\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+# src/jobs/import_workbook.py
+# Streaming importer for HR_AI_Platform_Data.xlsx-style workbooks (الموظفين / الطلبات / الإعدادات)
+#
+#   python -m src.jobs.import_workbook HR_AI_Platform_Data.xlsx --dry-run
+#   python -m src.jobs.import_workbook HR_AI_Platform_Data.xlsx --chunk-size 1000
+#
+# الأوراق تُقرأ صفاً صفاً من ملفات XML داخل الـ xlsx (iterparse) دون تحميل الورقة كاملة،
+# وتُرفع على دفعات ثابتة الحجم بـ upsert على المفتاح الطبيعي (emp_id / external_ref / key)
+# لذلك إعادة التشغيل على نفس الملف لا تُنشئ تكرارات. --dry-run يعرض الفرق مع قاعدة البيانات فقط.
+
+import argparse
+import posixpath
+import sys
+import zipfile
+from datetime import date, timedelta
+from xml.etree.ElementTree import iterparse
+
+from postgrest.types import ReturnMethod
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+CHUNK_SIZE = 500
+
+# ------------------------------
+# قراءة الـ xlsx كتدفق
+# ------------------------------
+def _col_index(ref: str) -> int:
+    n = 0
+    for ch in ref:
+        if not ch.isalpha(): break
+        n = n * 26 + (ord(ch.upper()) - 64)
+    return n - 1
+
+class WorkbookReader:
+    def __init__(self, path):
+        self.zf = zipfile.ZipFile(path)
+        self.shared = self._shared_strings()
+        self.sheets = self._sheet_paths()
+
+    def close(self): self.zf.close()
+
+    def _shared_strings(self):
+        if "xl/sharedStrings.xml" not in self.zf.namelist(): return []
+        out = []
+        with self.zf.open("xl/sharedStrings.xml") as f:
+            for _, el in iterparse(f):
+                if el.tag == NS + "si":
+                    out.append("".join(t.text or "" for t in el.iter(NS + "t")))
+                    el.clear()
+        return out
+
+    def _sheet_paths(self):
+        with self.zf.open("xl/_rels/workbook.xml.rels") as f:
+            rels = {el.get("Id"): el.get("Target") for _, el in iterparse(f) if el.tag == PKG_REL_NS + "Relationship"}
+        sheets = {}
+        with self.zf.open("xl/workbook.xml") as f:
+            for _, el in iterparse(f):
+                if el.tag == NS + "sheet":
+                    target = rels[el.get(REL_NS + "id")]
+                    sheets[el.get("name")] = target.lstrip("/") if target.startswith("/") else posixpath.join("xl", target)
+        return sheets
+
+    def _cell_value(self, c):
+        t = c.get("t")
+        if t == "inlineStr":
+            return "".join(x.text or "" for x in c.iter(NS + "t"))
+        v = c.find(NS + "v")
+        if v is None or v.text is None: return None
+        if t == "s": return self.shared[int(v.text)]
+        return v.text
+
+    def rows(self, sheet_name):
+        """يعيد (رقم الصف، [القيم]) لكل صف في الورقة."""
+        with self.zf.open(self.sheets[sheet_name]) as f:
+            for _, el in iterparse(f):
+                if el.tag != NS + "row": continue
+                values = []
+                for c in el.iter(NS + "c"):
+                    idx = _col_index(c.get("r", "")) if c.get("r") else len(values)
+                    while len(values) < idx: values.append(None)
+                    values.append(self._cell_value(c))
+                yield int(el.get("r") or 0), values
+                el.clear()
+
+    def records(self, sheet_name):
+        """(رقم الصف، {العنوان: القيمة}) مع تجاهل الصفوف الفارغة؛ الصف الأول عناوين."""
+        it = self.rows(sheet_name)
+        _, header = next(it, (0, []))
+        header = [(h or "").strip() for h in header]
+        for row_no, values in it:
+            if not any(v not in (None, "") for v in values): continue
+            yield row_no, {h: (values[i] if i < len(values) else None) for i, h in enumerate(header) if h}
+
+# ------------------------------
+# التحويل والتحقق
+# ------------------------------
+class RowError(ValueError):
+    pass
+
+def _text(v):
+    if v is None: return None
+    v = str(v).strip()
+    return v or None
+
+def _code(v):
+    """أرقام مثل 1001.0 تُخزن كنص '1001'."""
+    v = _text(v)
+    if v and v.endswith(".0") and v[:-2].isdigit(): v = v[:-2]
+    return v
+
+def _number(v):
+    v = _text(v)
+    if v is None: return None
+    try: return float(v.replace(",", ""))
+    except ValueError: raise RowError(f"قيمة رقمية غير صالحة: {v}")
+
+def _int(v):
+    n = _number(v)
+    return None if n is None else int(round(n))
+
+def _date(v):
+    v = _text(v)
+    if v is None: return None
+    try:
+        return (date(1899, 12, 30) + timedelta(days=float(v))).isoformat()  # رقم تسلسلي من Excel
+    except ValueError:
+        pass
+    try:
+        return date.fromisoformat(v[:10]).isoformat()
+    except ValueError:
+        raise RowError(f"تاريخ غير صالح: {v}")
+
+STATUS_MAP = {"مقبول": "Approved", "معتمد": "Approved", "موافق": "Approved", "مرفوض": "Rejected",
+              "قيد الانتظار": "Pending", "معلق": "Pending", "جديد": "Pending"}
+
+def _status(v):
+    v = _text(v)
+    if v is None: return "Pending"
+    if v in ("Approved", "Rejected", "Pending"): return v
+    if v in STATUS_MAP: return STATUS_MAP[v]
+    raise RowError(f"حالة غير معروفة: {v}")
+
+# أدوار التطبيق (docs/HR_CRM_Policies_and_Procedures.md §2). Admin في ملف العينة هو مدير الموارد البشرية،
+# وكل مسارات HR في app.py تفحص role == "HR" فقط.
+ROLE_MAP = {"Employee": "Employee", "Supervisor": "Supervisor", "Manager": "Manager", "HR": "HR", "SysAdmin": "SysAdmin",
+            "Admin": "HR", "موظف": "Employee", "مشرف": "Supervisor", "مدير": "Manager",
+            "الموارد البشرية": "HR", "موارد بشرية": "HR", "مدير النظام": "SysAdmin"}
+
+def _role(v):
+    v = _text(v)
+    if v is None: return None
+    if v in ROLE_MAP: return ROLE_MAP[v]
+    raise RowError(f"صلاحية غير معروفة: {v}")
+
+def build_employee(rec):
+    row = {
+        "emp_id": _code(rec.get("رقم الموظف")),
+        "password": _code(rec.get("الرقم السري")),
+        "name": _text(rec.get("اسم الموظف")),
+        "email": _text(rec.get("البريد الالكتروني")),
+        "national_id": _code(rec.get("رقم الهوية")),
+        "dept": _text(rec.get("الهيكل الإداري")),
+        "job_title": _text(rec.get("المسمى الوظيفي")),
+        "role": _role(rec.get("نوع الصلاحية")),
+        "salary": _number(rec.get("الراتب الاساسي")),
+        "housing_allowance": _number(rec.get("بدل سكن")),
+        "transport_allowance": _number(rec.get("بدل مواصلات")),
+        "hire_date": _date(rec.get("تاريخ التعيين")),
+        "birth_date": _date(rec.get("تاريخ الميلاد_م")),
+        "employment_status": _text(rec.get("الوضع الحالي للموظف")),
+        "leave_balances": {
+            "annual_balance": _number(rec.get("رصيد_إجازة_سنوية")),
+            "emergency_balance": _number(rec.get("رصيد_إجازة_اضطرارية")),
+        },
+        "payroll_items": {
+            "absence_days": _number(rec.get("غياب")),
+            "advances": _number(rec.get("سلف")),
+            "late": _number(rec.get("تاخير")),
+            "net_salary": _number(rec.get("مستحق صافي الراتب")),
+            "social_insurance": _number(rec.get("التامينات الاجتماعيه")),
+            "penalties": _number(rec.get("جزاءت")),
+            "loan": _number(rec.get("قرضه")),
+        },
+    }
+    for field in ("emp_id", "name", "role"):
+        if not row[field]: raise RowError(f"الحقل {field} مطلوب")
+    return row
+
+def build_request(rec):
+    status = _status(rec.get("حالة_الطلب"))
+    reply_at = _date(rec.get("تاريخ_الرد"))
+    row = {
+        "external_ref": _code(rec.get("رقم_الطلب")),
+        "created_at": _date(rec.get("تاريخ_الطلب")),
+        "submission_date": _date(rec.get("تاريخ_الطلب")),
+        "emp_id": _code(rec.get("رقم_الموظف")),
+        "emp_name": _text(rec.get("اسم_الموظف")),
+        "dept": _text(rec.get("القسم")),
+        "service_type": _text(rec.get("نوع_الطلب")),
+        "details": _text(rec.get("التفاصيل")),
+        "days": _int(rec.get("مدة_الإجازة_أيام")),
+        "amount": _number(rec.get("مبلغ_السلفة")),
+        "manager_note": _text(rec.get("رد_المدير")),
+        "manager_action_at": reply_at if status != "Pending" else None,
+        "status_substitute": "Not Required",
+        "status_manager": status,
+        # الورقة فيها مرحلة اعتماد واحدة؛ الطلب المقبول يُعتبر منتهياً حتى يظهر في سجل HR
+        "status_hr": "Approved" if status == "Approved" else "Pending",
+        "hr_action_at": reply_at if status == "Approved" else None,
+        "final_status": status,
+    }
+    for field in ("external_ref", "emp_id", "service_type"):
+        if not row[field]: raise RowError(f"الحقل {field} مطلوب")
+    if not row["created_at"]:
+        del row["created_at"], row["submission_date"]  # القيمة الافتراضية في القاعدة (now())
+    return row
+
+def build_setting(rec):
+    row = {"key": _text(rec.get("المفتاح")), "value": _text(rec.get("القيمة")), "description": _text(rec.get("الوصف"))}
+    if not row["key"]: raise RowError("الحقل key مطلوب")
+    return row
+
+# ورقة -> (الجدول، المفتاح الطبيعي، دالة البناء). الترتيب مهم: الموظفون قبل الطلبات (FK).
+SHEETS = {
+    "employees": ("الموظفين", "employees", "emp_id", build_employee),
+    "requests": ("الطلبات", "requests", "external_ref", build_request),
+    "settings": ("الإعدادات", "settings", "key", build_setting),
+}
+
+# ------------------------------
+# الفرق والرفع
+# ------------------------------
+def _same(new, old):
+    if isinstance(new, dict):
+        return all(_same(v, (old or {}).get(k)) for k, v in new.items())
+    if new is None or old is None: return new is None and old is None
+    if isinstance(new, float):
+        try: return new == float(old)
+        except (TypeError, ValueError): return False
+    new, old = str(new), str(old)
+    if len(new) == 10 and new[4:5] == "-" and old[4:5] == "-":
+        return new == old[:10]  # تاريخ من الملف مقابل timestamptz في القاعدة
+    return new == old
+
+def diff_chunk(supabase, table, key, rows):
+    """يقارن الدفعة بالموجود في القاعدة (استعلام in_() واحد) ويصنّفها."""
+    columns = sorted({c for r in rows for c in r})
+    keys = [r[key] for r in rows]
+    existing = {str(e[key]): e for e in (supabase.table(table).select(",".join(columns)).in_(key, keys).execute().data or [])}
+    inserts, updates, unchanged = [], [], []
+    for r in rows:
+        old = existing.get(str(r[key]))
+        if old is None: inserts.append(r); continue
+        changed = [f for f, v in r.items() if not _same(v, old.get(f))]
+        (updates if changed else unchanged).append((r, changed))
+    return inserts, updates, unchanged
+
+def missing_employees(supabase, rows):
+    """طلبات لموظفين غير موجودين (FK) تُرفض كأخطاء صفوف بدل إفشال الدفعة كاملة."""
+    emp_ids = list({r["emp_id"] for r in rows})
+    found = {str(e["emp_id"]) for e in (supabase.table("employees").select("emp_id").in_("emp_id", emp_ids).execute().data or [])}
+    return set(emp_ids) - found
+
+def import_workbook(supabase, path, sheets=("employees", "requests", "settings"), dry_run=False, chunk_size=CHUNK_SIZE, out=sys.stdout):
+    """يعيد تقريراً: {sheet: {"inserted", "updated", "unchanged", "errors": [(row, msg)]}}."""
+    report = {}
+    wb = WorkbookReader(path)
+    try:
+        for name in sheets:
+            sheet, table, key, build = SHEETS[name]
+            stats = report[name] = {"inserted": 0, "updated": 0, "unchanged": 0, "errors": []}
+            if sheet not in wb.sheets:
+                stats["errors"].append((0, f"الورقة {sheet} غير موجودة")); continue
+
+            def flush(chunk):
+                if name == "requests":
+                    missing = missing_employees(supabase, [r for _, r in chunk])
+                    for row_no, r in chunk:
+                        if r["emp_id"] in missing: stats["errors"].append((row_no, f"الموظف {r['emp_id']} غير موجود"))
+                    chunk = [(n, r) for n, r in chunk if r["emp_id"] not in missing]
+                    if not chunk: return
+                inserts, updates, unchanged = diff_chunk(supabase, table, key, [r for _, r in chunk])
+                stats["inserted"] += len(inserts); stats["updated"] += len(updates); stats["unchanged"] += len(unchanged)
+                if dry_run:
+                    for r in inserts: out.write(f"[{name}] + {r[key]}\n")
+                    for r, changed in updates: out.write(f"[{name}] ~ {r[key]}: {', '.join(changed)}\n")
+                    return
+                changed_rows = inserts + [r for r, _ in updates]
+                if changed_rows:
+                    supabase.table(table).upsert(changed_rows, on_conflict=key, default_to_null=False,
+                                                 returning=ReturnMethod.minimal).execute()
+
+            chunk, seen = [], set()
+            for row_no, rec in wb.records(sheet):
+                try:
+                    row = build(rec)
+                except RowError as e:
+                    stats["errors"].append((row_no, str(e))); continue
+                if row[key] in seen:
+                    stats["errors"].append((row_no, f"مفتاح مكرر في الملف: {row[key]}")); continue
+                seen.add(row[key])
+                chunk.append((row_no, row))
+                if len(chunk) >= chunk_size: flush(chunk); chunk = []
+            if chunk: flush(chunk)
+    finally:
+        wb.close()
+    return report
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Import an HR workbook (employees / requests / settings)")
+    ap.add_argument("path")
+    ap.add_argument("--dry-run", action="store_true", help="show the diff against the database without writing")
+    ap.add_argument("--sheets", default="employees,requests,settings")
+    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = ap.parse_args(argv)
+
+    from src.utils.db import connect
+    report = import_workbook(connect(), args.path, tuple(s for s in args.sheets.split(",") if s), args.dry_run, args.chunk_size)
+    failed = False
+    for name, stats in report.items():
+        print(f"{name}: +{stats['inserted']} ~{stats['updated']} ={stats['unchanged']} errors={len(stats['errors'])}")
+        for row_no, msg in stats["errors"]:
+            print(f"  row {row_no}: {msg}")
+        failed = failed or bool(stats["errors"])
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# src/jobs/leave_accrual.py
+# Month-end / year-end leave accrual and settlement for the whole workforce (vectorized with pandas)
+#
+#   python -m src.jobs.leave_accrual --as-of 2025-12-31 --dry-run --report accrual_2025.csv
+#   python -m src.jobs.leave_accrual --as-of 2025-12-31
+#
+# لكل موظف: الاستحقاق السنوي (21/30 يوماً حسب الخدمة) × الأيام منذ آخر تصفية / 365، ناقصاً أيام الإجازات
+# السنوية المعتمدة التي بدأت بعد آخر تصفية وحتى تاريخ التشغيل ولم تُخصم بعد (تسوية HR أو تشغيل سابق).
+# نفس قواعد src/utils/leave_rules.py
+# لكن على كل الموظفين دفعة واحدة بدل موظف بموظف.
+
+import argparse
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from src.utils.leave_ledger import post_leave_entries, posted_request_ids
+
+PAGE_SIZE = 1000
+CHUNK_SIZE = 1000
+DAYS_PER_YEAR = 365
+ANNUAL_LEAVE_PREFIX = "سنوية"  # sub_type: "سنوية" أو "سنوية (Yearly)"
+
+# الرصيد وتاريخ التصفية يُقرآن من داخل leave_balances في الاستعلام نفسه
+EMPLOYEE_COLUMNS = ("emp_id,hire_date,annual_balance:leave_balances->annual_balance,"
+                    "last_settlement_date:leave_balances->>last_settlement_date")
+LEAVE_COLUMNS = "id,emp_id,sub_type,start_date,days"
+
+# ------------------------------
+# التحميل
+# ------------------------------
+def load_employees(supabase, page_size=PAGE_SIZE) -> pd.DataFrame:
+    """كل الموظفين (keyset على emp_id) في DataFrame واحد."""
+    rows, last = [], ""
+    while True:
+        page = (supabase.table("employees").select(EMPLOYEE_COLUMNS).gt("emp_id", last)
+                .order("emp_id").limit(page_size).execute().data or [])
+        rows.extend(page)
+        if len(page) < page_size: break
+        last = page[-1]["emp_id"]
+    return pd.DataFrame(rows, columns=["emp_id", "hire_date", "annual_balance", "last_settlement_date"])
+
+def load_annual_leaves(supabase, since, as_of, page_size=PAGE_SIZE) -> pd.DataFrame:
+    """الإجازات السنوية المعتمدة التي تبدأ في (since, as_of] وليس لها قيد خصم في السجل."""
+    rows, last_id = [], 0
+    while True:
+        q = (supabase.table("requests").select(LEAVE_COLUMNS).eq("final_status", "Approved")
+             .eq("service_type", "إجازة").gt("id", last_id).lte("start_date", str(as_of)))
+        if since: q = q.gt("start_date", str(since))
+        page = q.order("id").limit(page_size).execute().data or []
+        rows.extend(page)
+        if len(page) < page_size: break
+        last_id = page[-1]["id"]
+    df = pd.DataFrame(rows, columns=["id", "emp_id", "sub_type", "start_date", "days"])
+    df = df[df["sub_type"].fillna("").str.startswith(ANNUAL_LEAVE_PREFIX)]
+    # الإجازة التي خصمها HR عند التسوية (أو تشغيل سابق) لا تُخصم مرة ثانية
+    return df[~df["id"].isin(posted_request_ids(supabase, df["id"]))] if len(df) else df
+
+# ------------------------------
+# الحساب
+# ------------------------------
+def _dates(s: pd.Series) -> pd.Series:
+    return pd.to_datetime(s.astype("string").str[:10], format="%Y-%m-%d", errors="coerce")
+
+def _last_settlement(employees: pd.DataFrame, as_of) -> pd.Series:
+    # آخر تصفية افتراضياً = تاريخ التعيين (كما في get_leave_balance)
+    return _dates(employees["last_settlement_date"]).fillna(_dates(employees["hire_date"])).fillna(pd.Timestamp(as_of))
+
+def consumed_leaves(employees: pd.DataFrame, leaves: pd.DataFrame, as_of) -> pd.DataFrame:
+    """الإجازات التي تُخصم في هذا التشغيل: بدأت بعد آخر تصفية للموظف وحتى as_of. أعمدة: id, emp_id, start, days."""
+    as_of = pd.Timestamp(as_of)
+    lv = pd.DataFrame({"id": leaves["id"].values, "emp_id": leaves["emp_id"].astype(str).values,
+                       "start": _dates(leaves["start_date"]).values,
+                       "days": pd.to_numeric(leaves["days"], errors="coerce").fillna(0).values})
+    last = pd.DataFrame({"emp_id": employees["emp_id"].astype(str).values, "last": _last_settlement(employees, as_of).values})
+    lv = lv.merge(last, on="emp_id", how="inner")
+    return lv[(lv["start"] > lv["last"]) & (lv["start"] <= as_of)]
+
+def compute_accrual(employees: pd.DataFrame, leaves: pd.DataFrame, as_of) -> pd.DataFrame:
+    """يعيد صفاً لكل موظف: entitlement, balance, last_settlement_date, days_elapsed, accrued, consumed, new_balance, overdrawn."""
+    as_of = pd.Timestamp(as_of)
+    emp_id = employees["emp_id"].astype(str)
+    hire = _dates(employees["hire_date"])
+
+    # الاستحقاق: 30 يوماً بعد 5 سنوات خدمة وإلا 21 (ومن لا تاريخ تعيين له 21)
+    years = (as_of - hire).dt.days / 365.25
+    entitlement = np.where(years >= 5, 30, 21)
+
+    # الرصيد الافتراضي = الاستحقاق (كما في get_leave_balance)
+    balance = pd.to_numeric(employees["annual_balance"], errors="coerce").fillna(pd.Series(entitlement, index=employees.index))
+    last = _last_settlement(employees, as_of)
+    days_elapsed = (as_of - last).dt.days.clip(lower=0)
+    accrued = (entitlement * days_elapsed / DAYS_PER_YEAR).round(2)
+
+    # الاستهلاك: مجموع أيام الإجازات السنوية التي بدأت بعد آخر تصفية لكل موظف
+    consumed = pd.Series(0.0, index=emp_id.values)
+    if len(leaves):
+        consumed = consumed_leaves(employees, leaves, as_of).groupby("emp_id")["days"].sum().reindex(emp_id.values, fill_value=0.0)
+
+    out = pd.DataFrame({
+        "emp_id": emp_id.values,
+        "entitlement": entitlement,
+        "balance": balance.values,
+        "last_settlement_date": last.dt.strftime("%Y-%m-%d").values,
+        "prev_settlement": employees["last_settlement_date"].values,
+        "days_elapsed": days_elapsed.values,
+        "accrued": accrued.values,
+        "consumed": consumed.values,
+    })
+    out["new_balance"] = (out["balance"] + out["accrued"] - out["consumed"]).round(2)
+    out["overdrawn"] = out["new_balance"] < 0
+    return out
+
+# ------------------------------
+# الكتابة (قيود في سجل الرصيد)
+# ------------------------------
+def ledger_entries(result: pd.DataFrame, consumed: pd.DataFrame, as_of) -> list:
+    """قيد استحقاق لكل موظف + قيد استهلاك لكل إجازة، مرتبة حسب الموظف. المكشوف (رصيد سالب) لا يُرحَّل ويُترك لمراجعة HR."""
+    as_of = str(pd.Timestamp(as_of).date())
+    todo = result[~result["overdrawn"] & (result["days_elapsed"] > 0)]
+    prev = todo["prev_settlement"].astype(object).where(todo["prev_settlement"].notna(), None)
+    accrual = pd.DataFrame({"emp_id": todo["emp_id"].values, "entry_type": "accrual", "days": todo["accrued"].astype(float).values,
+                            "request_id": None, "note": "accrual " + todo["last_settlement_date"] + " .. " + as_of,
+                            "prev_settlement": prev.values, "n": 0})
+    lv = consumed[consumed["emp_id"].isin(todo["emp_id"])]
+    consumption = pd.DataFrame({"emp_id": lv["emp_id"].values, "entry_type": "consumption", "days": -lv["days"].astype(float).values,
+                                "request_id": lv["id"].astype(object).values, "note": None, "prev_settlement": None, "n": 1})
+    entries = pd.concat([accrual, consumption], ignore_index=True).sort_values(["emp_id", "n"], kind="stable")
+    entries["settlement_date"] = as_of
+    return entries.drop(columns="n").astype(object).where(entries.drop(columns="n").notna(), None).to_dict("records")
+
+def apply_settlements(supabase, result: pd.DataFrame, consumed: pd.DataFrame, as_of, chunk_size=CHUNK_SIZE):
+    """يرحّل القيود على دفعات عبر post_leave_entries (دفعة كاملة لكل موظف في نفس الاستدعاء).
+    يعيد (عدد الموظفين المرحَّلين، [{emp_id, reason}] المتخطّى)."""
+    entries = ledger_entries(result, consumed, as_of)
+    posted, skipped, i = 0, [], 0
+    while i < len(entries):
+        j = min(i + chunk_size, len(entries))
+        while j < len(entries) and entries[j]["emp_id"] == entries[j - 1]["emp_id"]: j += 1
+        res = post_leave_entries(supabase, entries[i:j])
+        posted += res.get("posted", 0); skipped += res.get("skipped", [])
+        i = j
+    return posted, skipped
+
+def run_accrual(supabase, as_of=None, dry_run=False, chunk_size=CHUNK_SIZE):
+    """يعيد (DataFrame النتائج، عدد المرحَّل، المتخطّى)."""
+    as_of = pd.Timestamp(as_of or date.today()).normalize()
+    employees = load_employees(supabase)
+    since = _last_settlement(employees, as_of).min()
+    leaves = load_annual_leaves(supabase, None if pd.isna(since) else since.date(), as_of.date())
+    result = compute_accrual(employees, leaves, as_of)
+    if dry_run: return result, 0, []
+    posted, skipped = apply_settlements(supabase, result, consumed_leaves(employees, leaves, as_of), as_of, chunk_size)
+    return result, posted, skipped
+
+def summarize(result: pd.DataFrame) -> str:
+    lines = [
+        f"employees: {len(result)}",
+        f"accrued:   {result['accrued'].sum():,.2f} days",
+        f"consumed:  {result['consumed'].sum():,.2f} days",
+        f"overdrawn: {int(result['overdrawn'].sum())} (not written)",
+    ]
+    for r in result[result["overdrawn"]].head(20).itertuples():
+        lines.append(f"  {r.emp_id}: {r.balance} + {r.accrued} - {r.consumed} = {r.new_balance}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Accrue and settle annual leave balances for all employees")
+    ap.add_argument("--as-of", help="settlement date YYYY-MM-DD (default: today)")
+    ap.add_argument("--dry-run", action="store_true", help="compute and report without writing")
+    ap.add_argument("--report", help="write the per-employee result to this CSV")
+    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = ap.parse_args(argv)
+
+    from src.utils.db import connect
+    result, updated, skipped = run_accrual(connect(), args.as_of, args.dry_run, args.chunk_size)
+    print(summarize(result))
+    if args.report: result.to_csv(args.report, index=False, encoding="utf-8-sig")
+    if not args.dry_run:
+        print(f"posted: {updated}")
+        for item in skipped:
+            print(f"  skipped {item['emp_id']}: {item['reason']}" + (f" (request {item['request_id']})" if item.get("request_id") else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# src/jobs/notification_worker.py
+# Delivers queued notifications (notification_outbox) per channel with rate limits, batching, backoff retries and dead-lettering
+#
+#   python -m src.jobs.notification_worker                        # Twilio/SMTP حسب متغيرات البيئة، يعمل باستمرار
+#   python -m src.jobs.notification_worker --file outbox.jsonl --once
+#
+# الإشعارات تُضاف إلى الجدول عبر trigger على requests في نفس معاملة الاعتماد، فلا ينتظر المعتمد أي مزود خارجي.
+# كل قناة لها خيط مستقل: claim (SKIP LOCKED، بعقد إيجار) -> إرسال على دفعات بعد أخذ رموز من token bucket -> complete.
+# حجم الحجز = ما يُرسل بمعدل القناة في نصف مدة العقد، ولا تبدأ دفعة لا تنتهي (مع مهلة المزود) قبل انتهاء العقد:
+# ما لم يُرسل يعود للطابور بانتهاء العقد بدلاً من أن يحجزه عامل آخر ويرسله مرة ثانية.
+# الفشل المؤقت يُعاد بعد BACKOFF_BASE * 2^(المحاولة-1) ثانية (مع jitter)، وبعد MAX_ATTEMPTS أو خطأ دائم -> dead.
+
+import argparse
+import random
+import threading
+import time
+
+from src.utils.notifications import Delivery, TokenBucket, FileTransport, transports_from_env
+
+CLAIM_LIMIT = 100
+LEASE_SECONDS = 120
+LEASE_FILL = 0.5   # نسبة العقد المخصصة للإرسال بمعدل القناة، والباقي لمهلات المزود
+POLL_INTERVAL = 5  # ثوانٍ عند فراغ الطابور
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 30  # ثانية
+BACKOFF_MAX = 6 * 3600
+
+def backoff_seconds(attempts: int) -> float:
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return round(delay * random.uniform(0.8, 1.2), 1)
+
+def claim_limit(transport, lease=LEASE_SECONDS) -> int:
+    """عدد الرسائل التي يتسع لها عقد الإيجار بمعدل القناة."""
+    return max(1, min(CLAIM_LIMIT, int(transport.rate * lease * LEASE_FILL)))
+
+def claim(supabase, channel, limit=CLAIM_LIMIT, lease=LEASE_SECONDS) -> list:
+    return supabase.rpc("claim_notifications", {"p_channel": channel, "p_limit": limit, "p_lease_seconds": lease}).execute().data or []
+
+def complete(supabase, results: list) -> dict:
+    if not results: return {}
+    return supabase.rpc("complete_notifications", {"p_results": results}).execute().data or {}
+
+def result_row(msg, delivery) -> dict:
+    if delivery.ok: return {"id": msg["id"], "ok": True}
+    dead = delivery.permanent or msg.get("attempts", 1) >= MAX_ATTEMPTS
+    return {"id": msg["id"], "ok": False, "error": (delivery.error or "")[:500],
+            "retry_in": None if dead else backoff_seconds(msg.get("attempts", 1))}
+
+def deliver(supabase, transport, bucket: TokenBucket, messages: list, stop: threading.Event = None, deadline: float = None) -> dict:
+    """يرسل الرسائل المحجوزة على دفعات ويسجل النتائج بعد كل دفعة. يعيد مجاميع {sent, retry, dead}.
+    deadline: نهاية عقد الإيجار (time.monotonic)؛ الدفعات التي قد تتجاوزه تُترك للطابور."""
+    totals = {"sent": 0, "retry": 0, "dead": 0}
+    size = max(min(transport.batch_size, bucket.burst), 1)
+    for i in range(0, len(messages), size):
+        batch = messages[i:i + size]
+        if deadline is not None and time.monotonic() + len(batch) / bucket.rate + transport.timeout > deadline: break
+        if not bucket.take(len(batch), stop): break  # إيقاف: الباقي يعود للطابور بانتهاء عقد الإيجار
+        try:
+            deliveries = transport.send_batch(batch)
+        except Exception as e:
+            deliveries = [Delivery(False, str(e), False)] * len(batch)
+        for k, v in complete(supabase, [result_row(m, d) for m, d in zip(batch, deliveries)]).items():
+            totals[k] = totals.get(k, 0) + v
+    return totals
+
+def run_channel(supabase, transport, once=False, stop: threading.Event = None, log=print) -> dict:
+    """حلقة قناة واحدة. once: يفرغ الرسائل المستحقة الآن ثم يعود."""
+    stop = stop or threading.Event()
+    bucket = TokenBucket(transport.rate, transport.burst)
+    totals = {"sent": 0, "retry": 0, "dead": 0}
+    limit = claim_limit(transport)
+    while not stop.is_set():
+        leased_at = time.monotonic()
+        try:
+            messages = claim(supabase, transport.channel, limit)
+        except Exception as e:
+            log(f"[{transport.channel}] claim failed: {e}")
+            if once: break
+            stop.wait(POLL_INTERVAL); continue
+        if messages:
+            res = deliver(supabase, transport, bucket, messages, stop, leased_at + LEASE_SECONDS)
+            for k, v in res.items(): totals[k] = totals.get(k, 0) + v
+            log(f"[{transport.channel}] " + " ".join(f"{k}={v}" for k, v in res.items()))
+        if len(messages) < limit:
+            if once: break
+            stop.wait(POLL_INTERVAL)
+    return totals
+
+def run_workers(supabase, transports, once=False, stop: threading.Event = None) -> dict:
+    """خيط لكل قناة (حدود المعدل مستقلة لكل مزود). يعيد المجاميع لكل قناة."""
+    stop = stop or threading.Event()
+    totals, threads = {}, []
+    for t in transports:
+        fn = lambda t=t: totals.__setitem__(t.channel, run_channel(supabase, t, once, stop))
+        threads.append(threading.Thread(target=fn, name=f"notify-{t.channel}", daemon=True))
+    for th in threads: th.start()
+    try:
+        while any(th.is_alive() for th in threads): time.sleep(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for th in threads: th.join()
+    return totals
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Deliver queued notifications from notification_outbox")
+    ap.add_argument("--file", help="write all channels to this JSONL file instead of the real providers")
+    ap.add_argument("--once", action="store_true", help="drain what is due now and exit")
+    args = ap.parse_args(argv)
+
+    transports = ([FileTransport("whatsapp", args.file), FileTransport("email", args.file)] if args.file
+                  else transports_from_env())
+    if not transports:
+        ap.error("no transport configured (set TWILIO_* / SMTP_* or use --file)")
+
+    from src.utils.db import connect
+    for channel, res in run_workers(connect(), transports, args.once).items():
+        print(f"{channel}: " + " ".join(f"{k}={v}" for k, v in res.items()))
+
+if __name__ == "__main__":
+    main()
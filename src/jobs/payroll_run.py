@@ -0,0 +1,235 @@
+# src/jobs/payroll_run.py
+# Payroll run for a whole period: vectorized per chunk of employees over a process pool, Draft rows upserted in bulk
+#
+#   python -m src.jobs.payroll_run --from 2025-03-01 --to 2025-03-31 --dry-run --report payroll_2025_03.csv
+#   python -m src.jobs.payroll_run --from 2025-03-01 --to 2025-03-31
+#
+# لكل موظف: الإجمالي (الأساسي + السكن + المواصلات) + بدل الإجازات السنوية التي تبدأ في الفترة (calculate_leave_allowance)
+# − خصم أيام الإجازة بدون راتب داخل الفترة − خصم دقائق التأخير (من attendance_daily عبر attendance_period_summary).
+# الحساب حتمي: نفس المدخلات تعطي نفس الصفوف، ولا يُكتب إلا ما تغيّر عن التشغيل السابق للفترة، وتُحذف صفوف Draft
+# لمن خرج من الحساب (فإعادة التشغيل = تشغيل نظيف). الصفوف غير Draft لا تُمس.
+
+import argparse
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from postgrest.types import ReturnMethod
+
+PAGE_SIZE = 1000
+CHUNK_SIZE = 5000       # موظفون لكل مهمة في الـ pool
+WRITE_CHUNK_SIZE = 1000
+WRITE_THREADS = 4
+DAYS_PER_MONTH = 30     # نفس أساس calculate_leave_allowance
+WORK_MINUTES_PER_DAY = 8 * 60
+ANNUAL_LEAVE_PREFIX = "سنوية"
+UNPAID_LEAVE_PREFIX = "بدون راتب"
+MONEY_FIELDS = ("gross", "net")
+
+EMPLOYEE_COLUMNS = "emp_id,salary,housing_allowance,transport_allowance"
+LEAVE_COLUMNS = "id,emp_id,sub_type,start_date,end_date,days"
+PAYROLL_COLUMNS = "id,emp_id,gross,allowances,deductions,net,status"
+
+# ------------------------------
+# التحميل (صفحات keyset)
+# ------------------------------
+def _pages(query, key, page_size=PAGE_SIZE):
+    rows, last = [], None
+    while True:
+        q = query()
+        if last is not None: q = q.gt(key, last)
+        page = q.order(key).limit(page_size).execute().data or []
+        rows.extend(page)
+        if len(page) < page_size: return rows
+        last = page[-1][key]
+
+def load_employees(supabase) -> pd.DataFrame:
+    rows = _pages(lambda: supabase.table("employees").select(EMPLOYEE_COLUMNS), "emp_id")
+    return pd.DataFrame(rows, columns=EMPLOYEE_COLUMNS.split(","))
+
+def load_leaves(supabase, period_start, period_end) -> pd.DataFrame:
+    """الإجازات المعتمدة المتقاطعة مع الفترة."""
+    rows = _pages(lambda: supabase.table("requests").select(LEAVE_COLUMNS).eq("final_status", "Approved")
+                  .eq("service_type", "إجازة").lte("start_date", str(period_end)).gte("end_date", str(period_start)), "id")
+    return pd.DataFrame(rows, columns=LEAVE_COLUMNS.split(","))
+
+def load_attendance(supabase, period_start, period_end) -> pd.DataFrame:
+    """مجاميع الحضور لكل موظف في الفترة (يُجمَّع في القاعدة)."""
+    params = {"p_from": str(period_start), "p_to": str(period_end)}
+    rows = _pages(lambda: supabase.rpc("attendance_period_summary", params), "emp_id")
+    return pd.DataFrame(rows, columns=["emp_id", "days_present", "minutes_worked", "late_minutes", "incomplete_days"])
+
+def load_payroll(supabase, period_start, period_end) -> pd.DataFrame:
+    rows = _pages(lambda: supabase.table("payroll").select(PAYROLL_COLUMNS)
+                  .eq("period_start", str(period_start)).eq("period_end", str(period_end)), "id")
+    return pd.DataFrame(rows, columns=PAYROLL_COLUMNS.split(","))
+
+# ------------------------------
+# الحساب (دالة نقية على دفعة موظفين)
+# ------------------------------
+def _money(s) -> pd.Series:
+    return pd.to_numeric(s, errors="coerce").fillna(0.0).astype(float)
+
+def compute_payroll(employees: pd.DataFrame, leaves: pd.DataFrame, attendance: pd.DataFrame, period_start, period_end) -> pd.DataFrame:
+    """صف لكل موظف: gross, leave_allowance, annual_leave_days, unpaid_days, unpaid_deduction, late_minutes, late_deduction, net."""
+    ps, pe = pd.Timestamp(period_start), pd.Timestamp(period_end)
+    emp_ids = employees["emp_id"].astype(str).values
+    out = pd.DataFrame({"emp_id": emp_ids})
+    basic = _money(employees["salary"]).values
+    out["basic"] = basic
+    out["housing"] = _money(employees["housing_allowance"]).values
+    out["transport"] = _money(employees["transport_allowance"]).values
+    out["gross"] = (out["basic"] + out["housing"] + out["transport"]).round(2)
+
+    lv = pd.DataFrame({
+        "emp_id": leaves["emp_id"].astype(str).values,
+        "sub_type": leaves["sub_type"].fillna("").astype(str).values,
+        "start": pd.to_datetime(leaves["start_date"], errors="coerce").values,
+        "end": pd.to_datetime(leaves["end_date"], errors="coerce").values,
+        "days": _money(leaves["days"]).values,
+    })
+    lv = lv.dropna(subset=["start", "end"]).merge(out[["emp_id", "basic", "gross"]], on="emp_id", how="inner")
+
+    # بدل الإجازة السنوية: يُصرف في الفترة التي تبدأ فيها الإجازة = (الراتب / 30) × الأيام لكل طلب
+    annual = lv[lv["sub_type"].str.startswith(ANNUAL_LEAVE_PREFIX) & (lv["start"] >= ps) & (lv["start"] <= pe)]
+    annual = annual.assign(allowance=(annual["basic"] / DAYS_PER_MONTH * annual["days"]).round(2))
+    annual = annual.groupby("emp_id")[["allowance", "days"]].sum()
+
+    # بدون راتب: الأيام المتقاطعة مع الفترة فقط × أجر اليوم الإجمالي
+    unpaid = lv[lv["sub_type"].str.startswith(UNPAID_LEAVE_PREFIX)]
+    overlap = ((unpaid["end"].where(unpaid["end"] < pe, pe) - unpaid["start"].where(unpaid["start"] > ps, ps)).dt.days + 1).clip(lower=0)
+    unpaid = unpaid.assign(overlap=overlap, deduction=(unpaid["gross"] / DAYS_PER_MONTH * overlap).round(2))
+    unpaid = unpaid.groupby("emp_id")[["overlap", "deduction"]].sum()
+
+    att = attendance.assign(emp_id=attendance["emp_id"].astype(str)).set_index("emp_id")
+
+    out["leave_allowance"] = annual["allowance"].reindex(emp_ids, fill_value=0.0).values
+    out["annual_leave_days"] = annual["days"].reindex(emp_ids, fill_value=0.0).values
+    out["unpaid_days"] = unpaid["overlap"].reindex(emp_ids, fill_value=0).values
+    out["unpaid_deduction"] = unpaid["deduction"].reindex(emp_ids, fill_value=0.0).values
+    out["late_minutes"] = _money(att["late_minutes"]).reindex(emp_ids, fill_value=0.0).values if len(att) else 0.0
+    out["late_deduction"] = (out["gross"] / DAYS_PER_MONTH / WORK_MINUTES_PER_DAY * out["late_minutes"]).round(2)
+    out["net"] = np.maximum(out["gross"] + out["leave_allowance"] - out["unpaid_deduction"] - out["late_deduction"], 0).round(2)
+    return out
+
+def to_rows(result: pd.DataFrame, period_start, period_end) -> list:
+    """صفوف payroll (JSONB بمفاتيح ثابتة الترتيب حتى تبقى المقارنة حتمية)."""
+    rows = []
+    for r in result.itertuples(index=False):
+        rows.append({
+            "emp_id": r.emp_id, "period_start": str(period_start), "period_end": str(period_end),
+            "gross": float(r.gross), "net": float(r.net), "status": "Draft",
+            "allowances": {"housing": float(r.housing), "transport": float(r.transport),
+                           "leave_allowance": float(r.leave_allowance), "annual_leave_days": float(r.annual_leave_days)},
+            "deductions": {"unpaid_leave": float(r.unpaid_deduction), "unpaid_leave_days": int(r.unpaid_days),
+                           "late": float(r.late_deduction), "late_minutes": int(r.late_minutes)},
+        })
+    return rows
+
+def _compute_chunk(employees, leaves, attendance, period_start, period_end):
+    return to_rows(compute_payroll(employees, leaves, attendance, period_start, period_end), period_start, period_end)
+
+# ------------------------------
+# المقارنة مع التشغيل السابق
+# ------------------------------
+def _same(new: dict, old: dict) -> bool:
+    if any(abs(float(new[f]) - float(old.get(f) or 0)) > 0.005 for f in MONEY_FIELDS): return False
+    return new["allowances"] == (old.get("allowances") or {}) and new["deductions"] == (old.get("deductions") or {})
+
+def diff_runs(rows: list, previous: pd.DataFrame) -> dict:
+    """يعيد {new, changed, unchanged, locked, removed} حيث changed = [(row, old_net)]."""
+    prev = {str(r["emp_id"]): r for r in previous.to_dict("records")}
+    out = {"new": [], "changed": [], "unchanged": [], "locked": [], "removed": []}
+    for row in rows:
+        old = prev.pop(row["emp_id"], None)
+        if old is None: out["new"].append(row)
+        elif old.get("status") != "Draft": out["locked"].append(row)
+        elif _same(row, old): out["unchanged"].append(row)
+        else: out["changed"].append((row, float(old.get("net") or 0)))
+    out["removed"] = [r for r in prev.values() if r.get("status") == "Draft"]
+    return out
+
+# ------------------------------
+# التشغيل
+# ------------------------------
+def _split(employees: pd.DataFrame, leaves: pd.DataFrame, attendance: pd.DataFrame, chunk_size):
+    chunk_of = pd.Series(np.arange(len(employees)) // chunk_size, index=employees["emp_id"].astype(str).values)
+    lv_chunk = chunk_of.reindex(leaves["emp_id"].astype(str).values).values
+    att_chunk = chunk_of.reindex(attendance["emp_id"].astype(str).values).values
+    for i in range(int(np.ceil(len(employees) / chunk_size))):
+        yield (employees.iloc[i * chunk_size:(i + 1) * chunk_size], leaves[lv_chunk == i], attendance[att_chunk == i])
+
+def compute_period(employees, leaves, attendance, period_start, period_end, workers=None, chunk_size=CHUNK_SIZE) -> list:
+    """يوزّع الدفعات على عمليات منفصلة؛ الترتيب النهائي ثابت (حسب emp_id)."""
+    chunks = list(_split(employees, leaves, attendance, chunk_size))
+    if (workers or os.cpu_count() or 1) <= 1 or len(chunks) <= 1:
+        parts = [_compute_chunk(e, l, a, period_start, period_end) for e, l, a in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_compute_chunk, e, l, a, period_start, period_end) for e, l, a in chunks]
+            parts = [f.result() for f in futures]
+    return sorted((row for part in parts for row in part), key=lambda r: r["emp_id"])
+
+def write_rows(supabase, rows: list, run_id: str, chunk_size=WRITE_CHUNK_SIZE, threads=WRITE_THREADS) -> int:
+    """upsert على (emp_id, period_start, period_end) بدفعات متوازية."""
+    rows = [dict(r, run_id=run_id, updated_at=datetime.now().isoformat()) for r in rows]
+    def write(chunk):
+        supabase.table("payroll").upsert(chunk, on_conflict="emp_id,period_start,period_end",
+                                         returning=ReturnMethod.minimal).execute()
+        return len(chunk)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return sum(pool.map(write, [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]))
+
+def delete_removed(supabase, removed: list, period_start, period_end, chunk_size=WRITE_CHUNK_SIZE) -> int:
+    """يحذف صفوف Draft للفترة لموظفين لم يعودوا ضمن الحساب (status يُعاد فحصه عند الحذف)."""
+    ids = [str(r["emp_id"]) for r in removed]
+    for i in range(0, len(ids), chunk_size):
+        (supabase.table("payroll").delete(returning=ReturnMethod.minimal).in_("emp_id", ids[i:i + chunk_size])
+         .eq("period_start", str(period_start)).eq("period_end", str(period_end)).eq("status", "Draft").execute())
+    return len(ids)
+
+def run_payroll(supabase, period_start, period_end, dry_run=False, workers=None, chunk_size=CHUNK_SIZE):
+    """يعيد (الصفوف المحسوبة، الفرق مع التشغيل السابق، run_id أو None)."""
+    employees = load_employees(supabase)
+    leaves = load_leaves(supabase, period_start, period_end)
+    attendance = load_attendance(supabase, period_start, period_end)
+    previous = load_payroll(supabase, period_start, period_end)
+    rows = compute_period(employees, leaves, attendance, period_start, period_end, workers, chunk_size)
+    diff = diff_runs(rows, previous)
+    if dry_run: return rows, diff, None
+    run_id = uuid.uuid4().hex[:12]
+    write_rows(supabase, diff["new"] + [r for r, _ in diff["changed"]], run_id)
+    delete_removed(supabase, diff["removed"], period_start, period_end)
+    return rows, diff, run_id
+
+def summarize(rows: list, diff: dict, top=20) -> str:
+    lines = [
+        f"employees: {len(rows)}  gross: {sum(r['gross'] for r in rows):,.2f}  net: {sum(r['net'] for r in rows):,.2f}",
+        f"new: {len(diff['new'])}  changed: {len(diff['changed'])}  unchanged: {len(diff['unchanged'])}  "
+        f"locked (not Draft): {len(diff['locked'])}  no longer computed: {len(diff['removed'])}",
+    ]
+    for row, old_net in sorted(diff["changed"], key=lambda c: -abs(c[0]["net"] - c[1]))[:top]:
+        lines.append(f"  {row['emp_id']}: {old_net:,.2f} -> {row['net']:,.2f}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compute the payroll of a period for all employees")
+    ap.add_argument("--from", dest="date_from", required=True, help="period start YYYY-MM-DD")
+    ap.add_argument("--to", dest="date_to", required=True, help="period end YYYY-MM-DD")
+    ap.add_argument("--dry-run", action="store_true", help="compute and diff without writing")
+    ap.add_argument("--report", help="write the computed rows to this CSV")
+    ap.add_argument("--workers", type=int)
+    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = ap.parse_args(argv)
+
+    from src.utils.db import connect
+    rows, diff, run_id = run_payroll(connect(), args.date_from, args.date_to, args.dry_run, args.workers, args.chunk_size)
+    print(summarize(rows, diff))
+    if run_id: print(f"run {run_id}: wrote {len(diff['new']) + len(diff['changed'])} Draft rows, deleted {len(diff['removed'])}")
+    if args.report: pd.json_normalize(rows).to_csv(args.report, index=False, encoding="utf-8-sig")
+
+if __name__ == "__main__":
+    main()
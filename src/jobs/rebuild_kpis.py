@@ -0,0 +1,25 @@
+# src/jobs/rebuild_kpis.py
+# Full (or from-a-month) rebuild of the KPI aggregate tables, for backfills and repairs
+#
+#   python -m src.jobs.rebuild_kpis
+#   python -m src.jobs.rebuild_kpis --from 2025-01-01
+#
+# التحديث العادي يتم تلقائياً عبر trigger على requests؛ هذا الأمر يعيد الحساب من الطلبات نفسها.
+
+import argparse
+
+def rebuild_kpis(supabase, date_from=None) -> dict:
+    """يعيد عدد الصفوف المكتوبة في كل جدول تجميعي."""
+    return supabase.rpc("rebuild_kpis", {"p_from": str(date_from) if date_from else None}).execute().data or {}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Rebuild the KPI aggregates from requests")
+    ap.add_argument("--from", dest="date_from", help="only rebuild months >= YYYY-MM-DD")
+    args = ap.parse_args(argv)
+
+    from src.utils.db import connect
+    for table, rows in rebuild_kpis(connect(), args.date_from).items():
+        print(f"{table}: {rows} rows")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# src/jobs/score_requests.py
+# Background worker that scores pending requests into ai_analyses, skipping requests whose features did not change
+#
+#   python -m src.jobs.score_requests                         # يعمل باستمرار (HR_SCORING_MODEL أو rules)
+#   python -m src.jobs.score_requests --once --model weights.json
+#
+# score_candidates يعيد الطلبات المعلقة الجديدة أو المعدلة (أو التي مر على فحصها RECHECK_SECONDS) مع خصائصها في
+# استدعاء واحد. إذا طابق hash الخصائص المحفوظ لا يُستدعى النموذج ويُحدَّث checked_at فقط (save_request_scores).
+# صندوق المهام يقرأ الدرجة والملخص في نفس استعلام get_task_inbox.
+
+import argparse
+import time
+
+from src.utils.scoring import features, input_hash, get_model
+
+BATCH_SIZE = 200
+POLL_INTERVAL = 30           # ثوانٍ عند عدم وجود طلبات
+RECHECK_SECONDS = 6 * 3600   # الرصيد والتداخل والحضور تتغير دون تعديل الطلب
+
+def candidates(supabase, limit=BATCH_SIZE, recheck=RECHECK_SECONDS, after_id=0) -> list:
+    return supabase.rpc("score_candidates", {"p_limit": limit, "p_recheck_seconds": recheck, "p_after_id": after_id}).execute().data or []
+
+def save(supabase, results: list) -> dict:
+    if not results: return {}
+    return supabase.rpc("save_request_scores", {"p_results": results}).execute().data or {}
+
+def score_rows(model, rows: list, log=print) -> list:
+    """نتيجة لكل صف: كاملة إذا تغير الـ hash، وإلا {request_id, input_hash} فقط."""
+    results = []
+    for row in rows:
+        try:
+            feats = features(row)
+            h = input_hash(feats, model)
+            if h == row.get("input_hash"):
+                results.append({"request_id": row["id"], "input_hash": h}); continue
+            score, summary, details = model.score(feats)
+            results.append({"request_id": row["id"], "input_hash": h, "model": model.key, "score": score,
+                            "summary": summary, "details": dict(details, features=feats)})
+        except Exception as e:
+            log(f"score error request {row.get('id')}: {e}")
+    return results
+
+def run(supabase, model, once=False, batch=BATCH_SIZE, interval=POLL_INTERVAL, recheck=RECHECK_SECONDS, log=print) -> dict:
+    """كل دورة تمر على الطلبات المستحقة بترتيب id مرة واحدة. once: دورة واحدة ثم يعود."""
+    totals = {"scored": 0, "unchanged": 0}
+    after_id = 0
+    while True:
+        try:
+            rows = candidates(supabase, batch, recheck, after_id)
+            res = save(supabase, score_rows(model, rows, log))
+        except Exception as e:
+            log(f"score worker error: {e}")
+            if once: raise
+            time.sleep(interval); continue
+        for k in totals: totals[k] += res.get(k, 0)
+        if rows:
+            log(f"{len(rows)} candidates: {res.get('scored', 0)} scored, {res.get('unchanged', 0)} unchanged")
+            after_id = rows[-1]["id"]
+        if len(rows) < batch:
+            if once: return totals
+            after_id = 0
+            time.sleep(interval)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Score pending requests into ai_analyses")
+    ap.add_argument("--model", help='"rules" or a logistic weights JSON file (default: HR_SCORING_MODEL or rules)')
+    ap.add_argument("--once", action="store_true", help="score everything due now and exit")
+    ap.add_argument("--batch", type=int, default=BATCH_SIZE)
+    ap.add_argument("--interval", type=float, default=POLL_INTERVAL)
+    ap.add_argument("--recheck", type=int, default=RECHECK_SECONDS, help="seconds before an unchanged request is checked again")
+    args = ap.parse_args(argv)
+
+    from src.utils.db import connect
+    model = get_model(args.model)
+    totals = run(connect(), model, args.once, args.batch, args.interval, args.recheck)
+    print(f"model {model.key}: scored {totals['scored']}, unchanged {totals['unchanged']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# src/modules/analytics.py
+# HR analytics page (KPIs of docs/HR_CRM_Policies_and_Procedures.md §13), read from the kpi_* aggregate tables only
+
+from datetime import date
+
+import pandas as pd
+import streamlit as st
+
+from src.utils.roles import HR_ROLES
+
+ANALYTICS_ROLES = HR_ROLES
+KPI_CACHE_TTL = 60  # ثوانٍ
+STAGES = {"substitute": "البديل", "manager": "المدير المباشر", "hr": "الموارد البشرية"}
+LATENCY_BUCKETS = ["أقل من ساعة", "1-4 ساعات", "4-24 ساعة", "1-3 أيام", "3-7 أيام", "أكثر من أسبوع"]
+
+def _month_start(months_back: int) -> date:
+    today = date.today()
+    y, m = divmod(today.year * 12 + today.month - 1 - months_back, 12)
+    return date(y, m + 1, 1)
+
+@st.cache_data(ttl=KPI_CACHE_TTL, show_spinner=False)
+def load_kpis(_client, since: date):
+    """الجداول التجميعية منذ since (صفوف قليلة: قسم × مرحلة × شهر × فئة)."""
+    def fetch(table):
+        return pd.DataFrame(_client.table(table).select("*").gte("period", str(since)).execute().data or [])
+    return fetch("kpi_stage_latency"), fetch("kpi_dept_outcomes"), fetch("kpi_leave_duration")
+
+def render_analytics(client, user):
+    if user["role"] not in ANALYTICS_ROLES: st.error("HR Only"); return
+    st.title("📊 مؤشرات الأداء")
+
+    c1, c2 = st.columns(2)
+    months = c1.selectbox("الفترة", [1, 3, 6, 12], index=1, format_func=lambda m: f"آخر {m} شهر")
+    stage_df, outcome_df, leave_df = load_kpis(client, _month_start(months - 1))
+    depts = sorted(set(stage_df.get("dept", [])) | set(outcome_df.get("dept", [])))
+    dept = c2.selectbox("القسم", ["الكل"] + depts)
+    if dept != "الكل":
+        stage_df, outcome_df, leave_df = (df[df["dept"] == dept] if len(df) else df for df in (stage_df, outcome_df, leave_df))
+
+    # زمن الاعتماد لكل مرحلة
+    st.subheader("⏱️ متوسط زمن الاعتماد")
+    if len(stage_df) and stage_df["decisions"].sum():
+        per_stage = stage_df.groupby("stage")[["decisions", "latency_seconds"]].sum()
+        cols = st.columns(len(STAGES))
+        for col, (stage, label) in zip(cols, STAGES.items()):
+            if stage in per_stage.index and per_stage.at[stage, "decisions"]:
+                hours = per_stage.at[stage, "latency_seconds"] / per_stage.at[stage, "decisions"] / 3600
+                col.metric(label, f"{hours:,.1f} ساعة", f"{int(per_stage.at[stage, 'decisions'])} قرار", delta_color="off")
+            else:
+                col.metric(label, "-")
+        hist = stage_df.pivot_table(index="bucket", columns="stage", values="decisions", aggfunc="sum", fill_value=0)
+        hist = hist.reindex(range(len(LATENCY_BUCKETS)), fill_value=0)
+        hist.index = LATENCY_BUCKETS
+        st.bar_chart(hist.rename(columns=STAGES), stack=False)
+    else:
+        st.caption("لا توجد قرارات في هذه الفترة")
+
+    # نسبة الرفض لكل قسم
+    st.subheader("❌ نسبة الرفض لكل قسم")
+    if len(outcome_df):
+        by_dept = outcome_df.groupby("dept")[["approved", "rejected"]].sum()
+        by_dept = by_dept[(by_dept["approved"] + by_dept["rejected"]) > 0]
+        by_dept["نسبة الرفض %"] = (100 * by_dept["rejected"] / (by_dept["approved"] + by_dept["rejected"])).round(1)
+        st.dataframe(by_dept.rename(columns={"approved": "معتمد", "rejected": "مرفوض"}))
+    else:
+        st.caption("لا توجد طلبات منتهية في هذه الفترة")
+
+    # متوسط مدة الإجازة
+    st.subheader("🌴 متوسط مدة الإجازة")
+    if len(leave_df) and leave_df["leaves"].sum():
+        by_dept = leave_df.groupby("dept")[["leaves", "days"]].sum()
+        by_dept = by_dept[by_dept["leaves"] > 0]
+        by_dept["متوسط الأيام"] = (by_dept["days"] / by_dept["leaves"]).round(1)
+        st.dataframe(by_dept.rename(columns={"leaves": "عدد الإجازات", "days": "مجموع الأيام"}))
+        if st.toggle("لكل موظف", key="kpi_leave_per_emp"):
+            by_emp = leave_df.groupby("emp_id")[["leaves", "days"]].sum()
+            by_emp = by_emp[by_emp["leaves"] > 0]
+            by_emp["متوسط الأيام"] = (by_emp["days"] / by_emp["leaves"]).round(1)
+            st.dataframe(by_emp.sort_values("days", ascending=False).rename(columns={"leaves": "عدد الإجازات", "days": "مجموع الأيام"}))
+    else:
+        st.caption("لا توجد إجازات معتمدة في هذه الفترة")
@@ -4,57 +4,86 @@
 import streamlit as st
 from src.utils.db import init_supabase, now_iso
 from src.utils.audit import audit_log
-
-supabase = init_supabase()
+from src.utils.inbox import fetch_inbox
+from src.utils.transitions import bulk_transition
+from src.utils.change_feed import get_change_feed
+from src.utils.scoring import score_badge
 
 def get_tasks_for(user):
     tasks = []
     try:
-        # substitute tasks
         if user:
-            sub = supabase.table("requests").select("*").eq("substitute_id", user['emp_id']).eq("status_substitute", "Pending").execute().data or []
-            for r in sub: r['task_type'] = 'Substitute'; tasks.append(r)
-            if user['role'] in ('Supervisor','Manager'):
-                mgr = supabase.table("requests").select("*").eq("dept", user['dept']).eq("status_manager", "Pending").execute().data or []
-                for r in mgr:
-                    if r['status_substitute'] in ('Approved','Not Required'):
-                        r['task_type'] = 'Manager'; tasks.append(r)
-            if user['role'] == 'HR':
-                hr = supabase.table("requests").select("*").eq("status_manager", "Approved").eq("status_hr", "Pending").execute().data or []
-                for r in hr: r['task_type']='HR'; tasks.append(r)
+            tasks, _ = fetch_inbox(init_supabase(), user['role'], user['emp_id'], user['dept'], history_limit=0)
     except Exception as e:
         st.error("خطأ في جلب المهام.")
     return tasks
 
+def render_bulk_actions(client, user, tasks, key="bulk", on_change=None):
+    """تحديد عدة مهام واعتمادها/رفضها في معاملة واحدة (مع سجل المراجعة). on_change: يُستدعى بعد التنفيذ."""
+    result = st.session_state.pop(f"{key}_result", None)
+    if result:
+        updated, skipped = result
+        if updated: st.success(f"تم تنفيذ الإجراء على {len(updated)} طلب.")
+        if skipped: st.warning(f"تم تجاوز {len(skipped)} طلب لأن معتمداً آخر عدّلها: {', '.join(map(str, skipped))}")
+    if len(tasks) < 2: return
+    by_id = {r['id']: r for r in tasks}
+    with st.expander(f"☑️ إجراء جماعي ({len(tasks)})"):
+        if st.checkbox("تحديد الكل", key=f"{key}_all"):
+            picked = list(by_id)
+        else:
+            picked = st.multiselect("المهام", list(by_id), key=f"{key}_ids",
+                                    format_func=lambda i: f"#{i} {by_id[i]['emp_name']} - {by_id[i]['service_type']}")
+        note = st.text_input("ملاحظة", key=f"{key}_note")
+        c1, c2 = st.columns(2)
+        status = None
+        if c1.button(f"✅ اعتماد المحدد ({len(picked)})", key=f"{key}_ok", disabled=not picked): status = "Approved"
+        if c2.button(f"❌ رفض المحدد ({len(picked)})", key=f"{key}_no", disabled=not picked): status = "Rejected"
+        if status:
+            try:
+                st.session_state[f"{key}_result"] = bulk_transition(client, [by_id[i] for i in picked], status, note, user)
+                get_change_feed(client).touch()
+                if on_change: on_change()
+            except Exception as e:
+                st.error(f"فشل الإجراء الجماعي: {e}")
+                return
+            for k in (f"{key}_ids", f"{key}_all"):
+                if k in st.session_state: del st.session_state[k]
+            st.rerun()
+
 def render_approvals(user):
+    supabase = init_supabase()
     st.title("✅ مهام الاعتماد")
     tasks = get_tasks_for(user)
+    render_bulk_actions(supabase, user, tasks)
     if not tasks:
         st.info("لا توجد مهام.")
         return
     for r in tasks:
-        with st.expander(f"{r['service_type']} - {r['emp_name']}", expanded=True):
+        with st.expander(f"{r['service_type']} - {r['emp_name']} {score_badge(r.get('ai_score'))}", expanded=True):
+            if r.get('ai_summary'): st.caption(r['ai_summary'])
             st.write(r.get('details'))
             note = st.text_input("ملاحظات", key=f"note_{r['id']}")
             c1,c2 = st.columns(2)
             if c1.button("قبول", key=f"ok_{r['id']}"):
                 field = 'status_substitute' if r['task_type']=='Substitute' else 'status_manager' if r['task_type']=='Manager' else 'status_hr'
-                supabase.table("requests").update({
+                res = supabase.table("requests").update({
                     field: "Approved",
                     f"{field.replace('status_','')}_note": note,
                     f"{field.replace('status_','')}_action_at": now_iso(),
                     "updated_at": now_iso()
                 }).eq("id", r['id']).execute()
+                get_change_feed(supabase).touch(res.data)
                 audit_log(supabase, user, f"approve:{field}", target_request_id=r['id'], note=note)
                 st.experimental_rerun()
             if c2.button("رفض", key=f"no_{r['id']}"):
                 field = 'status_substitute' if r['task_type']=='Substitute' else 'status_manager' if r['task_type']=='Manager' else 'status_hr'
-                supabase.table("requests").update({
+                res = supabase.table("requests").update({
                     field: "Rejected",
                     f"{field.replace('status_','')}_note": note,
                     f"{field.replace('status_','')}_action_at": now_iso(),
                     "final_status": "Rejected",
                     "updated_at": now_iso()
                 }).eq("id", r['id']).execute()
+                get_change_feed(supabase).touch(res.data)
                 audit_log(supabase, user, f"reject:{field}", target_request_id=r['id'], note=note)
                 st.experimental_rerun()
\ No newline at end of file
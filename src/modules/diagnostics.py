@@ -0,0 +1,62 @@
+# src/modules/diagnostics.py
+# Admin diagnostics page: per-query latency/rows/bytes, round trips per page render, slow-query log, cache stats, JSON/Prometheus export
+
+import pandas as pd
+import streamlit as st
+
+from src.utils.metrics import get_metrics, quantile_ms
+from src.utils.employee_cache import get_employee_cache
+from src.utils.pdf_cache import get_pdf_cache
+from src.utils.change_feed import get_change_feed
+from src.utils.roles import ADMIN_ROLES
+
+DIAGNOSTICS_ROLES = ADMIN_ROLES
+
+def _ms(seconds, n=1):
+    return round(1000 * seconds / n, 1) if n else None
+
+def render_diagnostics(user):
+    if user["role"] not in DIAGNOSTICS_ROLES: st.error("Admin Only"); return
+    metrics = get_metrics()
+    snap = metrics.snapshot()
+    st.title("🩺 التشخيص")
+    st.caption(f"منذ {snap['started_at']} | الاستعلام البطيء ≥ {snap['slow_query_ms']:.0f}ms")
+
+    c1, c2, c3 = st.columns(3)
+    c1.download_button("⬇️ JSON", metrics.to_json(), "hr_metrics.json", "application/json")
+    c2.download_button("⬇️ Prometheus", metrics.to_prometheus(), "hr_metrics.prom", "text/plain")
+    if c3.button("🔄 تصفير"): metrics.reset(); st.rerun()
+
+    # لكل صفحة: متوسط الرحلات إلى القاعدة لكل رسم
+    st.subheader("📄 الصفحات")
+    if snap["pages"]:
+        pages = pd.DataFrame([{"الصفحة": page, "مرات الرسم": p["renders"],
+                               "متوسط الرحلات": round(p["round_trips"] / p["renders"], 1), "أقصى رحلات": p["max_round_trips"],
+                               "متوسط الرسم ms": _ms(p["seconds"], p["renders"]), "منها القاعدة ms": _ms(p["query_seconds"], p["renders"]),
+                               "متوسط KB": round(p["bytes"] / p["renders"] / 1024, 1)} for page, p in snap["pages"].items()])
+        st.dataframe(pages.sort_values("متوسط الرحلات", ascending=False), hide_index=True)
+        with st.expander("آخر عمليات الرسم"):
+            st.dataframe(pd.DataFrame(snap["renders"][::-1]), hide_index=True)
+    else:
+        st.caption("لا توجد بيانات بعد")
+
+    # لكل استعلام: الزمن والصفوف والحجم
+    st.subheader("🗄️ الاستعلامات")
+    if snap["queries"]:
+        queries = pd.DataFrame([{"الاستعلام": label, "العدد": q["calls"], "أخطاء": q["errors"],
+                                 "متوسط ms": _ms(q["seconds"], q["calls"]), "p50 ≤ms": quantile_ms(q["buckets"], 0.5),
+                                 "p95 ≤ms": quantile_ms(q["buckets"], 0.95), "أقصى ms": _ms(q["max_seconds"]),
+                                 "الصفوف": q["rows"], "KB": round(q["bytes"] / 1024, 1)} for label, q in snap["queries"].items()])
+        st.dataframe(queries.sort_values("العدد", ascending=False), hide_index=True)
+        label = st.selectbox("توزيع الزمن", sorted(snap["queries"]))
+        hist = pd.Series(snap["queries"][label]["buckets"],
+                         index=[f"≤{b}ms" for b in snap["latency_buckets_ms"]] + [f">{snap['latency_buckets_ms'][-1]}ms"])
+        st.bar_chart(hist)
+
+    st.subheader("🐢 الاستعلامات البطيئة")
+    if snap["slow"]: st.dataframe(pd.DataFrame(snap["slow"][::-1]), hide_index=True)
+    else: st.caption("لا يوجد")
+
+    st.subheader("🧠 الكاش")
+    st.json({"employees": get_employee_cache().stats(), "pdf": get_pdf_cache().stats(),
+             "change_feed": get_change_feed().counters.stats()}, expanded=False)
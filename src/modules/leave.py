@@ -4,15 +4,16 @@
 import streamlit as st
 from src.utils.db import init_supabase, now_iso
 from src.utils.audit import audit_log
+from src.utils.employee_cache import get_employee_cache
+from src.utils.change_feed import get_change_feed
+from src.modules.leave_calendar import check_leave
 import json
 from datetime import date
 
-supabase = init_supabase()
-
 def get_user(emp_id):
+    supabase = init_supabase()
     if not supabase: return None
-    res = supabase.table("employees").select("*").eq("emp_id", emp_id).execute()
-    return res.data[0] if res.data else None
+    return get_employee_cache(supabase).get(emp_id)
 
 def get_leave_balances(emp_id):
     user = get_user(emp_id)
@@ -24,6 +25,7 @@ def get_leave_balances(emp_id):
     return lb
 
 def render_leave_module(user):
+    supabase = init_supabase()
     st.header("🌴 إدارة الإجازات")
     lb = get_leave_balances(user['emp_id'])
     if lb:
@@ -43,7 +45,12 @@ def render_leave_module(user):
             if days <= 0:
                 st.error("التحقق من التواريخ.")
                 return
+            if not check_leave(user['emp_id'], user['dept'], d1, d2, sub_id or None):
+                return
             payload = {
+                "emp_id": user['emp_id'],
+                "emp_name": user['name'],
+                "dept": user['dept'],
                 "service_type": "إجازة",
                 "sub_type": ltype,
                 "details": reason,
@@ -59,7 +66,8 @@ def render_leave_module(user):
                 su = get_user(sub_id)
                 if su: payload["substitute_name"] = su.get("name")
             try:
-                supabase.table("requests").insert(payload).execute()
+                res = supabase.table("requests").insert(payload).execute()
+                get_change_feed(supabase).touch(res.data)
                 audit_log(supabase, user, "create:leave", note=f"{ltype} {days} days")
                 st.success("تم إرسال طلب الإجازة.")
             except Exception as e:
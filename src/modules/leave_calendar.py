@@ -0,0 +1,89 @@
+# src/modules/leave_calendar.py
+# Leave overlap/coverage checks (submission + inbox) and the department month calendar, all served from src/utils/leave_index.py
+
+import calendar
+from datetime import date
+
+import pandas as pd
+import streamlit as st
+
+from src.utils.db import init_supabase
+from src.utils.leave_index import get_leave_index
+from src.utils.roles import HR_ROLES, MANAGER_ROLES
+
+CALENDAR_ROLES = MANAGER_ROLES + HR_ROLES
+ALL_DEPTS_ROLES = HR_ROLES
+STATUS_MARK = {"Approved": "🌴", "Pending": "⏳"}
+
+def leave_index():
+    try:
+        return get_leave_index(init_supabase())
+    except Exception as e:
+        st.warning(f"تعذر تحميل فهرس الإجازات: {e}")
+        return None
+
+def _span(e):
+    return f"{date.fromordinal(e['start'])} → {date.fromordinal(e['end'])}"
+
+def check_leave(emp_id, dept, d1, d2, substitute_id=None, exclude_id=None) -> bool:
+    """يعرض نتائج الفحص؛ يعيد False إذا كان للموظف إجازة متداخلة (تمنع الإرسال). البديل والتغطية تحذير فقط."""
+    index = leave_index()
+    if index is None or d2 < d1: return True
+    own = index.overlaps(emp_id, d1, d2, exclude_id)
+    for e in own: st.error(f"⛔ لديك إجازة ({STATUS_MARK.get(e['status'], '')} {e['sub_type']}) متداخلة: {_span(e)}")
+    if substitute_id:
+        for e in index.overlaps(substitute_id, d1, d2): st.warning(f"⚠️ البديل في إجازة خلال {_span(e)}")
+    cov = index.coverage(dept, d1, d2, extra_emp_id=emp_id, exclude_id=exclude_id)
+    if not cov["ok"]:
+        st.warning(f"⚠️ تغطية القسم: يبقى {cov['min_present']} من {cov['headcount']} يوم {cov['worst_day']} "
+                   f"(الحد الأدنى {cov['min_ratio']:.0%})")
+    return not own
+
+def render_task_leave_context(r):
+    """في صندوق المدير/HR: إجازات القسم المتداخلة مع الطلب وتغطية القسم إن اعتُمد."""
+    if r.get("service_type") != "إجازة" or not r.get("start_date") or not r.get("end_date"): return
+    index = leave_index()
+    if index is None: return
+    others = index.dept_leaves(r["dept"], r["start_date"], r["end_date"], exclude_id=r["id"])
+    cov = index.coverage(r["dept"], r["start_date"], r["end_date"], extra_emp_id=r["emp_id"], exclude_id=r["id"])
+    st.caption(f"📅 {r['start_date']} → {r['end_date']} | تغطية القسم: {cov['min_present']}/{cov['headcount']}"
+               + ("" if cov["ok"] else f" ⚠️ أقل من {cov['min_ratio']:.0%}"))
+    if others:
+        st.caption("متداخلة: " + "، ".join(f"{STATUS_MARK.get(e['status'], '')} {e['emp_name']} ({_span(e)})" for e in others))
+
+def month_grid(index, dept, year, month) -> pd.DataFrame:
+    """صف لكل موظف لديه إجازة في الشهر + صف التغطية اليومية."""
+    n = calendar.monthrange(year, month)[1]
+    first = date(year, month, 1).toordinal()
+    names, cells = {}, {}
+    for e in index.month(dept, year, month):
+        names[e["emp_id"]] = e["emp_name"] or e["emp_id"]
+        row = cells.setdefault(e["emp_id"], [""] * n)
+        for d in range(max(e["start"], first), min(e["end"], first + n - 1) + 1):
+            # المعتمدة تغلب المعلقة في نفس اليوم
+            if row[d - first] != STATUS_MARK["Approved"]: row[d - first] = STATUS_MARK.get(e["status"], "")
+    grid = pd.DataFrame([cells[k] for k in cells], index=[names[k] for k in cells], columns=[str(d) for d in range(1, n + 1)])
+    headcount = index.headcount.get(dept, 0)
+    absent = [sum(1 for k in cells if cells[k][i]) for i in range(n)]
+    grid.loc["👥 الحضور"] = [f"{headcount - a}/{headcount}" for a in absent]
+    return grid
+
+def render_leave_calendar(user):
+    if user["role"] not in CALENDAR_ROLES: st.error("Managers Only"); return
+    st.title("📅 تقويم إجازات القسم")
+    index = leave_index()
+    if index is None: return
+    today = date.today()
+    c1, c2, c3 = st.columns(3)
+    if user["role"] in ALL_DEPTS_ROLES:
+        depts = index.depts() or [user["dept"]]
+        dept = c1.selectbox("القسم", depts, index=depts.index(user["dept"]) if user["dept"] in depts else 0)
+    else:
+        dept = user["dept"]; c1.text_input("القسم", dept, disabled=True)
+    year = c2.number_input("السنة", 2000, 2100, today.year)
+    month = c3.selectbox("الشهر", range(1, 13), index=today.month - 1)
+    grid = month_grid(index, dept, int(year), int(month))
+    if len(grid) == 1: st.info("لا توجد إجازات في هذا الشهر.")
+    st.dataframe(grid)
+    st.caption(f"{STATUS_MARK['Approved']} معتمدة | {STATUS_MARK['Pending']} معلقة | "
+               f"الحد الأدنى للحضور {index.min_coverage:.0%} من {index.headcount.get(dept, 0)}")
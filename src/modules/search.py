@@ -0,0 +1,44 @@
+# src/modules/search.py
+# HR request search page: Arabic-normalized full text over names, details and notes, with dept/status/date filters
+
+import streamlit as st
+
+from src.utils.search import search_requests, highlight, SEARCH_PAGE_SIZE
+from src.utils.roles import HR_ROLES
+
+SEARCH_ROLES = HR_ROLES
+STATUS_LABELS = {"": "الكل", "Pending": "قيد الانتظار", "Approved": "معتمد", "Rejected": "مرفوض"}
+
+def render_search(client, user):
+    if user["role"] not in SEARCH_ROLES: st.error("HR Only"); return
+    st.title("🔎 البحث في الطلبات")
+    with st.form("search_form"):
+        query = st.text_input("كلمات البحث", placeholder="اسم الموظف، نوع الإجازة، التفاصيل، الملاحظات...")
+        c1, c2, c3, c4 = st.columns(4)
+        dept = c1.text_input("القسم")
+        status = c2.selectbox("الحالة", list(STATUS_LABELS), format_func=STATUS_LABELS.get)
+        date_from = c3.date_input("من", value=None)
+        date_to = c4.date_input("إلى", value=None)
+        if st.form_submit_button("بحث"):
+            st.session_state["search"] = {"query": query, "dept": dept.strip(), "status": status,
+                                          "date_from": date_from, "date_to": date_to, "page": 0}
+    params = st.session_state.get("search")
+    if not params or not params["query"].strip(): return
+
+    try:
+        rows, total = search_requests(client, **params)
+    except Exception as e:
+        st.error(f"فشل البحث: {e}"); return
+    pages = max((total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE, 1)
+    st.caption(f"{total} نتيجة | صفحة {params['page'] + 1} من {pages}")
+    for r in rows:
+        with st.container(border=True):
+            st.markdown(f"**#{r['id']}** {highlight(r['emp_name'], params['query'])} | {r['dept']} | "
+                        f"{r['service_type']} {highlight(r.get('sub_type'), params['query'])} | "
+                        f"{STATUS_LABELS.get(r['final_status'], r['final_status'])} | {(r.get('created_at') or '')[:10]}")
+            for label, key in (("التفاصيل", "details"), ("ملاحظة المدير", "manager_note"), ("ملاحظة HR", "hr_note")):
+                if r.get(key): st.markdown(f"{label}: {highlight(r[key], params['query'])}")
+
+    c1, _, c2 = st.columns([1, 3, 1])
+    if params["page"] > 0 and c1.button("→ السابق"): params["page"] -= 1; st.rerun()
+    if params["page"] + 1 < pages and c2.button("التالي ←"): params["page"] += 1; st.rerun()
@@ -1,15 +1,159 @@
 # src/utils/audit.py
 # Audit logging helpers
+#
+# audit_log() only enqueues the event. A background thread flushes batches into `audit_logs`
+# (by size or time); anything that cannot be delivered is appended to a local spool file
+# which is replayed on the next startup. Every event carries an event_id so replays are idempotent.
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+AUDIT_BATCH_SIZE = 100
+AUDIT_FLUSH_INTERVAL = 2.0    # ثوانٍ
+AUDIT_QUEUE_SIZE = 10000
+AUDIT_ENQUEUE_TIMEOUT = 0.05  # backpressure: أقصى انتظار عند امتلاء الطابور قبل الكتابة للـ spool
+AUDIT_MAX_RETRIES = 3
+AUDIT_SPOOL_PATH = os.environ.get(
+    "HR_AUDIT_SPOOL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "spool", "audit_spool.jsonl"))
+
+class AuditWriter:
+    def __init__(self, supabase, spool_path=AUDIT_SPOOL_PATH, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL, queue_size=AUDIT_QUEUE_SIZE):
+        self.supabase = supabase
+        self.spool_path = os.path.abspath(spool_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._q = queue.Queue(maxsize=queue_size)
+        self._spool_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._idle = threading.Event(); self._idle.set()
+        self.sent = self.spilled = self.failed_batches = 0
+        os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    # ------------------------------
+    # طرف المُنتِج (مسار الاعتماد)
+    # ------------------------------
+    def enqueue(self, event: dict):
+        try:
+            self._q.put(event, timeout=AUDIT_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            self._spill([event])
+
+    # ------------------------------
+    # الخيط الخلفي
+    # ------------------------------
+    def _run(self):
+        self.replay_spool()
+        while not self._stop.is_set() or not self._q.empty():
+            batch = self._next_batch()
+            if batch: self._deliver(batch)
+
+    def _next_batch(self):
+        batch, deadline = [], time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (self._stop.is_set() and self._q.empty()): break
+            try:
+                batch.append(self._q.get(timeout=remaining))
+                self._idle.clear()
+            except queue.Empty:
+                break
+        if not batch and self._q.empty(): self._idle.set()
+        return batch
+
+    def _insert(self, batch):
+        self.supabase.table("audit_logs").upsert(batch, on_conflict="event_id,created_at", ignore_duplicates=True).execute()
+
+    def _deliver(self, batch):
+        for attempt in range(AUDIT_MAX_RETRIES):
+            try:
+                self._insert(batch)
+                self.sent += len(batch)
+                return True
+            except Exception as e:
+                print("audit_log error:", e)
+                if self._stop.is_set(): break
+                time.sleep(0.5 * 2 ** attempt)
+        self.failed_batches += 1
+        self._spill(batch)
+        return False
+
+    # ------------------------------
+    # الـ spool المحلي
+    # ------------------------------
+    def _spill(self, events):
+        with self._spool_lock:
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                for e in events: f.write(json.dumps(e, ensure_ascii=False, default=str) + "\n")
+                f.flush(); os.fsync(f.fileno())
+            self.spilled += len(events)
+
+    def replay_spool(self):
+        """يعيد إرسال ما بقي في الـ spool من تشغيل سابق (بما فيها إعادة إرسال قُطعت)."""
+        directory, name = os.path.split(self.spool_path)
+        with self._spool_lock:
+            if os.path.exists(self.spool_path):
+                os.replace(self.spool_path, f"{self.spool_path}.replay-{os.getpid()}-{int(time.time())}")
+            pending = sorted(f for f in os.listdir(directory) if f.startswith(name + ".replay-"))
+        for fname in pending:
+            path = os.path.join(directory, fname)
+            with open(path, encoding="utf-8") as f:
+                events = [json.loads(line) for line in f if line.strip()]
+            for i in range(0, len(events), self.batch_size):
+                batch = events[i:i + self.batch_size]
+                try: self._insert(batch); self.sent += len(batch)
+                except Exception as e:
+                    print("audit_log replay error:", e)
+                    self._spill(events[i:])
+                    break
+            os.remove(path)
+
+    def flush(self, timeout=10.0):
+        """ينتظر حتى يُفرَّغ الطابور (للاختبارات وعند الإغلاق)."""
+        deadline = time.monotonic() + timeout
+        while (not self._q.empty() or not self._idle.is_set()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def close(self, timeout=10.0):
+        self._stop.set()
+        self._thread.join(timeout)
+        leftover = []
+        while True:
+            try: leftover.append(self._q.get_nowait())
+            except queue.Empty: break
+        if leftover: self._spill(leftover)
+
+    def stats(self):
+        return {"queued": self._q.qsize(), "sent": self.sent, "spilled": self.spilled, "failed_batches": self.failed_batches}
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_audit_writer(supabase):
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AuditWriter(supabase)
+            atexit.register(_writer.close)
+        elif _writer.supabase is None and supabase is not None:
+            _writer.supabase = supabase
+    return _writer
 
 def audit_log(supabase, actor, action, target_request_id=None, note=None):
-    try:
-        supabase.table("audit_logs").insert({
-            "actor_emp_id": actor.get("emp_id"),
-            "actor_name": actor.get("name"),
-            "action": action,
-            "target_request_id": target_request_id,
-            "note": note,
-            "created_at": __import__("datetime").datetime.utcnow().isoformat()
-        }).execute()
-    except Exception as e:
-        print("audit_log error:", e)
\ No newline at end of file
+    get_audit_writer(supabase).enqueue({
+        "event_id": str(uuid.uuid4()),
+        "actor_emp_id": actor.get("emp_id"),
+        "actor_name": actor.get("name"),
+        "action": action,
+        "target_request_id": target_request_id,
+        "note": note,
+        "created_at": datetime.utcnow().isoformat()
+    })
@@ -0,0 +1,103 @@
+# src/utils/audit_archive.py
+# Cold archive of audit_logs months (Parquet, zstd) and history lookups that merge it with the live partitions
+#
+# كل شهر مؤرشف ملف واحد audit_logs_YYYY_MM.parquet مرتب حسب (target_request_id, created_at)، فإحصاءات
+# row groups تسمح لـ pyarrow بتخطي معظم الملف عند البحث عن طلب واحد. الأرشفة: src/jobs/archive_audit_logs.py.
+
+import os
+from datetime import datetime
+
+ARCHIVE_DIR = os.environ.get(
+    "HR_AUDIT_ARCHIVE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "archive", "audit"))
+AUDIT_COLUMNS = ("id", "event_id", "actor_emp_id", "actor_name", "action", "target_request_id", "note", "created_at")
+PAGE_SIZE = 1000
+ROW_GROUP_SIZE = 10000
+
+def archive_path(month: str, directory=ARCHIVE_DIR) -> str:
+    """month: YYYY-MM"""
+    return os.path.join(os.path.abspath(directory), f"audit_logs_{month.replace('-', '_')}.parquet")
+
+def archived_months(directory=ARCHIVE_DIR) -> list:
+    if not os.path.isdir(directory): return []
+    return sorted(f[11:18].replace("_", "-") for f in os.listdir(directory) if f.startswith("audit_logs_") and f.endswith(".parquet"))
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([("id", pa.int64()), ("event_id", pa.string()), ("actor_emp_id", pa.string()), ("actor_name", pa.string()),
+                      ("action", pa.string()), ("target_request_id", pa.int64()), ("note", pa.string()),
+                      ("created_at", pa.timestamp("us", tz="UTC"))])
+
+def _ts(v):
+    return datetime.fromisoformat(v) if isinstance(v, str) else v
+
+# ------------------------------
+# الكتابة (مهمة الأرشفة)
+# ------------------------------
+def _fetch_all(query) -> list:
+    """كل صفوف query() صفحة بعد صفحة على id (حد PostgREST لا يقطع النتيجة). query يبني استعلاماً جديداً لكل صفحة."""
+    rows, last_id = [], 0
+    while True:
+        page = query().gt("id", last_id).order("id").limit(PAGE_SIZE).execute().data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE: return rows
+        last_id = page[-1]["id"]
+
+def fetch_month(supabase, start, end) -> list:
+    """كل أحداث [start, end) من الجدول الحي (التقسيم يقصر البحث على شهر واحد)."""
+    return _fetch_all(lambda: supabase.table("audit_logs").select(",".join(AUDIT_COLUMNS))
+                      .gte("created_at", str(start)).lt("created_at", str(end)))
+
+def _key(r):
+    return r.get("event_id") or ("id", r["id"])
+
+def write_month(rows, month: str, directory=ARCHIVE_DIR) -> str:
+    """يكتب الشهر ذرياً (ملف مؤقت ثم replace) ويتحقق من عدد الصفوف بإعادة قراءة الملف. إن كان الشهر مؤرشفاً من قبل
+    (أحداث متأخرة أعادت إنشاء قسمه، مثل إعادة إرسال الـ spool بـ created_at الأصلي) تُدمج الصفوف مع الملف الموجود
+    بدون تكرار (event_id/id)، فلا يُستبدل أرشيف بجزء منه أبداً."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    os.makedirs(directory, exist_ok=True)
+    path = archive_path(month, directory)
+    merged = {}
+    if os.path.exists(path):
+        for r in pq.read_table(path).to_pylist(): merged[_key(r)] = r
+    for r in rows: merged.setdefault(_key(r), r)
+    rows = sorted(merged.values(), key=lambda r: (r.get("target_request_id") is None, r.get("target_request_id") or 0, _ts(r["created_at"])))
+    table = pa.Table.from_pylist([dict({k: r.get(k) for k in AUDIT_COLUMNS}, created_at=_ts(r["created_at"])) for r in rows],
+                                 schema=_schema())
+    pq.write_table(table, path + ".tmp", compression="zstd", row_group_size=ROW_GROUP_SIZE)
+    if pq.ParquetFile(path + ".tmp").metadata.num_rows != len(rows):
+        os.remove(path + ".tmp")
+        raise IOError(f"archive verification failed for {month}")
+    os.replace(path + ".tmp", path)
+    return path
+
+# ------------------------------
+# القراءة (الحي + الأرشيف)
+# ------------------------------
+def read_archive(column, value, directory=ARCHIVE_DIR) -> list:
+    if not archived_months(directory): return []
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(os.path.abspath(directory), format="parquet", schema=_schema(),
+                         exclude_invalid_files=True, ignore_prefixes=[".", "_"])
+    rows = dataset.to_table(filter=ds.field(column) == value).to_pylist()
+    for r in rows: r["created_at"] = r["created_at"].isoformat()
+    return rows
+
+def history(supabase, column, value, directory=ARCHIVE_DIR) -> list:
+    """أحداث column = value من الأقسام الحية والأرشيف معاً، بالترتيب الزمني. الشهر المؤرشف الذي لم يُفصل بعد
+    يظهر في المصدرين فيُحذف التكرار بـ event_id/id."""
+    hot = _fetch_all(lambda: supabase.table("audit_logs").select(",".join(AUDIT_COLUMNS)).eq(column, value))
+    seen, merged = set(), []
+    for r in hot + read_archive(column, value, directory):
+        key = _key(r)
+        if key in seen: continue
+        seen.add(key); merged.append(r)
+    return sorted(merged, key=lambda r: (_ts(r["created_at"]), r["id"]))
+
+def request_history(supabase, request_id, directory=ARCHIVE_DIR) -> list:
+    """كل ما حدث للطلب."""
+    return history(supabase, "target_request_id", int(request_id), directory)
+
+def actor_history(supabase, emp_id, directory=ARCHIVE_DIR) -> list:
+    return history(supabase, "actor_emp_id", str(emp_id), directory)
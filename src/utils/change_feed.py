@@ -0,0 +1,215 @@
+# src/utils/change_feed.py
+# Change feed for `requests`: in-process bus + optional Postgres LISTEN/NOTIFY, per-audience pending-task counters
+#
+# كل تغيير على requests يصل كحدث {"op", "id", "old", "new"} (من trigger notify_request_change عبر LISTEN، أو يُنشر
+# مباشرة على الـ bus في الاختبارات/بدون اتصال مباشر بالقاعدة). العدادات محفوظة لكل "جمهور" وليس لكل مستخدم:
+#   ("sub", emp_id)  مهام البديل      ("mgr", dept)  مهام مدير القسم      ("hr",)  مهام الموارد البشرية
+# عدد المستخدم = مجموع جماهيره. العداد يُملأ باستعلام count واحد أول مرة يُطلب ثم يُحدَّث بفروقات الأحداث فقط،
+# لذلك الجلسات الخاملة لا تكلف أي استعلام.
+
+import json
+import os
+import threading
+import time
+
+import streamlit as st
+
+from src.utils.roles import MANAGER_ROLES
+
+NOTIFY_CHANNEL = "requests_changes"
+LISTEN_RECONNECT_DELAY = 5  # ثوانٍ
+FALLBACK_MAX_AGE = 60       # ثوانٍ: عمر العداد الأقصى عندما لا يعمل LISTEN (كتابات العمليات الأخرى لا تصل)
+
+# ------------------------------
+# من يرى الطلب كمهمة (نفس شروط get_task_inbox)
+# ------------------------------
+def task_keys(row) -> set:
+    if not row: return set()
+    keys = set()
+    if row.get("substitute_id") and row.get("status_substitute") == "Pending":
+        keys.add(("sub", str(row["substitute_id"])))
+    if row.get("status_manager") == "Pending" and row.get("status_substitute") in ("Approved", "Not Required"):
+        keys.add(("mgr", row.get("dept")))
+    if row.get("status_manager") == "Approved" and row.get("status_hr") == "Pending":
+        keys.add(("hr",))
+    return keys
+
+def user_keys(user) -> list:
+    keys = [("sub", str(user["emp_id"]))]
+    if user.get("role") in MANAGER_ROLES: keys.append(("mgr", user.get("dept")))
+    if user.get("role") == "HR": keys.append(("hr",))
+    return keys
+
+# ------------------------------
+# الـ bus داخل العملية
+# ------------------------------
+class ChangeBus:
+    def __init__(self):
+        self._subs = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, fn):
+        with self._lock: self._subs.append(fn)
+        return lambda: self._unsubscribe(fn)
+
+    def _unsubscribe(self, fn):
+        with self._lock:
+            if fn in self._subs: self._subs.remove(fn)
+
+    def publish(self, event: dict):
+        with self._lock: subs = list(self._subs)
+        for fn in subs:
+            try: fn(event)
+            except Exception as e: print("change feed subscriber error:", e)
+
+# ------------------------------
+# العدادات
+# ------------------------------
+class PendingCounters:
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self._counts = {}    # key -> عدد المهام المعلقة
+        self._seeded_at = {} # key -> وقت آخر ملء
+        self._versions = {}  # key -> يزداد مع كل تغيير (لتعرف الجلسات أن صندوقها تغيّر)
+        self._seeding = {}   # key -> هل وصل حدث أثناء استعلام الملء
+        self._lock = threading.Lock()
+        self.seeds = self.events = 0
+
+    def apply(self, event: dict):
+        """فرق الحدث: -1 لجماهير الصف القديم و +1 لجماهير الجديد. refresh يُسقط كل العدادات (تُملأ عند الطلب)."""
+        with self._lock:
+            self.events += 1
+            if event.get("op") == "refresh":
+                for key in set(self._versions) | set(self._counts): self._versions[key] = self._versions.get(key, 0) + 1
+                self._counts.clear()
+                for key in self._seeding: self._seeding[key] = True
+                return
+            old, new = task_keys(event.get("old")), task_keys(event.get("new"))
+            for key, delta in [(k, -1) for k in old - new] + [(k, 1) for k in new - old]:
+                self._versions[key] = self._versions.get(key, 0) + 1
+                if key in self._seeding: self._seeding[key] = True
+                if key in self._counts: self._counts[key] = max(self._counts[key] + delta, 0)
+
+    def _count_query(self, key) -> int:
+        q = self.supabase.table("requests").select("id", count="exact", head=True)
+        if key[0] == "sub": q = q.eq("substitute_id", key[1]).eq("status_substitute", "Pending")
+        elif key[0] == "mgr": q = q.eq("dept", key[1]).eq("status_manager", "Pending").in_("status_substitute", ["Approved", "Not Required"])
+        else: q = q.eq("status_manager", "Approved").eq("status_hr", "Pending")
+        return q.execute().count or 0
+
+    def _seed(self, key):
+        """استعلام count واحد للمفتاح. إن وصل حدث أثناء الاستعلام لا نعرف هل شمله العدّ، فلا يُحفظ ويُعاد في القراءة التالية."""
+        with self._lock:
+            if key in self._seeding: return self._counts.get(key, 0)
+            self._seeding[key] = False
+        try:
+            n = self._count_query(key) if self.supabase else 0
+        except Exception:
+            with self._lock: self._seeding.pop(key, None)
+            raise
+        with self._lock:
+            raced = self._seeding.pop(key)
+            self.seeds += 1
+            if not raced: self._counts[key] = n; self._seeded_at[key] = time.monotonic()
+            return n
+
+    def count(self, user, max_age=None) -> tuple:
+        """يعيد (عدد المهام، نسخة) للمستخدم. النسخة تتغير عند أي تغيير في صندوقه."""
+        keys, fresh = user_keys(user), {}
+        now = time.monotonic()
+        for key in keys:
+            stale = max_age is not None and now - self._seeded_at.get(key, now) > max_age
+            if key not in self._counts or stale: fresh[key] = self._seed(key)
+        with self._lock:
+            total = sum(self._counts.get(k, fresh.get(k, 0)) for k in keys)
+            return total, tuple(self._versions.get(k, 0) for k in keys)
+
+    def stats(self):
+        with self._lock:
+            return {"keys": len(self._counts), "seeds": self.seeds, "events": self.events}
+
+# ------------------------------
+# LISTEN/NOTIFY (اختياري)
+# ------------------------------
+def database_url():
+    url = os.environ.get("DATABASE_URL")
+    if url: return url
+    try: return st.secrets["supabase"].get("db_url")
+    except Exception: return None
+
+class PgListener:
+    """خيط يستمع لقناة requests_changes وينشر الأحداث على الـ bus. عند (إعادة) الاتصال يُنشر refresh
+    لأن ما فات أثناء الانقطاع غير معروف. connect: بديل psycopg.connect(url) (الاختبارات)."""
+
+    def __init__(self, url, bus: ChangeBus, connect=None, reconnect_delay=LISTEN_RECONNECT_DELAY):
+        self.url = url
+        self.bus = bus
+        self.connect = connect
+        self.reconnect_delay = reconnect_delay
+        self.connected = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="change-feed-listener", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _connect(self):
+        if self.connect: return self.connect(self.url)
+        import psycopg
+        return psycopg.connect(self.url, autocommit=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self._connect() as conn:
+                    conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    self.connected = True
+                    self.bus.publish({"op": "refresh"})
+                    while not self._stop.is_set():
+                        for n in conn.notifies(timeout=1.0):
+                            self.bus.publish(json.loads(n.payload))
+            except Exception as e:
+                print("change feed listener error:", e)
+            self.connected = False
+            self._stop.wait(self.reconnect_delay)
+
+class ChangeFeed:
+    def __init__(self, supabase, listen_url=None):
+        self.bus = ChangeBus()
+        self.counters = PendingCounters(supabase)
+        self.bus.subscribe(self.counters.apply)
+        self.listener = None
+        if listen_url:
+            try:
+                import psycopg  # noqa: F401
+                self.listener = PgListener(listen_url, self.bus).start()
+            except ImportError:
+                print("change feed: psycopg not installed, LISTEN/NOTIFY disabled")
+
+    @property
+    def live(self) -> bool:
+        """هل تصل أحداث القاعدة؟ بدونها تنشر كتابات هذه العملية refresh بنفسها (touch)."""
+        return bool(self.listener and self.listener.connected)
+
+    def touch(self, rows=None):
+        """بعد كتابة من هذه العملية عندما لا يوجد LISTEN: تُسقط العدادات لتُعاد قراءتها عند الطلب.
+        rows: الصفوف المكتوبة (إن عُرفت) لمن يحدّث نفسه صفاً بصف مثل فهرس الإجازات."""
+        if not self.live: self.bus.publish({"op": "refresh", "rows": list(rows or [])})
+
+    def pending(self, user) -> tuple:
+        return self.counters.count(user, None if self.live else FALLBACK_MAX_AGE)
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_change_feed(supabase=None):
+    """نسخة واحدة مشتركة على مستوى العملية (كل الجلسات)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None: _shared = ChangeFeed(supabase, database_url())
+        elif _shared.counters.supabase is None and supabase is not None: _shared.counters.supabase = supabase
+    return _shared
@@ -1,19 +1,108 @@
 # src/utils/db.py
 # Helpers for Supabase connection and basic DB operations
+#
+# كل العملاء (التطبيق والوحدات والمهام) يمرون عبر InstrumentedClient: نفس واجهة عميل Supabase،
+# مع تسجيل زمن كل execute() وعدد الصفوف وحجم الاستجابة في src/utils/metrics.py.
 
-from supabase import create_client
+import os
+import threading
+import time
+from supabase import create_client, ClientOptions
 import streamlit as st
 from datetime import datetime
 
+from src.utils.metrics import get_metrics
+
+POSTGREST_TIMEOUT = 60
+QUERY_OPS = ("select", "insert", "update", "upsert", "delete")
+
+# ------------------------------
+# العميل المُقاس
+# ------------------------------
+_local = threading.local()
+
+def _on_response(response):
+    # حجم الاستجابة الفعلي من httpx (يُنسب للاستدعاء الجاري في نفس الخيط)
+    response.read()
+    _local.bytes = getattr(_local, "bytes", 0) + len(response.content)
+
+def _rows(data) -> int:
+    if isinstance(data, list): return len(data)
+    return 1 if data else 0
+
+class _Query:
+    """يغلف builder الاستعلام: كل الدوال تمرر كما هي، و execute() يُقاس."""
+    __slots__ = ("_target", "_label", "_metrics")
+
+    def __init__(self, target, label, metrics):
+        self._target, self._label, self._metrics = target, label, metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        # خصائص builder مثل .not_ تعيد builder آخر: يُغلف حتى يُقاس execute() بعدها
+        if not callable(attr): return _Query(attr, self._label, self._metrics) if hasattr(attr, "execute") else attr
+        if name == "execute": return self._execute
+        label = f"{self._label}.{name}" if name in QUERY_OPS and not self._label.startswith("rpc:") and "." not in self._label else self._label
+        def call(*args, **kwargs):
+            res = attr(*args, **kwargs)
+            return _Query(res, label, self._metrics) if hasattr(res, "execute") else res
+        return call
+
+    def _execute(self):
+        _local.bytes = 0
+        t0 = time.perf_counter()
+        try:
+            res = self._target.execute()
+        except Exception as e:
+            self._metrics.record(self._label, time.perf_counter() - t0, 0, _local.bytes, f"{type(e).__name__}: {e}"[:300])
+            raise
+        data = getattr(res, "data", None)
+        rows = res.count if data is None and getattr(res, "count", None) is not None else _rows(data)
+        self._metrics.record(self._label, time.perf_counter() - t0, rows, _local.bytes)
+        return res
+
+class InstrumentedClient:
+    """واجهة عميل Supabase (table/from_/rpc وغيرها تمرر للأصل)."""
+
+    def __init__(self, client, metrics=None):
+        self._client = client
+        self.metrics = metrics or get_metrics()
+        try: client.postgrest.session.event_hooks["response"].append(_on_response)
+        except AttributeError: pass
+
+    def table(self, name):
+        return _Query(self._client.table(name), name, self.metrics)
+
+    from_ = table
+
+    def rpc(self, fn, params=None, *args, **kwargs):
+        return _Query(self._client.rpc(fn, params if params is not None else {}, *args, **kwargs), f"rpc:{fn}", self.metrics)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+# ------------------------------
+# الاتصال
+# ------------------------------
 @st.cache_resource
 def init_supabase():
+    """عميل واحد مشترك لكل الجلسات في التطبيق."""
     try:
         url = st.secrets["supabase"]["url"]
         key = st.secrets["supabase"]["key"]
-        return create_client(url, key)
+        return InstrumentedClient(create_client(url, key, options=ClientOptions(postgrest_client_timeout=POSTGREST_TIMEOUT)))
     except Exception as e:
-        st.error(f"خطأ في إعداد الاتصال بقاعدة البيانات: {e}")
+        st.error(f"خطأ في الاتصال بقاعدة البيانات: {e}")
         return None
 
+def connect():
+    """عميل Supabase للمهام وسطر الأوامر خارج Streamlit: SUPABASE_URL/SUPABASE_KEY ثم st.secrets."""
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_KEY")
+    if not (url and key):
+        url = st.secrets["supabase"]["url"]
+        key = st.secrets["supabase"]["key"]
+    return InstrumentedClient(create_client(url, key))
+
 def now_iso():
-    return datetime.utcnow().isoformat()
\ No newline at end of file
+    return datetime.utcnow().isoformat()
@@ -0,0 +1,111 @@
+# src/utils/employee_cache.py
+# Shared read-through cache for `employees` rows (LRU + TTL, refreshed on writes)
+
+import threading
+import time
+from collections import OrderedDict
+
+EMPLOYEE_CACHE_SIZE = 2048
+EMPLOYEE_CACHE_TTL = 300  # ثوانٍ
+
+class EmployeeCache:
+    """كاش صفوف الموظفين بمفتاح emp_id مع حد أقصى للحجم (LRU) ومدة صلاحية (TTL)."""
+
+    def __init__(self, supabase=None, max_size=EMPLOYEE_CACHE_SIZE, ttl=EMPLOYEE_CACHE_TTL):
+        self.supabase = supabase
+        self.max_size = max_size
+        self.ttl = ttl
+        self._rows = OrderedDict()  # emp_id -> (expires_at, row)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0  # يزداد مع كل كتابة حتى لا يُخزَّن صف قديم جُلب أثناءها
+
+    def _lookup(self, emp_id):
+        entry = self._rows.get(emp_id)
+        if entry is None: return None
+        if entry[0] < time.monotonic():
+            del self._rows[emp_id]
+            return None
+        self._rows.move_to_end(emp_id)
+        return entry[1]
+
+    def _store(self, row):
+        emp_id = str(row["emp_id"])
+        self._rows[emp_id] = (time.monotonic() + self.ttl, row)
+        self._rows.move_to_end(emp_id)
+        while len(self._rows) > self.max_size:
+            self._rows.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, emp_id):
+        if not emp_id: return None
+        return self.get_many([emp_id]).get(str(emp_id))
+
+    def get_many(self, emp_ids):
+        """يعيد {emp_id: row}؛ المفقود من الكاش يُجلب باستعلام in_() واحد."""
+        ids = list(dict.fromkeys(str(e) for e in emp_ids if e))
+        found, missing = {}, []
+        with self._lock:
+            for emp_id in ids:
+                row = self._lookup(emp_id)
+                if row is None:
+                    self.misses += 1; missing.append(emp_id)
+                else:
+                    self.hits += 1; found[emp_id] = row
+            writes = self._writes
+        if missing and self.supabase:
+            rows = self.supabase.table("employees").select("*").in_("emp_id", missing).execute().data or []
+            with self._lock:
+                for row in rows:
+                    if self._writes == writes: self._store(row)
+                    found[str(row["emp_id"])] = row
+        return found
+
+    def put(self, row):
+        with self._lock:
+            self._writes += 1
+            self._store(row)
+
+    def invalidate(self, emp_id=None):
+        with self._lock:
+            self._writes += 1
+            if emp_id is None: self._rows.clear()
+            else: self._rows.pop(str(emp_id), None)
+
+    def update(self, emp_id, payload):
+        """تحديث صف الموظف في القاعدة ثم تحديث/إبطال النسخة المخزنة."""
+        if not self.supabase: return None
+        try:
+            res = self.supabase.table("employees").update(payload).eq("emp_id", emp_id).execute()
+        except Exception:
+            self.invalidate(emp_id)
+            raise
+        if res.data: self.put(res.data[0])
+        else: self.invalidate(emp_id)
+        return res.data
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._rows),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_employee_cache(supabase=None):
+    """نسخة واحدة مشتركة على مستوى العملية (app.py و src/modules)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None: _shared = EmployeeCache(supabase)
+        elif _shared.supabase is None and supabase is not None: _shared.supabase = supabase
+    return _shared
@@ -0,0 +1,39 @@
+# src/utils/history.py
+# Keyset-paginated request history: (created_at, id) for "my requests", (hr_action_at, id) for the HR history.
+# List pages project only the columns the rows show; full rows are fetched on demand with fetch_request().
+
+HISTORY_PAGE_SIZE = 20
+
+MY_REQUESTS_COLUMNS = "id,service_type,sub_type,final_status,start_date,end_date,days,amount,created_at,updated_at"
+HR_HISTORY_COLUMNS = "id,emp_id,emp_name,service_type,sub_type,start_date,end_date,phone,hr_action_at"
+
+def _keyset(q, col, cursor):
+    """الصفوف الأقدم من المؤشر (col, id) بترتيب تنازلي."""
+    if cursor:
+        ts, last_id = cursor
+        q = q.or_(f'{col}.lt."{ts}",and({col}.eq."{ts}",id.lt.{int(last_id)})')
+    return q.order(col, desc=True).order("id", desc=True)
+
+def page_of(rows, col, page_size):
+    """يقسم نتيجة (page_size + 1) صف إلى (الصفحة، مؤشر الصفحة التالية أو None)."""
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    return rows, ((rows[-1][col], rows[-1]["id"]) if has_more and rows else None)
+
+def fetch_my_requests_page(supabase, emp_id, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    if not supabase: return [], None
+    q = supabase.table("requests").select(MY_REQUESTS_COLUMNS).eq("emp_id", emp_id)
+    rows = _keyset(q, "created_at", cursor).limit(page_size + 1).execute().data or []
+    return page_of(rows, "created_at", page_size)
+
+def fetch_hr_history_page(supabase, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    if not supabase: return [], None
+    q = supabase.table("requests").select(HR_HISTORY_COLUMNS).eq("final_status", "Approved").not_.is_("hr_action_at", "null")
+    rows = _keyset(q, "hr_action_at", cursor).limit(page_size + 1).execute().data or []
+    return page_of(rows, "hr_action_at", page_size)
+
+def fetch_request(supabase, req_id):
+    """الصف الكامل لطلب واحد (عند فتح التفاصيل أو التحميل)."""
+    if not supabase: return None
+    res = supabase.table("requests").select("*").eq("id", req_id).execute()
+    return res.data[0] if res.data else None
@@ -0,0 +1,13 @@
+# src/utils/inbox.py
+# Task inbox: substitute/manager/HR tasks + HR history in one round trip (RPC get_task_inbox)
+
+def fetch_inbox(supabase, role, emp_id, dept, history_limit=50):
+    """يعيد (المهام، سجل HR) من استدعاء واحد لدالة get_task_inbox في قاعدة البيانات."""
+    if not supabase: return [], []
+    res = supabase.rpc("get_task_inbox", {
+        "p_emp_id": emp_id,
+        "p_role": role,
+        "p_dept": dept,
+        "p_history_limit": history_limit,
+    }).execute().data or {}
+    return res.get("tasks") or [], res.get("history") or []
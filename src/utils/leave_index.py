@@ -0,0 +1,199 @@
+# src/utils/leave_index.py
+# In-memory interval index of approved/pending leaves per employee and per department (overlap, coverage, month calendar)
+#
+# يُبنى مرة واحدة (استعلام keyset على الإجازات + عدد موظفي كل قسم) ثم يُحدَّث صفاً بصف من change feed
+# (src/utils/change_feed.py). كل مجموعة فترات مرتبة ببداية الفترة مع أطول مدة فيها، فالبحث عن التداخل مع [a, b]
+# هو bisect على البدايات في [a - أطول مدة، b] ثم فحص القليل الناتج: O(log n + k) بدل المرور على كل الإجازات.
+
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, timedelta
+
+from src.utils.change_feed import get_change_feed, FALLBACK_MAX_AGE
+
+PAGE_SIZE = 1000
+HORIZON_DAYS = 400         # الإجازات المنتهية قبل ذلك لا تُحمَّل
+MIN_COVERAGE_KEY = "MIN_DEPT_COVERAGE"
+MIN_COVERAGE_DEFAULT = 0.5  # نسبة الموجودين في القسم التي لا يُنزل عنها
+LEAVE_SERVICE = "إجازة"
+ACTIVE_STATUSES = ("Pending", "Approved")
+INDEX_COLUMNS = "id,emp_id,emp_name,dept,sub_type,start_date,end_date,final_status"
+
+def _day(v):
+    if v is None or v == "": return None
+    if isinstance(v, date): return v.toordinal()
+    return date.fromisoformat(str(v)[:10]).toordinal()
+
+def leave_entry(row):
+    """صف الطلب -> مدخل الفهرس، أو None إن لم يكن إجازة قائمة (معتمدة/معلقة) بتاريخين."""
+    if not row or row.get("service_type", LEAVE_SERVICE) != LEAVE_SERVICE: return None
+    if row.get("final_status") not in ACTIVE_STATUSES: return None
+    start, end = _day(row.get("start_date")), _day(row.get("end_date"))
+    if start is None or end is None or end < start: return None
+    return {"id": row["id"], "emp_id": str(row.get("emp_id")), "emp_name": row.get("emp_name"), "dept": row.get("dept"),
+            "sub_type": row.get("sub_type"), "status": row.get("final_status"), "start": start, "end": end}
+
+class Intervals:
+    """فترات مرتبة (start, end, id) + أطول مدة (لا تنقص عند الحذف؛ تبقى حداً أعلى صحيحاً)."""
+    __slots__ = ("items", "max_len")
+
+    def __init__(self):
+        self.items, self.max_len = [], 0
+
+    def add(self, start, end, rid):
+        insort(self.items, (start, end, rid))
+        self.max_len = max(self.max_len, end - start)
+
+    def remove(self, start, end, rid):
+        i = bisect_left(self.items, (start, end, rid))
+        if i < len(self.items) and self.items[i] == (start, end, rid): del self.items[i]
+
+    def overlapping(self, a, b):
+        lo = bisect_left(self.items, (a - self.max_len,))
+        hi = bisect_right(self.items, (b, float("inf"), float("inf")))
+        return [it for it in self.items[lo:hi] if it[1] >= a]
+
+class LeaveIndex:
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self._lock = threading.Lock()
+        self._built_at = None
+        self._pending = None  # أحداث تصل أثناء البناء وتُعاد بعده
+        self._reset()
+
+    def _reset(self):
+        self.rows, self.by_emp, self.by_dept = {}, {}, {}
+        self.headcount, self.min_coverage = {}, MIN_COVERAGE_DEFAULT
+
+    # ---- التعديل ----
+    def _add(self, e):
+        self.rows[e["id"]] = e
+        self.by_emp.setdefault(e["emp_id"], Intervals()).add(e["start"], e["end"], e["id"])
+        self.by_dept.setdefault(e["dept"], Intervals()).add(e["start"], e["end"], e["id"])
+
+    def _remove(self, rid):
+        e = self.rows.pop(rid, None)
+        if e is None: return
+        self.by_emp[e["emp_id"]].remove(e["start"], e["end"], rid)
+        self.by_dept[e["dept"]].remove(e["start"], e["end"], rid)
+
+    def _apply_row(self, rid, new):
+        self._remove(rid)
+        entry = leave_entry(new)
+        if entry: self._add(entry)
+
+    def apply(self, event: dict):
+        """حدث من change feed: صف جديد/محدث/محذوف، أو refresh (إعادة بناء عند الطلب ما لم تُرفق الصفوف المكتوبة)."""
+        with self._lock:
+            if self._pending is not None: self._pending.append(event); return
+            self._apply_locked(event)
+
+    def _apply_locked(self, event):
+        if event.get("op") == "refresh":
+            if event.get("rows"):
+                for row in event["rows"]: self._apply_row(row["id"], row)
+            else:
+                self._built_at = None  # إعادة اتصال LISTEN أو كتابة جماعية بلا صفوف: ما فات غير معروف
+            return
+        self._apply_row(event.get("id"), event.get("new"))
+
+    # ---- البناء ----
+    def _load(self):
+        since = str(date.today() - timedelta(days=HORIZON_DAYS))
+        rows, last_id = [], 0
+        while True:
+            page = (self.supabase.table("requests").select(INDEX_COLUMNS).eq("service_type", LEAVE_SERVICE)
+                    .in_("final_status", list(ACTIVE_STATUSES)).gte("end_date", since).gt("id", last_id)
+                    .order("id").limit(PAGE_SIZE).execute().data or [])
+            rows.extend(page)
+            if len(page) < PAGE_SIZE: break
+            last_id = page[-1]["id"]
+        headcount, last = {}, ""
+        while True:
+            page = (self.supabase.table("employees").select("emp_id,dept").gt("emp_id", last)
+                    .order("emp_id").limit(PAGE_SIZE).execute().data or [])
+            for e in page: headcount[e.get("dept")] = headcount.get(e.get("dept"), 0) + 1
+            if len(page) < PAGE_SIZE: break
+            last = page[-1]["emp_id"]
+        setting = self.supabase.table("settings").select("value").eq("key", MIN_COVERAGE_KEY).limit(1).execute().data
+        try: min_coverage = float(setting[0]["value"]) if setting else MIN_COVERAGE_DEFAULT
+        except (TypeError, ValueError): min_coverage = MIN_COVERAGE_DEFAULT
+        return rows, headcount, min_coverage
+
+    def ensure(self, max_age=None):
+        with self._lock:
+            fresh = self._built_at is not None and (max_age is None or time.monotonic() - self._built_at <= max_age)
+            if fresh or self._pending is not None or not self.supabase: return
+            self._pending = []
+        try:
+            rows, headcount, min_coverage = self._load()
+        except Exception:
+            with self._lock: self._pending = None
+            raise
+        with self._lock:
+            self._reset()
+            for r in rows: self._apply_row(r["id"], dict(r, service_type=LEAVE_SERVICE))
+            self.headcount, self.min_coverage = headcount, min_coverage
+            events, self._pending = self._pending, None
+            for ev in events: self._apply_locked(ev)
+            self._built_at = time.monotonic()
+
+    # ---- الاستعلامات ----
+    def overlaps(self, emp_id, start, end, exclude_id=None) -> list:
+        """إجازات الموظف (معتمدة/معلقة) المتداخلة مع [start, end]."""
+        a, b = _day(start), _day(end)
+        with self._lock:
+            iv = self.by_emp.get(str(emp_id))
+            return [self.rows[rid] for _, _, rid in (iv.overlapping(a, b) if iv else []) if rid != exclude_id]
+
+    def dept_leaves(self, dept, start, end, exclude_id=None) -> list:
+        a, b = _day(start), _day(end)
+        with self._lock:
+            iv = self.by_dept.get(dept)
+            return [self.rows[rid] for _, _, rid in (iv.overlapping(a, b) if iv else []) if rid != exclude_id]
+
+    def coverage(self, dept, start, end, extra_emp_id=None, exclude_id=None) -> dict:
+        """أقل عدد موجودين في القسم خلال [start, end] (مع إضافة extra_emp_id كغائب). ok=False إذا نزل عن الحد الأدنى."""
+        a, b = _day(start), _day(end)
+        leaves = self.dept_leaves(dept, start, end, exclude_id)
+        # أعلى عدد غائبين في يوم واحد: مسح الأحداث داخل [a, b] (موظف واحد يُعد مرة واحدة حتى لو تداخلت طلباته)
+        days = {}
+        for e in leaves:
+            for d in range(max(e["start"], a), min(e["end"], b) + 1): days.setdefault(d, set()).add(e["emp_id"])
+        if extra_emp_id is not None:
+            for d in range(a, b + 1): days.setdefault(d, set()).add(str(extra_emp_id))
+        worst_day, absent = max(((d, len(s)) for d, s in days.items()), key=lambda x: x[1], default=(None, 0))
+        with self._lock:
+            headcount, ratio = self.headcount.get(dept, 0), self.min_coverage
+        present = headcount - absent
+        return {"headcount": headcount, "max_absent": absent, "min_present": present,
+                "worst_day": date.fromordinal(worst_day) if worst_day else None,
+                "ok": headcount == 0 or present >= headcount * ratio, "min_ratio": ratio}
+
+    def month(self, dept, year, month) -> list:
+        """إجازات القسم المتداخلة مع الشهر (للتقويم)."""
+        first = date(year, month, 1)
+        last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        return self.dept_leaves(dept, first, last)
+
+    def depts(self) -> list:
+        with self._lock: return sorted(d for d in self.headcount if d)
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_leave_index(supabase=None) -> LeaveIndex:
+    """نسخة واحدة مشتركة، مشتركة في change feed، تُبنى عند أول استخدام."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            feed = get_change_feed(supabase)
+            _shared = LeaveIndex(supabase)
+            feed.bus.subscribe(_shared.apply)
+        elif _shared.supabase is None and supabase is not None:
+            _shared.supabase = supabase
+    feed = get_change_feed()
+    # بدون LISTEN لا تصل كتابات العمليات الأخرى: يُعاد البناء بعد مدة
+    _shared.ensure(None if feed.live else FALLBACK_MAX_AGE * 5)
+    return _shared
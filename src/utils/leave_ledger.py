@@ -0,0 +1,59 @@
+# src/utils/leave_ledger.py
+# Leave balance ledger: atomic server-side postings (post_leave_entry RPC), snapshot reads and history
+
+from postgrest.exceptions import APIError
+
+from src.utils.employee_cache import get_employee_cache
+
+LEDGER_COLUMNS = "id,entry_type,days,balance_after,settlement_date,request_id,actor_emp_id,note,created_at"
+
+class InsufficientLeaveBalance(Exception):
+    """الخصم سيجعل الرصيد سالباً (CHECK في leave_balance_snapshots)."""
+
+class LeaveAlreadyPosted(Exception):
+    """الطلب له قيد من نفس النوع في السجل (idx_leave_ledger_request)."""
+
+def post_leave_entry(supabase, emp_id, entry_type, days, settlement_date=None, request_id=None, actor=None, note=None) -> dict:
+    """قيد واحد بإشارة (سالب للخصم) في رحلة واحدة للقاعدة. يعيد {entry_id, annual_balance, last_settlement_date}."""
+    try:
+        res = supabase.rpc("post_leave_entry", {
+            "p_emp_id": str(emp_id),
+            "p_entry_type": entry_type,
+            "p_days": float(days),
+            "p_settlement_date": str(settlement_date) if settlement_date else None,
+            "p_request_id": request_id,
+            "p_actor_emp_id": (actor or {}).get("emp_id"),
+            "p_note": note,
+        }).execute()
+    except APIError as e:
+        if e.code == "23514": raise InsufficientLeaveBalance(str(emp_id)) from e
+        if e.code == "23505": raise LeaveAlreadyPosted(str(request_id)) from e
+        raise
+    finally:
+        # leave_balances في employees مرآة للرصيد، فالنسخة المخزنة لم تعد صالحة
+        get_employee_cache(supabase).invalidate(emp_id)
+    return res.data or {}
+
+def post_leave_entries(supabase, entries: list, actor=None) -> dict:
+    """دفعة قيود (مهمة الاستحقاق). يعيد {posted, skipped: [{emp_id, reason, request_id?}]}؛ posted = موظفون كُتب لهم قيد فعلاً."""
+    res = supabase.rpc("post_leave_entries", {"p_entries": entries, "p_actor_emp_id": (actor or {}).get("emp_id")}).execute()
+    return res.data or {"posted": 0, "skipped": []}
+
+def fetch_balance(supabase, emp_id):
+    """الرصيد الحالي من الـ snapshot (قراءة بالمفتاح الأساسي)؛ None إن لم يُسجَّل أي قيد بعد."""
+    res = supabase.table("leave_balance_snapshots").select("annual_balance,last_settlement_date").eq("emp_id", str(emp_id)).limit(1).execute()
+    return res.data[0] if res.data else None
+
+def posted_request_ids(supabase, request_ids, chunk_size=500) -> set:
+    """أرقام الطلبات (من request_ids) التي لها قيد خصم في السجل، تسوية HR أو استهلاك سابق."""
+    ids, posted = [int(i) for i in request_ids], set()
+    for i in range(0, len(ids), chunk_size):
+        res = (supabase.table("leave_ledger").select("request_id").in_("request_id", ids[i:i + chunk_size])
+               .lt("days", 0).execute())
+        posted.update(r["request_id"] for r in res.data or [])
+    return posted
+
+def fetch_ledger(supabase, emp_id, limit=100) -> list:
+    """سجل الرصيد للمراجعة (الأحدث أولاً)."""
+    return (supabase.table("leave_ledger").select(LEDGER_COLUMNS).eq("emp_id", str(emp_id))
+            .order("id", desc=True).limit(limit).execute().data or [])
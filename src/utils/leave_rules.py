@@ -0,0 +1,31 @@
+# src/utils/leave_rules.py
+# Leave entitlement / balance / allowance rules (pure functions, usable outside Streamlit)
+
+from datetime import datetime
+
+def calculate_annual_leave_days(hire_date_str):
+    """تحديد هل الاستحقاق 21 أو 30 يوماً حسب سنوات الخدمة."""
+    if not hire_date_str: return 21
+    try:
+        hire_date = datetime.strptime(str(hire_date_str)[:10], "%Y-%m-%d")
+        years = (datetime.now() - hire_date).days / 365.25
+        return 30 if years >= 5 else 21
+    except: return 21
+
+def get_leave_balance(emp: dict):
+    """قراءة الرصيد الحالي وتاريخ آخر احتساب"""
+    lb = emp.get("leave_balances") or {}
+    
+    annual_balance = lb.get("annual_balance")
+    if annual_balance is None:
+        # إذا لم يكن هناك رصيد مسجل، احسبه افتراضياً
+        annual_balance = calculate_annual_leave_days(emp.get("hire_date"))
+
+    last_settlement = lb.get("last_settlement_date") or emp.get("hire_date") or datetime.today().date().isoformat()
+    
+    return float(annual_balance), last_settlement
+
+def calculate_leave_allowance(salary: float, requested_days: float) -> float:
+    if not salary or salary <= 0: return 0.0
+    # الحساب: (الراتب / 30) * عدد أيام الإجازة
+    return round((float(salary) / 30.0) * float(requested_days), 2)
@@ -0,0 +1,143 @@
+# src/utils/metrics.py
+# In-process query metrics: per-query timings/rows/bytes, latency histograms, per-page-render round trips and a slow-query log
+#
+# يسجلها InstrumentedClient في src/utils/db.py لكل execute()، وتعرضها صفحة التشخيص (src/modules/diagnostics.py)
+# مع تصدير JSON و Prometheus text.
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SLOW_QUERY_MS = float(os.environ.get("HR_SLOW_QUERY_MS", 500))
+SLOW_LOG_SIZE = 200
+RECENT_RENDERS = 50
+
+def _bucket(ms: float) -> int:
+    for i, le in enumerate(LATENCY_BUCKETS_MS):
+        if ms <= le: return i
+    return len(LATENCY_BUCKETS_MS)
+
+def _new_stats():
+    return {"calls": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "bytes": 0,
+            "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+
+def quantile_ms(buckets, q: float):
+    """تقدير الـ quantile من الـ histogram (الحد الأعلى للفئة). None إن لم توجد قياسات."""
+    total = sum(buckets)
+    if not total: return None
+    need, seen = q * total, 0
+    for i, n in enumerate(buckets):
+        seen += n
+        if seen >= need: return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else float("inf")
+    return float("inf")
+
+class QueryMetrics:
+    def __init__(self, slow_ms=SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now().isoformat(timespec="seconds")
+            self.queries = {}   # label -> stats
+            self.pages = {}     # page -> {renders, round_trips, max_round_trips, seconds, query_seconds, bytes}
+            self.slow = deque(maxlen=SLOW_LOG_SIZE)
+            self.renders = deque(maxlen=RECENT_RENDERS)
+
+    # ---- تسجيل استعلام ----
+    def record(self, label: str, seconds: float, rows: int = 0, nbytes: int = 0, error: str = None):
+        ms = seconds * 1000
+        render = getattr(self._local, "render", None)
+        with self._lock:
+            st = self.queries.get(label)
+            if st is None: st = self.queries[label] = _new_stats()
+            st["calls"] += 1; st["seconds"] += seconds; st["rows"] += rows; st["bytes"] += nbytes
+            st["max_seconds"] = max(st["max_seconds"], seconds)
+            st["buckets"][_bucket(ms)] += 1
+            if error: st["errors"] += 1
+            if ms >= self.slow_ms or error:
+                self.slow.append({"at": datetime.now().isoformat(timespec="seconds"), "query": label, "ms": round(ms, 1),
+                                  "rows": rows, "bytes": nbytes, "page": render["page"] if render else None, "error": error})
+        if render is not None:
+            render["round_trips"] += 1; render["query_seconds"] += seconds; render["bytes"] += nbytes
+            render["queries"].append(label)
+
+    # ---- رسم صفحة ----
+    @contextmanager
+    def render(self, page: str):
+        """يحسب عدد الرحلات إلى القاعدة وزمنها داخل رسم صفحة واحد (نفس خيط السكربت)."""
+        r = self._local.render = {"page": page, "round_trips": 0, "query_seconds": 0.0, "bytes": 0, "queries": []}
+        t0 = time.perf_counter()
+        try:
+            yield r
+        finally:
+            self._local.render = None
+            seconds = time.perf_counter() - t0
+            with self._lock:
+                p = self.pages.get(page)
+                if p is None: p = self.pages[page] = {"renders": 0, "round_trips": 0, "max_round_trips": 0,
+                                                     "seconds": 0.0, "query_seconds": 0.0, "bytes": 0}
+                p["renders"] += 1; p["round_trips"] += r["round_trips"]; p["seconds"] += seconds
+                p["query_seconds"] += r["query_seconds"]; p["bytes"] += r["bytes"]
+                p["max_round_trips"] = max(p["max_round_trips"], r["round_trips"])
+                self.renders.append({"at": datetime.now().isoformat(timespec="seconds"), "page": page,
+                                     "round_trips": r["round_trips"], "ms": round(seconds * 1000, 1),
+                                     "query_ms": round(r["query_seconds"] * 1000, 1), "queries": r["queries"]})
+
+    # ---- تصدير ----
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "slow_query_ms": self.slow_ms,
+                "latency_buckets_ms": list(LATENCY_BUCKETS_MS),
+                "queries": {k: dict(v, buckets=list(v["buckets"])) for k, v in self.queries.items()},
+                "pages": {k: dict(v) for k, v in self.pages.items()},
+                "slow": list(self.slow),
+                "renders": list(self.renders),
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        snap = self.snapshot()
+        esc = lambda s: str(s).replace("\\", "\\\\").replace('"', '\\"')
+        out = ["# HELP hr_db_query_duration_seconds PostgREST round-trip latency per query",
+               "# TYPE hr_db_query_duration_seconds histogram"]
+        for label, st in sorted(snap["queries"].items()):
+            cum = 0
+            for le, n in zip(list(LATENCY_BUCKETS_MS) + ["+Inf"], st["buckets"]):
+                cum += n
+                le = le if le == "+Inf" else le / 1000
+                out.append(f'hr_db_query_duration_seconds_bucket{{query="{esc(label)}",le="{le}"}} {cum}')
+            out.append(f'hr_db_query_duration_seconds_sum{{query="{esc(label)}"}} {st["seconds"]:.6f}')
+            out.append(f'hr_db_query_duration_seconds_count{{query="{esc(label)}"}} {st["calls"]}')
+        for name, key, help_ in (("hr_db_query_errors_total", "errors", "Failed queries"),
+                                 ("hr_db_query_rows_total", "rows", "Rows returned"),
+                                 ("hr_db_query_bytes_total", "bytes", "Response payload bytes")):
+            out += [f"# HELP {name} {help_}", f"# TYPE {name} counter"]
+            out += [f'{name}{{query="{esc(label)}"}} {st[key]}' for label, st in sorted(snap["queries"].items())]
+        for name, key, help_ in (("hr_page_renders_total", "renders", "Page renders"),
+                                 ("hr_page_round_trips_total", "round_trips", "Database round trips during page renders"),
+                                 ("hr_page_render_seconds_total", "seconds", "Time spent rendering pages")):
+            out += [f"# HELP {name} {help_}", f"# TYPE {name} counter"]
+            out += [f'{name}{{page="{esc(page)}"}} {p[key]}' for page, p in sorted(snap["pages"].items())]
+        return "\n".join(out) + "\n"
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_metrics() -> QueryMetrics:
+    """نسخة واحدة مشتركة على مستوى العملية."""
+    global _shared
+    with _shared_lock:
+        if _shared is None: _shared = QueryMetrics()
+    return _shared
@@ -0,0 +1,197 @@
+# src/utils/notifications.py
+# Outbound notification transports (file/mock, Twilio WhatsApp, SMTP email), message templates and a token-bucket rate limiter
+#
+# كل transport يستقبل دفعة رسائل (صفوف notification_outbox) ويعيد نتيجة لكل رسالة: Delivery(ok, error, permanent).
+# permanent=True يعني أن إعادة المحاولة لن تفيد (رقم/بريد غير صالح...) فتذهب الرسالة مباشرة إلى dead.
+
+import base64
+import json
+import os
+import smtplib
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from email.message import EmailMessage
+
+Delivery = namedtuple("Delivery", "ok error permanent")
+SENT = Delivery(True, None, False)
+
+STATUS_AR = {"Approved": "الموافقة على", "Rejected": "رفض"}
+STAGE_AR = {"substitute_decided": "البديل", "manager_decided": "المدير المباشر", "hr_decided": "الموارد البشرية"}
+
+# ------------------------------
+# نص الرسالة
+# ------------------------------
+def render_message(msg) -> tuple:
+    """يعيد (العنوان، النص) لصف من notification_outbox."""
+    p = msg.get("payload") or {}
+    status = STATUS_AR.get(p.get("status"), p.get("status") or "")
+    what = f"طلب {p.get('service_type') or ''} رقم {msg.get('request_id')}"
+    if msg.get("event") == "final":
+        subject = f"تم {status} {what}"
+    else:
+        subject = f"تم {status} {what} من {STAGE_AR.get(msg.get('event'), '')}"
+    lines = [subject]
+    if p.get("sub_type"): lines.append(f"نوع: {p['sub_type']}")
+    if p.get("start_date"): lines.append(f"من: {p['start_date']}")
+    if p.get("end_date"): lines.append(f"إلى: {p['end_date']}")
+    if p.get("amount"): lines.append(f"المبلغ: {p['amount']}")
+    if p.get("note"): lines.append(f"ملاحظة: {p['note']}")
+    return subject, "\n".join(lines)
+
+def whatsapp_number(phone: str) -> str:
+    # نفس تحويل رابط wa.me في صفحة الاعتمادات: 05xxxxxxxx -> 9665xxxxxxxx
+    phone = "".join(ch for ch in str(phone) if ch.isdigit() or ch == "+")
+    if phone.startswith("+"): return phone
+    if phone.startswith("0"): phone = phone.replace("0", "966", 1)
+    return "+" + phone
+
+# ------------------------------
+# تحديد المعدل
+# ------------------------------
+class TokenBucket:
+    """rate رسالة/ثانية مع سماح بدفعة حتى burst. take() ينتظر حتى تتوفر الرموز."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.burst = max(int(burst), 1)
+        self._tokens = float(self.burst)
+        self._at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._at) * self.rate)
+        self._at = now
+
+    def take(self, n: int = 1, stop: threading.Event = None) -> bool:
+        n = min(n, self.burst)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return True
+                wait = (n - self._tokens) / self.rate
+            if stop is not None:
+                if stop.wait(wait): return False
+            else:
+                time.sleep(wait)
+
+# ------------------------------
+# Transports
+# ------------------------------
+class Transport:
+    channel = None
+    rate = 1.0       # رسالة/ثانية
+    burst = 1
+    batch_size = 1   # كم رسالة تُرسل في استدعاء send_batch واحد
+    timeout = 0      # أقصى انتظار للمزود في دفعة (ثوانٍ)
+
+    def send_batch(self, messages: list) -> list:
+        raise NotImplementedError
+
+class FileTransport(Transport):
+    """يكتب الرسائل كسطور JSON في ملف (للاختبار والتطوير). fail_addresses: عناوين تفشل عمداً."""
+
+    def __init__(self, channel, path, rate=100.0, burst=100, batch_size=100, fail_addresses=()):
+        self.channel, self.path = channel, path
+        self.rate, self.burst, self.batch_size = rate, burst, batch_size
+        self.fail_addresses = set(fail_addresses)
+        self._lock = threading.Lock()
+
+    def send_batch(self, messages):
+        out = []
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            for m in messages:
+                if m["address"] in self.fail_addresses:
+                    out.append(Delivery(False, "mock failure", False)); continue
+                subject, body = render_message(m)
+                f.write(json.dumps({"id": m["id"], "channel": self.channel, "to": m["address"],
+                                    "subject": subject, "body": body}, ensure_ascii=False) + "\n")
+                out.append(SENT)
+        return out
+
+class TwilioWhatsAppTransport(Transport):
+    """Twilio Messages API (whatsapp:). لا يدعم الإرسال الجماعي، لذلك batch_size=1 ويُحد المعدل فقط."""
+    channel = "whatsapp"
+    API = "https://api.twilio.com/2010-04-01/Accounts/{sid}/Messages.json"
+
+    def __init__(self, account_sid, auth_token, from_number, rate=1.0, burst=5, timeout=15):
+        self.url = self.API.format(sid=account_sid)
+        self.auth = "Basic " + base64.b64encode(f"{account_sid}:{auth_token}".encode()).decode()
+        self.from_number = from_number
+        self.rate, self.burst, self.timeout = rate, burst, timeout
+
+    @classmethod
+    def from_env(cls):
+        sid, token, sender = (os.environ.get(k) for k in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_WHATSAPP_FROM"))
+        if not (sid and token and sender): return None
+        return cls(sid, token, sender, float(os.environ.get("TWILIO_RATE", 1.0)))
+
+    def _send(self, m) -> Delivery:
+        _, body = render_message(m)
+        data = urllib.parse.urlencode({"From": f"whatsapp:{self.from_number}",
+                                       "To": f"whatsapp:{whatsapp_number(m['address'])}", "Body": body}).encode()
+        req = urllib.request.Request(self.url, data=data, headers={"Authorization": self.auth})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout): return SENT
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode("utf-8", "replace")[:300]
+            # 4xx (ما عدا 429) خطأ في الرسالة نفسها: لا فائدة من الإعادة
+            return Delivery(False, f"HTTP {e.code}: {detail}", 400 <= e.code < 500 and e.code != 429)
+        except Exception as e:
+            return Delivery(False, str(e), False)
+
+    def send_batch(self, messages):
+        return [self._send(m) for m in messages]
+
+class SmtpTransport(Transport):
+    """بريد عبر SMTP: الدفعة تُرسل على اتصال واحد."""
+    channel = "email"
+
+    def __init__(self, host, port, user, password, sender, use_tls=True, rate=5.0, burst=20, batch_size=50, timeout=30):
+        self.host, self.port, self.user, self.password, self.sender = host, int(port), user, password, sender
+        self.use_tls, self.timeout = use_tls, timeout
+        self.rate, self.burst, self.batch_size = rate, burst, batch_size
+
+    @classmethod
+    def from_env(cls):
+        host = os.environ.get("SMTP_HOST")
+        if not host: return None
+        return cls(host, os.environ.get("SMTP_PORT", 587), os.environ.get("SMTP_USER"), os.environ.get("SMTP_PASSWORD"),
+                   os.environ.get("SMTP_FROM") or os.environ.get("SMTP_USER"), os.environ.get("SMTP_TLS", "1") != "0",
+                   float(os.environ.get("SMTP_RATE", 5.0)))
+
+    def send_batch(self, messages):
+        try:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.use_tls: server.starttls()
+            if self.user: server.login(self.user, self.password)
+        except Exception as e:
+            return [Delivery(False, f"connect: {e}", False)] * len(messages)
+        out = []
+        try:
+            for m in messages:
+                subject, body = render_message(m)
+                mail = EmailMessage()
+                mail["From"], mail["To"], mail["Subject"] = self.sender, m["address"], subject
+                mail.set_content(body)
+                try:
+                    server.send_message(mail); out.append(SENT)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused) as e:
+                    out.append(Delivery(False, str(e), True))
+                except smtplib.SMTPResponseException as e:
+                    out.append(Delivery(False, f"{e.smtp_code} {e.smtp_error!r}", 500 <= e.smtp_code < 600))
+                except Exception as e:
+                    out.append(Delivery(False, str(e), False))
+        finally:
+            try: server.quit()
+            except Exception: pass
+        return out
+
+def transports_from_env() -> list:
+    return [t for t in (TwilioWhatsAppTransport.from_env(), SmtpTransport.from_env()) if t]
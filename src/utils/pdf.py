@@ -0,0 +1,185 @@
+# src/utils/pdf.py
+# Leave form PDF: cached Arabic shaping + precomputed static layout drawn once per document as a form XObject
+
+import os
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas as pdf_canvas
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+FONT_NAME = "Arabic"
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "arial.ttf")
+
+# الحقول التي يعرضها النموذج؛ تدخل في مفتاح كاش الـ PDF مع updated_at
+LEAVE_FORM_FIELDS = ("id", "emp_name", "emp_id", "dept", "job_title", "sub_type", "days", "start_date", "end_date",
+                     "substitute_name", "submission_date", "manager_name", "hr_name", "manager_action_at", "hr_action_at")
+
+DECLARATION = "أقر أنا الموقع أدناه بأنني سأتمتع بإجازتي في موعدها المحدد أعلاه، كما أنني لن أتجاوز مدة الإجازة المطلوبة إلا عند إرسال خطاب رسمي لتمديد الإجازة والموافقة عليها من قبل رئيسي المباشر، كما أعتبر نفسي منذراً بالفصل عند تجاوز مدة الغياب حسب المدة المحددة في نظام العمل والعمال، وأنني ألتزم بجميع ما ورد أعلاه وعلى ذلك أوقع."
+
+def register_fonts() -> bool:
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames(): return True
+    try:
+        pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+        return True
+    except Exception:
+        return False
+
+def form_font() -> str:
+    return FONT_NAME if FONT_NAME in pdfmetrics.getRegisteredFontNames() else "Helvetica"
+
+# ------------------------------
+# تشكيل النص العربي (مع كاش)
+# ------------------------------
+@lru_cache(maxsize=4096)
+def _shape(text: str) -> str:
+    return get_display(arabic_reshaper.reshape(text))
+
+def reshape_text(text) -> str:
+    if not text: return ""
+    try:
+        return _shape(str(text))
+    except Exception: return str(text)
+
+@lru_cache(maxsize=256)
+def wrap_rtl(text: str, font_name: str, font_size: float, max_width: float) -> tuple:
+    """تقسيم الفقرة إلى أسطر حسب العرض الفعلي للحروف (stringWidth) ثم عكس كل سطر للعرض.
+    التقسيم يتم على الترتيب المنطقي حتى يبقى ترتيب الأسطر صحيحاً من أعلى لأسفل."""
+    words = arabic_reshaper.reshape(text).split()
+    space = pdfmetrics.stringWidth(" ", font_name, font_size)
+    lines, line, line_w = [], [], 0.0
+    for w in words:
+        w_w = pdfmetrics.stringWidth(w, font_name, font_size)
+        if line and line_w + space + w_w > max_width:
+            lines.append(" ".join(line)); line, line_w = [w], w_w
+        else:
+            line_w = line_w + space + w_w if line else w_w
+            line.append(w)
+    if line: lines.append(" ".join(line))
+    return tuple(get_display(l) for l in lines)
+
+# ------------------------------
+# التخطيط الثابت (يُحسب مرة واحدة)
+# ------------------------------
+@lru_cache(maxsize=8)
+def _static_layout(font_name: str, include_financials: bool):
+    """يعيد (عمليات الرسم الثابتة، مواضع الحقول المتغيرة)."""
+    width, height = A4
+    ops, pos = [], {}
+
+    # Header
+    ops.append(("font", font_name, 18)); ops.append(("centre", width/2, height-2*cm, reshape_text("نموذج طلب إجازة")))
+    ops.append(("line", 2*cm, height-2.4*cm, width-2*cm, height-2.4*cm))
+
+    # Employee Info Box
+    box_top = height - 3*cm
+    ops.append(("rect", 2*cm, box_top-5*cm, width-4*cm, 5*cm))
+    y = box_top - 0.8*cm
+    ops.append(("font", font_name, 11))
+    rows = [("اسم الموظف:", "الرقم الوظيفي:"), ("القسم:", "المسمى:"), ("نوع الإجازة:", "عدد الأيام:"),
+            ("من تاريخ:", "إلى تاريخ:"), ("البديل:", "تاريخ التقديم:")]
+    pos["info"] = []
+    for right, left in rows:
+        ops.append(("right", width-2.5*cm, y, reshape_text(right)))
+        ops.append(("right", width-10.5*cm, y, reshape_text(left)))
+        pos["info"].append(y); y -= 0.9*cm
+
+    # Declaration
+    y = box_top - 5*cm - 1.3*cm
+    ops.append(("line", 2*cm, y, width-2*cm, y)); y -= 0.8*cm
+    ops.append(("font", font_name, 12)); ops.append(("right", width-2*cm, y, reshape_text("الإقــــــرار:"))); y -= 0.7*cm
+    ops.append(("font", font_name, 10))
+    for line in wrap_rtl(DECLARATION, font_name, 10, width-4*cm):
+        ops.append(("right", width-2*cm, y, line)); y -= 0.5*cm
+
+    # Signatures
+    y -= 1.5*cm; ops.append(("font", font_name, 11))
+    x_emp, x_mgr, x_hr = width-4*cm, width/2, 4*cm
+    ops.append(("right", x_emp, y, reshape_text("توقيع الموظف")))
+    ops.append(("right", x_mgr, y, reshape_text("المدير المباشر")))
+    ops.append(("right", x_hr, y, reshape_text("الموارد البشرية")))
+    pos["sig_names"] = y - 0.8*cm
+    pos["sig_dates"] = y - 1.4*cm
+    y -= 1.4*cm
+
+    # Financials (HR Only)
+    if include_financials:
+        y -= 2*cm; ops.append(("line", 2*cm, y, width-2*cm, y)); y -= 0.8*cm
+        ops.append(("font", font_name, 12)); ops.append(("right", width-2*cm, y, reshape_text("تفاصيل حساب مبلغ بدل الإجازة"))); y -= 1*cm
+        ops.append(("font", font_name, 11))
+        pos["fin"] = []
+        for label in ("الراتب الإجمالي:", "الرصيد السنوي:", "أيام الإجازة المستحقة:", "تاريخ آخر احتساب:", "مبلغ بدل الإجازة:"):
+            ops.append(("right", width-2.5*cm, y, reshape_text(label)))
+            pos["fin"].append(y); y -= 0.7*cm
+        y += 0.7*cm; y -= 1.5*cm
+        x_acc, x_fin, x_gm = width-4*cm, width/2, 4*cm
+        ops.append(("right", x_acc, y, reshape_text("المحاسب")))
+        ops.append(("right", x_fin, y, reshape_text("المدير المالي")))
+        ops.append(("right", x_gm, y, reshape_text("المدير العام")))
+        y -= 0.8*cm
+        for x in (x_acc, x_fin, x_gm): ops.append(("left", x-2*cm, y, "_________"))
+    return tuple(ops), pos
+
+def _play(c, ops):
+    for op in ops:
+        kind = op[0]
+        if kind == "font": c.setFont(op[1], op[2])
+        elif kind == "right": c.drawRightString(op[1], op[2], op[3])
+        elif kind == "centre": c.drawCentredString(op[1], op[2], op[3])
+        elif kind == "left": c.drawString(op[1], op[2], op[3])
+        elif kind == "line": c.line(op[1], op[2], op[3], op[4])
+        elif kind == "rect": c.rect(op[1], op[2], op[3], op[4])
+
+def _date(v) -> str:
+    return str(v or "")[:10]
+
+# ------------------------------
+# رسم النموذج
+# ------------------------------
+def draw_leave_form(c, r: dict, salary=0.0, annual_days=0, last_calc_date="-", allowance=0.0, include_financials=False):
+    """يرسم صفحة نموذج واحدة على canvas. الجزء الثابت يُعرَّف مرة واحدة لكل مستند كـ form XObject
+    ويُعاد استخدامه في كل صفحة (مفيد في التصدير المجمّع)، ثم تُرسم الحقول المتغيرة فوقه."""
+    width, _ = A4
+    font_name = form_font()
+    ops, pos = _static_layout(font_name, bool(include_financials))
+    form = f"leave_static_{font_name}_{int(bool(include_financials))}"
+    defined = getattr(c, "_hr_forms", None)
+    if defined is None: defined = c._hr_forms = set()
+    if form not in defined:
+        c.beginForm(form); _play(c, ops); c.endForm()
+        defined.add(form)
+    c.doForm(form)
+
+    def draw_rtl(text, x, y): c.drawRightString(x, y, reshape_text(text))
+
+    c.setFont(font_name, 11)
+    values = [
+        (r.get('emp_name'), r.get('emp_id')),
+        (r.get('dept'), r.get('job_title') or '-'),
+        (r.get('sub_type') or '-', f"{r.get('days') or 0} يوم"),
+        (r.get('start_date') or '', r.get('end_date') or ''),
+        (r.get('substitute_name') or 'لا يوجد', _date(r.get('submission_date'))),
+    ]
+    for y, (right, left) in zip(pos["info"], values):
+        draw_rtl(right, width-8.5*cm, y); draw_rtl(left, width-15*cm, y)
+
+    x_emp, x_mgr, x_hr = width-4*cm, width/2, 4*cm
+    y = pos["sig_names"]
+    draw_rtl(r.get('emp_name'), x_emp, y); draw_rtl(r.get('manager_name') or '-', x_mgr, y); draw_rtl(r.get('hr_name') or '-', x_hr, y)
+    y = pos["sig_dates"]
+    draw_rtl(_date(r.get('submission_date')), x_emp, y); draw_rtl(_date(r.get('manager_action_at')), x_mgr, y); draw_rtl(_date(r.get('hr_action_at')), x_hr, y)
+
+    if include_financials:
+        fin = [f"{salary} ريال", f"{annual_days} يوم", f"{r.get('days') or 0} يوم", str(last_calc_date), f"{allowance} ريال"]
+        for y, value in zip(pos["fin"], fin): draw_rtl(value, width-9*cm, y)
+
+def generate_pdf(r: dict, salary=0.0, annual_days=0, last_calc_date="-", allowance=0.0, include_financials=False):
+    buffer = BytesIO()
+    c = pdf_canvas.Canvas(buffer, pagesize=A4)
+    draw_leave_form(c, r, salary, annual_days, last_calc_date, allowance, include_financials)
+    c.save(); buffer.seek(0); return buffer
@@ -0,0 +1,114 @@
+# src/utils/pdf_cache.py
+# Content-addressed cache for generated PDFs: in-memory LRU tier backed by a size-capped disk tier
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+PDF_CACHE_DIR = os.environ.get("HR_PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "hr_pdf_cache"))
+PDF_CACHE_MEMORY_ITEMS = 64
+PDF_CACHE_DISK_BYTES = 200 * 1024 * 1024
+
+def content_key(row: dict, fields, **params) -> str:
+    """مفتاح المحتوى: الحقول المعروضة في النموذج + updated_at + خيارات التوليد."""
+    payload = {
+        "fields": {f: row.get(f) for f in fields},
+        "updated_at": row.get("updated_at"),
+        "params": params,
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+class PdfCache:
+    """مستويان: ذاكرة (LRU) ثم قرص بحد أقصى للحجم. لكل طلب نسخة واحدة فقط؛
+    عند تغيّر حقول الاعتماد يتغير المفتاح وتُحذف النسخة القديمة تلقائياً."""
+
+    def __init__(self, directory=PDF_CACHE_DIR, max_memory_items=PDF_CACHE_MEMORY_ITEMS, max_disk_bytes=PDF_CACHE_DISK_BYTES):
+        self.directory = directory
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()  # key -> bytes
+        self._by_request = {}         # request id -> key
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, req_id, key):
+        return os.path.join(self.directory, f"{req_id}_{key}.pdf")
+
+    def get_or_render(self, row: dict, render, fields, **params) -> bytes:
+        req_id = row.get("id")
+        key = content_key(row, fields, **params)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key); self.hits += 1
+                return data
+        path = self._path(req_id, key)
+        try:
+            with open(path, "rb") as f: data = f.read()
+            os.utime(path)
+            with self._lock: self.disk_hits += 1
+        except OSError:
+            data = render()
+            self._write_disk(req_id, key, data)
+            with self._lock: self.misses += 1
+        self._remember(req_id, key, data)
+        return data
+
+    def _remember(self, req_id, key, data):
+        with self._lock:
+            old = self._by_request.get(req_id)
+            if old and old != key: self._memory.pop(old, None)
+            self._by_request[req_id] = key
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def _write_disk(self, req_id, key, data):
+        prefix = f"{req_id}_"
+        for entry in os.scandir(self.directory):
+            # نسخ قديمة لنفس الطلب (تغيّرت حقول الاعتماد)
+            if entry.name.startswith(prefix) and entry.name != f"{prefix}{key}.pdf":
+                try: os.remove(entry.path)
+                except OSError: pass
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f: f.write(data)
+        os.replace(tmp, self._path(req_id, key))
+        self._enforce_disk_cap(keep=self._path(req_id, key))
+
+    def _enforce_disk_cap(self, keep=None):
+        files = [(e.stat().st_mtime_ns, e.stat().st_size, e.path) for e in os.scandir(self.directory) if e.name.endswith(".pdf")]
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes: break
+            if path == keep: continue
+            try: os.remove(path); total -= size
+            except OSError: pass
+
+    def invalidate(self, req_id):
+        with self._lock:
+            key = self._by_request.pop(req_id, None)
+            if key: self._memory.pop(key, None)
+        prefix = f"{req_id}_"
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(prefix):
+                try: os.remove(entry.path)
+                except OSError: pass
+
+    def stats(self):
+        with self._lock:
+            return {"memory_items": len(self._memory), "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses}
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_pdf_cache():
+    global _shared
+    with _shared_lock:
+        if _shared is None: _shared = PdfCache()
+    return _shared
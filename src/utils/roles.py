@@ -0,0 +1,6 @@
+# src/utils/roles.py
+# The role values stored in employees.role (see ROLE_MAP in src/jobs/import_workbook.py) and the groups pages gate on
+
+HR_ROLES = ("HR",)
+MANAGER_ROLES = ("Manager", "Supervisor")  # يعتمدان طلبات القسم
+ADMIN_ROLES = ("SysAdmin",)                # مدير النظام: التشخيص فقط، لا يعتمد طلبات
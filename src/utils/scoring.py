@@ -0,0 +1,140 @@
+# src/utils/scoring.py
+# Request risk/priority scoring: feature extraction, pluggable local models (rules or an offline logistic classifier)
+# and the content hash that lets src/jobs/score_requests.py skip requests whose inputs did not change
+#
+# النموذج يُختار بـ HR_SCORING_MODEL: "rules" (الافتراضي) أو مسار ملف JSON لمصنّف logistic مدرَّب خارجياً:
+#   {"name": "logit-2025", "version": "3", "bias": -2.1, "weights": {"own_overlaps": 1.8, "coverage_gap": 2.5, ...}}
+# تغيير النموذج أو نسخته يغير الـ hash فيُعاد تقييم كل الطلبات المعلقة.
+
+import hashlib
+import json
+import math
+import os
+from datetime import date
+
+LEAVE_SERVICE = "إجازة"
+LOAN_SERVICE = "سلفة"
+MIN_COVERAGE = 0.5
+LEVELS = ((70, "high", "🔴", "مخاطر عالية"), (40, "medium", "🟡", "مخاطر متوسطة"), (0, "low", "🟢", "مخاطر منخفضة"))
+
+FEATURE_LABELS = {
+    "own_overlaps": "تداخل مع إجازة أخرى للموظف",
+    "balance_short": "عجز في الرصيد",
+    "coverage_gap": "نقص تغطية القسم",
+    "short_notice": "إشعار قصير",
+    "backdated": "بتاريخ سابق",
+    "late_ratio_90": "نسبة التأخر (90 يوماً)",
+    "incomplete_90": "بصمات ناقصة (90 يوماً)",
+    "rejected_365": "طلبات مرفوضة خلال سنة",
+    "salary_ratio": "السلفة إلى الراتب",
+    "new_hire": "خدمة أقل من 6 أشهر",
+}
+
+def _date(v):
+    return date.fromisoformat(str(v)[:10]) if v else None
+
+def _num(v):
+    return float(v) if v not in (None, "") else None
+
+def features(row: dict) -> dict:
+    """صف score_candidates -> خصائص مستقرة (أرقام مقربة) تدخل في الـ hash وفي النموذج."""
+    leave = row.get("service_type") == LEAVE_SERVICE
+    days, balance, salary, amount = _num(row.get("days")) or 0.0, _num(row.get("balance")), _num(row.get("salary")), _num(row.get("amount"))
+    submitted, start, hired = _date(row.get("submitted_on")), _date(row.get("start_date")), _date(row.get("hire_date"))
+    headcount, on_leave = int(row.get("dept_headcount") or 0), int(row.get("dept_on_leave") or 0)
+    worked = int(row.get("worked_days_90") or 0)
+    annual = leave and "سنوي" in (row.get("sub_type") or "")
+    notice = (start - submitted).days if leave and start and submitted else None
+    present = (headcount - on_leave - 1) / headcount if leave and headcount else None
+    f = {
+        "service_type": row.get("service_type"),
+        "sub_type": row.get("sub_type"),
+        "days": days,
+        "own_overlaps": int(row.get("own_overlaps") or 0) if leave else 0,
+        "balance_short": max(days - balance, 0.0) if annual and balance is not None else 0.0,
+        "coverage_gap": max(MIN_COVERAGE - present, 0.0) if present is not None else 0.0,
+        "short_notice": 1 if notice is not None and 0 <= notice < 3 else 0,
+        "backdated": 1 if notice is not None and notice < 0 else 0,
+        "late_ratio_90": int(row.get("late_days_90") or 0) / worked if worked else 0.0,
+        "incomplete_90": int(row.get("incomplete_days_90") or 0),
+        "rejected_365": int(row.get("rejected_365") or 0),
+        "salary_ratio": amount / salary if row.get("service_type") == LOAN_SERVICE and amount and salary else 0.0,
+        "new_hire": 1 if hired and submitted and (submitted - hired).days < 183 else 0,
+        "notice_days": notice,
+    }
+    return {k: round(v, 3) if isinstance(v, float) else v for k, v in f.items()}
+
+def input_hash(feats: dict, model) -> str:
+    payload = json.dumps({"model": model.key, "features": feats}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def level(score):
+    return next(l for l in LEVELS if (score or 0) >= l[0])
+
+def score_badge(score) -> str:
+    """للعرض في صندوق المهام: 🟢/🟡/🔴 مع الدرجة."""
+    return "" if score is None else f"{level(float(score))[2]} {float(score):.0f}"
+
+def _summary(score, reasons, feats) -> str:
+    text = level(score)[3]
+    if feats.get("notice_days") is not None: text += f" | يبدأ بعد {feats['notice_days']} يوم"
+    return text + (": " + "، ".join(reasons[:3]) if reasons else "")
+
+# ------------------------------
+# النماذج
+# ------------------------------
+class RuleModel:
+    """قواعد ثابتة: نقاط لكل مؤشر، المجموع محصور في 0..100."""
+    name, version = "rules", "1"
+    RULES = (
+        ("own_overlaps", lambda f: 40 if f["own_overlaps"] else 0),
+        ("balance_short", lambda f: 30 if f["balance_short"] > 0 else 0),
+        ("coverage_gap", lambda f: 20 if f["coverage_gap"] > 0 else 0),
+        ("backdated", lambda f: 15 if f["backdated"] else 0),
+        ("short_notice", lambda f: 10 if f["short_notice"] else 0),
+        ("salary_ratio", lambda f: 25 if f["salary_ratio"] > 1 else 10 if f["salary_ratio"] > 0.5 else 0),
+        ("late_ratio_90", lambda f: 10 if f["late_ratio_90"] > 0.3 else 0),
+        ("incomplete_90", lambda f: 5 if f["incomplete_90"] >= 5 else 0),
+        ("rejected_365", lambda f: 10 if f["rejected_365"] >= 2 else 0),
+        ("new_hire", lambda f: 10 if f["new_hire"] else 0),
+    )
+
+    @property
+    def key(self):
+        return f"{self.name}:{self.version}"
+
+    def score(self, feats: dict):
+        """يعيد (الدرجة، الملخص، التفاصيل)."""
+        points = [(name, fn(feats)) for name, fn in self.RULES]
+        points = sorted([p for p in points if p[1]], key=lambda p: -p[1])
+        score = min(sum(p for _, p in points), 100)
+        reasons = [FEATURE_LABELS[n] for n, _ in points]
+        return score, _summary(score, reasons, feats), {"level": level(score)[1], "points": dict(points)}
+
+class LogisticModel:
+    """مصنّف logistic صغير بأوزان من ملف JSON (يُدرَّب خارج التطبيق). الدرجة = 100 * sigmoid(bias + Σ w·x)."""
+
+    def __init__(self, weights: dict, bias=0.0, name="logistic", version="1"):
+        self.weights, self.bias, self.name, self.version = weights, float(bias), name, str(version)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f: spec = json.load(f)
+        return cls(spec["weights"], spec.get("bias", 0.0), spec.get("name", "logistic"), spec.get("version", "1"))
+
+    @property
+    def key(self):
+        return f"{self.name}:{self.version}"
+
+    def score(self, feats: dict):
+        contrib = {k: w * float(feats.get(k) or 0) for k, w in self.weights.items()}
+        z = self.bias + sum(contrib.values())
+        score = round(100 / (1 + math.exp(-max(min(z, 50), -50))), 1)
+        top = sorted([(k, c) for k, c in contrib.items() if c > 0], key=lambda kc: -kc[1])
+        reasons = [FEATURE_LABELS.get(k, k) for k, _ in top]
+        return score, _summary(score, reasons, feats), {"level": level(score)[1], "contributions": {k: round(c, 3) for k, c in top}}
+
+def get_model(spec=None):
+    spec = spec or os.environ.get("HR_SCORING_MODEL", "rules")
+    if spec == "rules": return RuleModel()
+    return LogisticModel.load(spec)
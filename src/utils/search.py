@@ -0,0 +1,36 @@
+# src/utils/search.py
+# Arabic-aware request search: one search_requests RPC call per page (ranked, filtered), plus the Python
+# mirror of the SQL normalizer (ar_normalize / ar_search_text in db/init_supabase.sql) used for highlighting.
+
+import re
+
+SEARCH_PAGE_SIZE = 20
+
+_DIACRITICS = re.compile("[\u064B-\u065F\u0670\u0640]")
+_LETTERS = str.maketrans("أإآٱىةؤئ٠١٢٣٤٥٦٧٨٩", "اااايهوي0123456789")
+_PREFIX = re.compile(r"(^|\s)(وال|بال|كال|فال|لل|ال)(\S{2,})")
+
+def ar_normalize(text) -> str:
+    """نفس ar_normalize في القاعدة: حذف التشكيل والتطويل، توحيد الألف والهمزة، ة->ه، ى->ي، الأرقام الهندية."""
+    return _DIACRITICS.sub("", text or "").translate(_LETTERS).lower()
+
+def ar_search_text(text) -> str:
+    """ar_normalize + حذف أداة التعريف والحروف الملتصقة بها (ال، وال، بال، كال، فال، لل)."""
+    return _PREFIX.sub(r"\1\3", ar_normalize(text))
+
+def search_requests(supabase, query, dept=None, status=None, date_from=None, date_to=None, page=0, page_size=SEARCH_PAGE_SIZE):
+    """يعيد (صفوف الصفحة مرتبة بالصلة، العدد الكلي)."""
+    if not supabase or not ar_search_text(query).strip(): return [], 0
+    res = supabase.rpc("search_requests", {
+        "p_query": query, "p_dept": dept or None, "p_status": status or None,
+        "p_from": str(date_from) if date_from else None, "p_to": str(date_to) if date_to else None,
+        "p_limit": page_size, "p_offset": page * page_size}).execute().data or {}
+    return res.get("rows", []), res.get("total", 0)
+
+def highlight(text, query) -> str:
+    """يُبرز (markdown) كلمات النص التي تبدأ بإحدى كلمات البحث بعد التطبيع."""
+    terms = ar_search_text(query).split()
+    if not text or not terms: return text or ""
+    def mark(word):
+        return f"**{word}**" if any(ar_search_text(word).startswith(t) for t in terms) else word
+    return " ".join(mark(w) for w in str(text).split())
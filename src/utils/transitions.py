@@ -0,0 +1,21 @@
+# src/utils/transitions.py
+# Approval transitions for requests (bulk approve/reject in one transaction via RPC bulk_transition_requests)
+
+TASK_FIELDS = {"Substitute": "status_substitute", "Manager": "status_manager", "HR": "status_hr"}
+
+def field_for_task(task_type):
+    return TASK_FIELDS.get(task_type, "status_hr")
+
+def bulk_transition(supabase, tasks, status, note, actor):
+    """اعتماد/رفض مجموعة مهام دفعة واحدة. يعيد (المحدّثة، المتجاوزة).
+    المتجاوزة: طلبات غيّرها معتمد آخر بعد تحميل الصفحة (updated_at لم يعد مطابقاً)."""
+    items = [{"id": t["id"], "field": field_for_task(t.get("task_type")), "updated_at": t.get("updated_at")} for t in tasks]
+    if not supabase or not items: return [], []
+    res = supabase.rpc("bulk_transition_requests", {
+        "p_items": items,
+        "p_status": status,
+        "p_note": note,
+        "p_actor_emp_id": actor.get("emp_id"),
+        "p_actor_name": actor.get("name"),
+    }).execute().data or {}
+    return res.get("updated") or [], res.get("skipped") or []
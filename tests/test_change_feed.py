@@ -0,0 +1,134 @@
+# tests/test_change_feed.py
+# Change feed driven by the SQLite stand-in: bus events keep PendingCounters equal to a fresh count, and PgListener
+# survives a dropped connection (fake connection, no Postgres needed)
+#
+#   python -m pytest -q tests
+
+import threading
+import time
+
+from bench.standin import StandIn
+from src.utils.change_feed import ChangeBus, PendingCounters, PgListener
+
+HR = {"emp_id": "h1", "role": "HR", "dept": "الموارد البشرية"}
+MANAGER = {"emp_id": "m1", "role": "Manager", "dept": "المبيعات"}
+SUBSTITUTE = {"emp_id": "s1", "role": "Employee", "dept": "المبيعات"}
+USERS = (HR, MANAGER, SUBSTITUTE)
+
+def _feed():
+    db = StandIn()
+    counters = PendingCounters(db)
+    bus = ChangeBus()
+    bus.subscribe(counters.apply)
+    return db, bus, counters
+
+def _truth(db, user):
+    return PendingCounters(db).count(user)[0]
+
+def _write(db, bus, op, row_id=None, values=None):
+    """يكتب في القاعدة ثم ينشر الحدث كما يفعل trigger notify_request_change."""
+    t = db.table("requests")
+    old = t.select("*").eq("id", row_id).execute().data[0] if row_id else None
+    if op == "insert": new = t.insert(values).execute().data[0]
+    elif op == "update": new = t.update(values).eq("id", row_id).execute().data[0]
+    else: t.delete().eq("id", row_id).execute(); new = None
+    bus.publish({"op": op, "id": (new or old)["id"], "old": old, "new": new})
+    return (new or old)["id"]
+
+def _assert_counts(db, counters, expected):
+    for user, n in zip(USERS, expected):
+        assert counters.count(user)[0] == n == _truth(db, user), user["role"]
+
+def test_events_move_tasks_between_inboxes():
+    db, bus, counters = _feed()
+    _assert_counts(db, counters, (0, 0, 0))
+    seeds = counters.seeds
+
+    rid = _write(db, bus, "insert", values={
+        "emp_id": "e1", "emp_name": "موظف", "dept": "المبيعات", "service_type": "إجازة", "substitute_id": "s1",
+        "status_substitute": "Pending", "status_manager": "Pending", "status_hr": "Pending", "final_status": "Pending"})
+    _assert_counts(db, counters, (0, 0, 1))
+    version = counters.count(MANAGER)[1]
+
+    _write(db, bus, "update", rid, {"status_substitute": "Approved"})
+    _assert_counts(db, counters, (0, 1, 0))
+    assert counters.count(MANAGER)[1] != version
+
+    _write(db, bus, "update", rid, {"status_manager": "Approved"})
+    _assert_counts(db, counters, (1, 0, 0))
+
+    # تعديل لا يغير صناديق المهام لا يغير النسخة
+    version = counters.count(HR)[1]
+    _write(db, bus, "update", rid, {"details": "تعديل"})
+    assert counters.count(HR)[1] == version
+
+    _write(db, bus, "delete", rid)
+    _assert_counts(db, counters, (0, 0, 0))
+    # الأحداث وحدها حدّثت العدادات: لا استعلام count بعد الملء الأول
+    assert counters.seeds == seeds
+
+def test_refresh_reseeds_from_the_database():
+    db, bus, counters = _feed()
+    _assert_counts(db, counters, (0, 0, 0))
+    # كتابة لم يصل حدثها (عملية أخرى بلا LISTEN)
+    db.table("requests").insert({"emp_id": "e2", "dept": "المبيعات", "service_type": "سلفة", "status_substitute": "Not Required",
+                                 "status_manager": "Pending", "status_hr": "Pending", "final_status": "Pending"}).execute()
+    assert counters.count(MANAGER)[0] == 0
+    version = counters.count(MANAGER)[1]
+    bus.publish({"op": "refresh"})
+    assert counters.count(MANAGER)[1] != version
+    _assert_counts(db, counters, (0, 1, 0))
+
+# ------------------------------
+# PgListener مع اتصال بديل
+# ------------------------------
+class _Notify:
+    def __init__(self, payload): self.payload = payload
+
+class _FakeConn:
+    """يعيد إشعاراته ثم إما ينقطع (drop) أو ينتظر الإيقاف."""
+    def __init__(self, payloads, drop):
+        self.payloads, self.drop, self.listening = list(payloads), drop, False
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+    def execute(self, sql):
+        assert sql == "LISTEN requests_changes"
+        self.listening = True
+
+    def notifies(self, timeout=None):
+        assert self.listening
+        if self.payloads: yield _Notify(self.payloads.pop(0)); return
+        if self.drop: raise OSError("server closed the connection")
+        time.sleep(0.01)
+
+def _wait(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+def test_listener_reconnects_and_refreshes():
+    conns = [_FakeConn(['{"op": "insert", "id": 1, "old": null, "new": null}'], drop=True),
+             _FakeConn(['{"op": "delete", "id": 1, "old": null, "new": null}'], drop=False)]
+    attempts = []
+    def connect(url):
+        attempts.append(url)
+        if len(attempts) == 2: raise OSError("connection refused")  # أول محاولة إعادة اتصال تفشل
+        return conns.pop(0)
+
+    bus, events, lock = ChangeBus(), [], threading.Lock()
+    def record(e):
+        with lock: events.append(e["op"])
+    bus.subscribe(record)
+    listener = PgListener("postgresql://fake", bus, connect=connect, reconnect_delay=0.01).start()
+    try:
+        _wait(lambda: len(events) >= 4)
+        assert listener.connected
+    finally:
+        listener.stop()
+    _wait(lambda: not listener._thread.is_alive())
+    # refresh عند كل اتصال لأن ما فات أثناء الانقطاع غير معروف
+    assert events == ["refresh", "insert", "refresh", "delete"]
+    assert len(attempts) == 3 and not listener.connected
@@ -0,0 +1,40 @@
+# tests/test_db_metrics.py
+# InstrumentedClient over a real postgrest builder (httpx.MockTransport, no server): every execute() is recorded,
+# including chains that pass through builder properties such as .not_
+#
+#   python -m pytest -q tests
+
+import json
+
+import httpx
+from postgrest import SyncPostgrestClient
+
+from src.utils.db import InstrumentedClient
+from src.utils.history import fetch_hr_history_page
+from src.utils.metrics import QueryMetrics
+
+def _client(seen):
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(200, json=[{"id": 1, "hr_action_at": "2026-01-01T00:00:00"}])
+    session = httpx.Client(base_url="http://postgrest.test", transport=httpx.MockTransport(handler))
+    metrics = QueryMetrics()
+    return InstrumentedClient(SyncPostgrestClient("http://postgrest.test", http_client=session), metrics), metrics
+
+def test_not_chain_is_measured():
+    seen = []
+    client, metrics = _client(seen)
+    rows, cursor = fetch_hr_history_page(client)
+    assert rows == [{"id": 1, "hr_action_at": "2026-01-01T00:00:00"}] and cursor is None
+    assert "hr_action_at=not.is.null" in str(seen[0].url)
+    stats = metrics.snapshot()["queries"]
+    assert list(stats) == ["requests.select"]
+    assert stats["requests.select"]["calls"] == 1 and stats["requests.select"]["rows"] == 1
+
+def test_plain_chain_and_rpc_are_measured():
+    seen = []
+    client, metrics = _client(seen)
+    client.table("requests").select("id").eq("emp_id", "e1").execute()
+    client.rpc("pending_counts", {"p_emp_id": "e1"}).execute()
+    assert json.loads(seen[1].content) == {"p_emp_id": "e1"}
+    assert {k: v["calls"] for k, v in metrics.snapshot()["queries"].items()} == {"requests.select": 1, "rpc:pending_counts": 1}
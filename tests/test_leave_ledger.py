@@ -0,0 +1,45 @@
+# tests/test_leave_ledger.py
+# One deduction per leave request on the stand-in: accrual-run consumption and HR settlement, in either order
+#
+#   python -m pytest -q tests
+
+import pytest
+
+from bench.standin import StandIn
+from src.utils.leave_ledger import post_leave_entry, post_leave_entries, fetch_balance, LeaveAlreadyPosted
+
+def _db():
+    db = StandIn()
+    db.table("employees").insert([
+        {"emp_id": str(i), "name": f"e{i}", "role": "Employee", "hire_date": "2018-01-01",
+         "leave_balances": {"annual_balance": 20, "last_settlement_date": "2025-01-01"}} for i in (1, 2)]).execute()
+    db.table("requests").insert([
+        {"emp_id": str(i), "service_type": "إجازة", "sub_type": "سنوية", "start_date": "2025-03-10", "days": 5,
+         "final_status": "Approved"} for i in (1, 2)]).execute()
+    return db
+
+def _deductions(db, request_id):
+    return db.table("leave_ledger").select("entry_type").eq("request_id", request_id).lt("days", 0).execute().data
+
+def test_settlement_after_consumption_is_rejected():
+    db = _db()
+    res = post_leave_entries(db, [{"emp_id": "1", "entry_type": "consumption", "days": -5, "settlement_date": "2025-03-31",
+                                   "request_id": 1, "note": None}])
+    assert res == {"posted": 1, "skipped": []}
+    with pytest.raises(LeaveAlreadyPosted):
+        post_leave_entry(db, "1", "settlement", -5, "2025-03-01", 1)
+    assert [r["entry_type"] for r in _deductions(db, 1)] == ["consumption"]
+    assert float(fetch_balance(db, "1")["annual_balance"]) == 15
+
+def test_consumption_after_settlement_is_dropped_and_not_counted():
+    db = _db()
+    post_leave_entry(db, "2", "settlement", -5, "2025-03-01", 2)
+    res = post_leave_entries(db, [
+        {"emp_id": "2", "entry_type": "consumption", "days": -5, "settlement_date": "2025-03-31", "request_id": 2, "note": None},
+        {"emp_id": "1", "entry_type": "accrual", "days": 2, "settlement_date": "2025-03-31", "request_id": None, "note": None}])
+    # الموظف 2 لم يُكتب له شيء فلا يُحسب ضمن المرحَّلين
+    assert res == {"posted": 1, "skipped": [{"emp_id": "2", "reason": "already_deducted", "request_id": 2}]}
+    assert [r["entry_type"] for r in _deductions(db, 2)] == ["settlement"]
+    assert float(fetch_balance(db, "2")["annual_balance"]) == 15
+    # التسوية لا تحرك مرساة الاستحقاق
+    assert fetch_balance(db, "2")["last_settlement_date"] == "2025-01-01"